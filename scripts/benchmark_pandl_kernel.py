@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Benchmark the array P&L kernel against the pandas implementation of
+calculate_pandl on a 10 year history of 5 minute bars.
+
+Run from the project root, with PYTHONPATH set by export_python_path.sh:
+    $ source ./scripts/export_python_path.sh
+    $ python scripts/benchmark_pandl_kernel.py
+"""
+
+import timeit
+import numpy as np
+import pandas as pd
+from src.accounts.profit_and_loss import calculate_pandl, calculate_pandl_with_pandas
+
+YEARS = 10
+BAR_MINUTES = 5
+REPEATS = 5
+
+
+def intraday_index(years: int, bar_minutes: int) -> pd.DatetimeIndex:
+    ## regular trading hours bars, 09:30 to 16:00, every business day
+    days = pd.bdate_range("2015-01-01", periods=int(years * 252))
+    bar_offsets = pd.timedelta_range("9h30min", "15h55min", freq="%dmin" % bar_minutes)
+    timestamps = days.values[:, np.newaxis] + bar_offsets.values[np.newaxis, :]
+
+    return pd.DatetimeIndex(timestamps.ravel())
+
+
+def main():
+    rng = np.random.default_rng(42)
+    index = intraday_index(YEARS, BAR_MINUTES)
+    prices = pd.Series(100 + np.cumsum(rng.normal(0, 0.1, len(index))), index=index)
+    ## positions only change every few bars, as with a slower trading rule
+    positions = pd.Series(rng.normal(0, 10, len(index)), index=index).iloc[::3]
+
+    expected = calculate_pandl_with_pandas(positions=positions, prices=prices)
+    result = calculate_pandl(positions=positions, prices=prices)
+    np.testing.assert_allclose(result.values, expected.values)
+
+    print("%d price bars, %d positions" % (len(prices), len(positions)))
+    for name, function in [
+        ("pandas", calculate_pandl_with_pandas),
+        ("kernel", calculate_pandl),
+    ]:
+        seconds = min(
+            timeit.repeat(
+                lambda: function(positions=positions, prices=prices),
+                number=1,
+                repeat=REPEATS,
+            )
+        )
+        print("%-8s %8.1f ms" % (name, seconds * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Bootstrap confidence intervals for account curve statistics.
+
+Resamples are drawn as a matrix of row indices (periods x resamples), the
+returns gathered through it in one fancy indexing step, and the statistics
+found for every resample at once by calculate_curve_statistics, which works
+column by column. Resamples are split into batches, each with its own seed
+spawned from the caller's seed, so results are the same whether the batches
+run in this process or across a process pool.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import pandas as pd
+from src.accounts.curve_stats import calculate_curve_statistics
+
+BOOTSTRAP_STATISTICS = ["sharpe", "sortino", "skew", "worst_drawdown", "avg_drawdown"]
+DEFAULT_RESAMPLES_PER_BATCH = 500
+
+
+@dataclass(frozen=True)
+class BootstrapDistribution:
+    """
+    Resampled values of each statistic in BOOTSTRAP_STATISTICS, an array of
+    (resamples,) for one curve or (resamples x curve) for several, alongside
+    the values for the original returns
+    """
+
+    resampled: dict
+    estimate: dict
+    block_length: int
+
+    @property
+    def n_resamples(self) -> int:
+        return len(self.resampled[BOOTSTRAP_STATISTICS[0]])
+
+    def confidence_interval(self, statistic: str, level: float = 0.95) -> tuple:
+        """
+        Percentile interval; nans (eg a resample with no losses for sortino)
+        are ignored
+        """
+        tail = 100.0 * (1.0 - level) / 2.0
+        lower, upper = np.nanpercentile(
+            self.resampled[statistic], [tail, 100.0 - tail], axis=0
+        )
+
+        return lower, upper
+
+    def standard_error(self, statistic: str):
+        return np.nanstd(self.resampled[statistic], axis=0, ddof=1)
+
+    def as_frame(self, level: float = 0.95) -> pd.DataFrame:
+        """
+        One row per statistic, for a single curve
+        """
+        rows = {}
+        for statistic in BOOTSTRAP_STATISTICS:
+            lower, upper = self.confidence_interval(statistic, level=level)
+            rows[statistic] = dict(
+                estimate=self.estimate[statistic],
+                lower=lower,
+                upper=upper,
+                standard_error=self.standard_error(statistic),
+            )
+
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def bootstrap_curve_statistics(
+    values: np.ndarray,
+    times_per_year: float,
+    n_resamples: int = 10000,
+    block_length: int = 1,
+    seed: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    resamples_per_batch: int = DEFAULT_RESAMPLES_PER_BATCH,
+) -> BootstrapDistribution:
+    """
+    Bootstrap the statistics of period returns, 1-D for one curve or 2-D
+    (time x curve) for several; curves are resampled on the same periods, so
+    correlation between them is kept.
+
+    :param block_length: 1 for the iid bootstrap, longer for a circular block
+        bootstrap which keeps autocorrelation up to roughly that many periods
+    :param max_workers: run batches across a process pool of this size; None
+        (or 1) runs them here
+    :param resamples_per_batch: bounds memory; resamples are reproducible for
+        a given seed and batch size
+
+    >>> values = np.random.default_rng(0).normal(0.1, 1.0, 500)
+    >>> first = bootstrap_curve_statistics(values, 256.0, n_resamples=200, seed=1)
+    >>> second = bootstrap_curve_statistics(values, 256.0, n_resamples=200, seed=1)
+    >>> bool(np.array_equal(first.resampled["sharpe"], second.resampled["sharpe"]))
+    True
+    """
+    values = np.asarray(values, dtype=float)
+    if block_length < 1:
+        raise Exception("Block length must be at least 1, got %d" % block_length)
+
+    batch_sizes = _batch_sizes(n_resamples, resamples_per_batch)
+    batch_seeds = np.random.SeedSequence(seed).spawn(len(batch_sizes))
+    batch_arguments = [
+        (values, times_per_year, batch_size, block_length, batch_seed)
+        for batch_size, batch_seed in zip(batch_sizes, batch_seeds)
+    ]
+
+    if max_workers is None or max_workers <= 1:
+        batch_results = [_bootstrap_batch(*arguments) for arguments in batch_arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            batch_results = list(executor.map(_bootstrap_batch, *zip(*batch_arguments)))
+
+    resampled = {
+        statistic: np.concatenate([batch[statistic] for batch in batch_results])
+        for statistic in BOOTSTRAP_STATISTICS
+    }
+    estimate = batch_statistics(
+        values.reshape(values.shape[0], -1), times_per_year=times_per_year
+    )
+    if values.ndim == 1:
+        estimate = {name: float(value[0]) for name, value in estimate.items()}
+
+    return BootstrapDistribution(
+        resampled=resampled, estimate=estimate, block_length=block_length
+    )
+
+
+def resample_indices(
+    length: int, n_resamples: int, block_length: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Row indices of each resample, as a (length x resamples) matrix. Blocks
+    wrap around the end of the data, so every period is equally likely.
+
+    >>> indices = resample_indices(5, 2, 3, np.random.default_rng(0))
+    >>> indices.shape
+    (5, 2)
+    >>> bool(((np.diff(indices[:3], axis=0) % 5) == 1).all())
+    True
+    """
+    if block_length == 1:
+        return rng.integers(0, length, size=(length, n_resamples))
+
+    n_blocks = -(-length // block_length)
+    block_starts = rng.integers(0, length, size=(n_blocks, 1, n_resamples))
+    offsets = np.arange(block_length)[np.newaxis, :, np.newaxis]
+    indices = (block_starts + offsets) % length
+
+    return indices.reshape(n_blocks * block_length, n_resamples)[:length]
+
+
+def batch_statistics(returns: np.ndarray, times_per_year: float) -> dict:
+    """
+    Each statistic in BOOTSTRAP_STATISTICS for every column of a 2-D array of
+    returns, from calculate_curve_statistics
+    """
+    curve_statistics = calculate_curve_statistics(
+        returns, times_per_year=times_per_year
+    )
+
+    return {
+        statistic: getattr(curve_statistics, statistic)
+        for statistic in BOOTSTRAP_STATISTICS
+    }
+
+
+def _bootstrap_batch(
+    values: np.ndarray,
+    times_per_year: float,
+    n_resamples: int,
+    block_length: int,
+    seed: np.random.SeedSequence,
+) -> dict:
+    rng = np.random.default_rng(seed)
+    indices = resample_indices(len(values), n_resamples, block_length, rng)
+    ## (periods x resamples), or (periods x resamples x curve) for 2-D values
+    resampled = values[indices]
+    statistics = batch_statistics(
+        resampled.reshape(len(values), -1), times_per_year=times_per_year
+    )
+
+    return {
+        name: statistic.reshape(resampled.shape[1:])
+        for name, statistic in statistics.items()
+    }
+
+
+def _batch_sizes(n_resamples: int, resamples_per_batch: int) -> list:
+    n_batches = max(-(-n_resamples // resamples_per_batch), 1)
+    sizes = [n_resamples // n_batches] * n_batches
+    for batch in range(n_resamples % n_batches):
+        sizes[batch] += 1
+
+    return sizes
@@ -0,0 +1,340 @@
+"""
+Chunked profit and loss for long histories of short bars.
+
+A year of one second bars is too big to hold as several full length series,
+so here the history is read as time ordered (price, positions) chunks. The
+last position and price are carried across each chunk boundary, and the
+resampled P&L is emitted as soon as each period is complete, so peak memory
+depends on the chunk size rather than the length of the history.
+"""
+
+from typing import Iterable, Iterator, Tuple, Union
+import numpy as np
+import pandas as pd
+from src.accounts.pandl_kernel import (
+    sorted_timestamps_and_values,
+    points_pandl_kernel,
+    ffill_align,
+    int64_as_index,
+)
+from src.accounts.profit_and_loss import (
+    trade_costs_in_points_kernel,
+    add_gross_and_costs_arrays,
+)
+from src.utils.references import (
+    Frequency,
+    DAILY_PRICE_FREQ,
+    from_config_frequency_pandas_resample,
+    arg_not_supplied,
+    curve_types,
+    NET_CURVE,
+    GROSS_CURVE,
+    COSTS_CURVE,
+)
+
+
+class SeriesChunks:
+    """
+    In memory price and position series, iterated as chunks of rows. Can be
+    iterated more than once, unlike a generator of chunks.
+    """
+
+    def __init__(self, price: pd.Series, positions: pd.Series, rows_per_chunk: int):
+        self._price = price.sort_index()
+        self._positions = positions.sort_index()
+        self._rows_per_chunk = rows_per_chunk
+
+    def __iter__(self) -> Iterator[Tuple[pd.Series, pd.Series]]:
+        ## chunks end at price timestamps, positions are cut at the same times
+        position_index = self._positions.index
+        position_start = 0
+        for price_start in range(0, len(self._price), self._rows_per_chunk):
+            price_chunk = self._price.iloc[
+                price_start : price_start + self._rows_per_chunk
+            ]
+            if price_start + self._rows_per_chunk >= len(self._price):
+                position_end = len(position_index)
+            else:
+                position_end = position_index.searchsorted(
+                    price_chunk.index[-1], side="right"
+                )
+            yield price_chunk, self._positions.iloc[position_start:position_end]
+            position_start = position_end
+
+
+class ChunkedProfitAndLoss:
+    """
+    Streaming version of ProfitAndLossWithTradeCosts.
+
+    Chunks are (price, positions) pairs in time order; a timestamp must not be
+    split across two chunks. fx and capital are either a number or a (short,
+    eg daily) series held in memory.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[Tuple[pd.Series, pd.Series]],
+        fx: Union[float, pd.Series] = arg_not_supplied,
+        capital: Union[float, pd.Series] = arg_not_supplied,
+        value_per_point: float = 1.0,
+        roundpositions: bool = False,
+        delayfill: bool = False,
+        commission_per_contract: float = 0.0,
+        percentage_fee: float = 0.0,
+        spread_in_points: float = 0.0,
+    ):
+        self._chunks = chunks
+        self._fx = fx
+        self._capital = capital
+        self._value_per_point = value_per_point
+        self._roundpositions = roundpositions
+        self._delayfill = delayfill
+        self._commission_per_contract = commission_per_contract
+        self._percentage_fee = percentage_fee
+        self._spread_in_points = spread_in_points
+
+    def as_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
+    ) -> pd.Series:
+        ## only the resampled series is ever held in full
+        resampled_pieces = list(
+            self.iter_pd_series_for_frequency(frequency=frequency, **kwargs)
+        )
+        if len(resampled_pieces) == 0:
+            return pd.Series(dtype=float)
+
+        return pd.concat(resampled_pieces)
+
+    def iter_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
+    ) -> Iterator[pd.Series]:
+        """
+        Resampled P&L for each chunk, yielded once its periods are complete.
+        The last period of a chunk is held back, as the next chunk may add to
+        it, and empty periods between chunks are filled with zeros.
+        """
+        resample_freq = from_config_frequency_pandas_resample(frequency)
+        incomplete_period = None
+        for pandl_chunk in self.iter_pd_series(**kwargs):
+            if len(pandl_chunk) == 0:
+                continue
+            resampled_chunk = pandl_chunk.resample(resample_freq).sum()
+            if incomplete_period is not None:
+                resampled_chunk = (
+                    pd.concat([incomplete_period, resampled_chunk])
+                    .resample(resample_freq)
+                    .sum()
+                )
+            yield resampled_chunk.iloc[:-1]
+            incomplete_period = resampled_chunk.iloc[-1:]
+
+        if incomplete_period is not None:
+            yield incomplete_period
+
+    def iter_pd_series(
+        self, percent: bool = False, curve_type: str = NET_CURVE
+    ) -> Iterator[pd.Series]:
+        """
+        P&L in base currency (or percent of capital) for each chunk, over the
+        union of the chunk's price and position timestamps
+        """
+        if curve_type not in curve_types:
+            raise Exception(
+                "Curve type %s not recognised! Must be one of %s"
+                % (curve_type, curve_types)
+            )
+
+        carried = _CarriedState()
+        for price_chunk, position_chunk in self._chunks:
+            timestamps, pandl = self._pandl_for_chunk(
+                price_chunk,
+                position_chunk,
+                carried=carried,
+                percent=percent,
+                curve_type=curve_type,
+            )
+            yield pd.Series(
+                pandl, index=int64_as_index(timestamps, like=price_chunk.index)
+            )
+
+    def _pandl_for_chunk(
+        self,
+        price_chunk: pd.Series,
+        position_chunk: pd.Series,
+        carried: "_CarriedState",
+        percent: bool,
+        curve_type: str,
+    ) -> tuple:
+        price_timestamps, price_values = sorted_timestamps_and_values(price_chunk)
+        position_timestamps, position_values = sorted_timestamps_and_values(
+            position_chunk
+        )
+        position_values = self._process_positions(position_values, carried=carried)
+
+        ## the carried row is the last timestamp of the previous chunk, with
+        ## the last valid position and price; it's dropped from the output
+        with_carried_position_timestamps = carried.prepend_timestamp(
+            position_timestamps
+        )
+        with_carried_positions = np.concatenate([[carried.position], position_values])
+        with_carried_price_timestamps = carried.prepend_timestamp(price_timestamps)
+        with_carried_prices = np.concatenate([[carried.price], price_values])
+
+        timestamps, gross_in_points = points_pandl_kernel(
+            with_carried_position_timestamps,
+            with_carried_positions,
+            with_carried_price_timestamps,
+            with_carried_prices,
+        )
+        if curve_type != GROSS_CURVE:
+            trade_costs_in_points = self._trade_costs_in_points(
+                with_carried_position_timestamps,
+                with_carried_positions,
+                price_timestamps=with_carried_price_timestamps,
+                prices=with_carried_prices,
+            )
+
+        carried.update(
+            timestamps=timestamps,
+            position_values=with_carried_positions,
+            price_values=with_carried_prices,
+        )
+
+        if curve_type == COSTS_CURVE:
+            ## costs are only on the position index, as for the full calculator
+            return position_timestamps, self._points_to_base_pandl(
+                position_timestamps, trade_costs_in_points[1:], percent
+            )
+
+        timestamps = timestamps[1:]
+        gross = self._points_to_base_pandl(timestamps, gross_in_points[1:], percent)
+        if curve_type == GROSS_CURVE:
+            return timestamps, gross
+
+        costs_in_points = np.full(len(timestamps), np.nan)
+        costs_in_points[
+            np.searchsorted(timestamps, position_timestamps)
+        ] = trade_costs_in_points[1:]
+        costs = self._points_to_base_pandl(timestamps, costs_in_points, percent)
+
+        return timestamps, add_gross_and_costs_arrays(gross, costs)
+
+    def _process_positions(
+        self, position_values: np.ndarray, carried: "_CarriedState"
+    ) -> np.ndarray:
+        ## as ProfitAndLoss._process_positions, with the shift across chunks
+        if self.delayfill:
+            passed_position_values = position_values
+            position_values = np.concatenate(
+                [[carried.passed_position], position_values[:-1]]
+            )
+            if len(passed_position_values):
+                carried.passed_position = passed_position_values[-1]
+
+        if self.roundpositions:
+            position_values = np.round(position_values)
+
+        return position_values
+
+    def _trade_costs_in_points(
+        self,
+        position_timestamps: np.ndarray,
+        positions: np.ndarray,
+        price_timestamps: np.ndarray,
+        prices: np.ndarray,
+    ) -> np.ndarray:
+        fill_price = ffill_align(
+            price_timestamps, prices, position_timestamps, skip_nan=True
+        )
+
+        return trade_costs_in_points_kernel(
+            positions,
+            fill_price=fill_price,
+            commission_per_contract_in_points=self._commission_per_contract
+            / self.value_per_point,
+            percentage_fee=self._percentage_fee,
+            half_spread_in_points=self._spread_in_points / 2.0,
+        )
+
+    def _points_to_base_pandl(
+        self, timestamps: np.ndarray, pandl_in_points: np.ndarray, percent: bool
+    ) -> np.ndarray:
+        pandl = (
+            pandl_in_points
+            * self.value_per_point
+            * _aligned_to_timestamps(self._fx, timestamps, default=1.0)
+        )
+        if percent:
+            pandl = (
+                100.0
+                * pandl
+                / _aligned_to_timestamps(self._capital, timestamps, default=1.0)
+            )
+
+        return pandl
+
+    @property
+    def value_per_point(self) -> float:
+        return self._value_per_point
+
+    @property
+    def delayfill(self) -> bool:
+        return self._delayfill
+
+    @property
+    def roundpositions(self) -> bool:
+        return self._roundpositions
+
+
+class _CarriedState:
+    ## what one chunk needs to know about the chunks before it
+    def __init__(self):
+        self.timestamp = None
+        self.position = np.nan
+        self.price = np.nan
+        self.passed_position = np.nan
+
+    @property
+    def has_timestamp(self) -> bool:
+        return self.timestamp is not None
+
+    def prepend_timestamp(self, timestamps: np.ndarray) -> np.ndarray:
+        if not self.has_timestamp:
+            ## nothing carried yet; a placeholder row before everything
+            return np.concatenate([[np.iinfo(np.int64).min], timestamps])
+
+        return np.concatenate([[self.timestamp], timestamps])
+
+    def update(
+        self,
+        timestamps: np.ndarray,
+        position_values: np.ndarray,
+        price_values: np.ndarray,
+    ):
+        ## timestamps include the carried row, so are never empty
+        if len(timestamps) > 1:
+            self.timestamp = timestamps[-1]
+        self.position = _last_valid_value(position_values, default=self.position)
+        self.price = _last_valid_value(price_values, default=self.price)
+
+
+def _last_valid_value(values: np.ndarray, default: float) -> float:
+    valid_values = values[~np.isnan(values)]
+    if len(valid_values) == 0:
+        return default
+
+    return valid_values[-1]
+
+
+def _aligned_to_timestamps(
+    value: Union[float, pd.Series], timestamps: np.ndarray, default: float
+) -> Union[float, np.ndarray]:
+    if value is arg_not_supplied:
+        return default
+    if not isinstance(value, pd.Series):
+        return value
+
+    ## as reindex(method="ffill"), like the full calculator
+    source_timestamps, source_values = sorted_timestamps_and_values(value)
+
+    return ffill_align(source_timestamps, source_values, timestamps)
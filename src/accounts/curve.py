@@ -3,12 +3,21 @@ import numpy as np
 from typing import Union
 from src.utils.references import GROSS_CURVE, NET_CURVE, COSTS_CURVE
 from src.accounts.profit_and_loss import ProfitAndLossWithGenericCosts
+from src.accounts.curve_stats import (
+    CurveStatistics,
+    calculate_curve_statistics,
+    TailStatistics,
+    calculate_tail_statistics,
+    DEFAULT_TAIL_PERCENTILES,
+)
+from src.accounts.incremental import IncrementalAccountCurve
+from src.accounts.drawdown import DrawdownEpisodes, drawdown_episodes
+from src.accounts.rolling import RollingCurveStatistics, ROLLING_STATISTICS
+from src.accounts.bootstrap import BootstrapDistribution, bootstrap_curve_statistics
 from src.utils.references import Frequency, from_frequency_to_times_per_year
-from scipy.stats import skew, ttest_1samp, norm
+from scipy.stats import skew, ttest_1samp
 
-QUANT_PERCENTILE_EXTREME = 0.01
-QUANT_PERCENTILE_STD = 0.3
-NORMAL_DISTR_RATIO = norm.ppf(QUANT_PERCENTILE_EXTREME) / norm.ppf(QUANT_PERCENTILE_STD)
+CACHED_VALUES_STATE = ("values_state",)
 
 
 class AccountCurve(pd.Series):
@@ -26,12 +35,12 @@ class AccountCurve(pd.Series):
 
         super().__init__(as_pd_series)
 
-        self._as_ts = as_pd_series
         self._pandl_calculator_with_costs = pandl_calculator_with_costs
         self._frequency = frequency  ## frequency type
         self._curve_type = curve_type
         self._is_percentage = is_percentage
         self._weighted = weighted
+        self._calculation_cache = {}
 
     def __repr__(self):
         if self.weighted:
@@ -44,6 +53,27 @@ class AccountCurve(pd.Series):
             + "\n %s account curve; use object.stats() to see methods" % weight_comment
         )
 
+    def _cached_calculation(self, cache_key: tuple, calculation):
+        ## a pd.Series can be changed in place, so results are only reused
+        ## while the index and values are the ones they were found from;
+        ## hashing the values is cheap next to the calculations cached
+        values_state = (self.index, hash(self.values.tobytes()))
+        cached_state = self._calculation_cache.get(CACHED_VALUES_STATE)
+        if (
+            cached_state is None
+            or cached_state[0] is not values_state[0]
+            or cached_state[1] != values_state[1]
+        ):
+            self._calculation_cache.clear()
+            self._calculation_cache[CACHED_VALUES_STATE] = values_state
+
+        try:
+            return self._calculation_cache[cache_key]
+        except KeyError:
+            result = calculation()
+            self._calculation_cache[cache_key] = result
+            return result
+
     def weight(self, weight: pd.Series):
         pandl_calculator = self.pandl_calculator_with_costs
         weighted_pandl_calculator = pandl_calculator.weight(weight)
@@ -56,6 +86,20 @@ class AccountCurve(pd.Series):
             weighted=True,
         )
 
+    def incremental(self) -> IncrementalAccountCurve:
+        ## carries on from the end of this curve, one period per new bar
+        return IncrementalAccountCurve.from_account_curve(self)
+
+    def bulk_weighting_stats(self, weights: pd.DataFrame) -> pd.DataFrame:
+        ## ann_mean, ann_std and sharpe of self.weight(weights[column]) for
+        ## every column of candidate weights, without building the curves
+        return self.pandl_calculator_with_costs.bulk_weighting_stats(
+            weights,
+            frequency=self.frequency,
+            percent=self.is_percentage,
+            curve_type=self.curve_type,
+        )
+
     ## TO RETURN A 'NEW' ACCOUNT CURVE
     @property
     def gross(self):
@@ -173,7 +217,8 @@ class AccountCurve(pd.Series):
 
     @property
     def as_ts(self) -> pd.Series:
-        return self._as_ts
+        ## a plain series over the curve's own buffer, not a second copy
+        return pd.Series(self.values, index=self.index, name=self.name, copy=False)
 
     @property
     def frequency(self) -> str:
@@ -238,18 +283,25 @@ class AccountCurve(pd.Series):
         x = self.curve()
         return drawdown(x)
 
+    def drawdown_episodes(self) -> DrawdownEpisodes:
+        return self._cached_calculation(
+            ("drawdown_episodes",), lambda: drawdown_episodes(self.curve())
+        )
+
     def avg_drawdown(self):
-        dd = self.drawdown()
-        return np.nanmean(dd.values)
+        return self.drawdown_episodes().avg_drawdown()
 
     def worst_drawdown(self):
-        dd = self.drawdown()
-        return np.nanmin(dd.values)
+        return self.drawdown_episodes().worst_drawdown()
 
     def time_in_drawdown(self):
-        dd = self.drawdown().dropna()
-        in_dd = float(dd[dd < 0].shape[0])
-        return in_dd / float(dd.shape[0])
+        return self.drawdown_episodes().time_in_drawdown()
+
+    def max_drawdown_duration(self):
+        return self.drawdown_episodes().max_drawdown_duration()
+
+    def avg_recovery_time(self):
+        return self.drawdown_episodes().avg_recovery_time()
 
     def calmar(self):
         return self.ann_mean() / -self.worst_drawdown()
@@ -318,6 +370,30 @@ class AccountCurve(pd.Series):
         y = self.as_ts.rolling(window, min_periods=4, center=True).std().to_frame()
         return y * self.vol_scalar
 
+    def rolling_stats(self, windows=(64, 256), min_periods=None) -> pd.DataFrame:
+        """
+        Rolling versions of the statistics, for each window length in
+        periods; columns are (window, statistic)
+        """
+        rolling_statistics = RollingCurveStatistics(
+            self.values, times_per_year=self.returns_scalar
+        )
+        columns = {}
+        for window in windows:
+            for_window = rolling_statistics.for_window(window, min_periods=min_periods)
+            for name in ROLLING_STATISTICS:
+                columns[(window, name)] = for_window[name]
+
+        return pd.DataFrame(columns, index=self.index)
+
+    def expanding_stats(self, min_periods=2) -> pd.DataFrame:
+        rolling_statistics = RollingCurveStatistics(
+            self.values, times_per_year=self.returns_scalar
+        )
+        for_window = rolling_statistics.for_window(None, min_periods=min_periods)
+
+        return pd.DataFrame(for_window, index=self.index)[ROLLING_STATISTICS]
+
     def t_test(self):
         return ttest_1samp(self.vals(), 0.0)
 
@@ -327,11 +403,31 @@ class AccountCurve(pd.Series):
     def p_value(self):
         return float(self.t_test()[1])
 
-    def average_quant_ratio(self):
-        upper = self.quant_ratio_upper()
-        lower = self.quant_ratio_lower()
+    def bootstrap(
+        self, n_resamples=10000, block_length=1, seed=None, max_workers=None
+    ) -> BootstrapDistribution:
+        """
+        Bootstrap distributions of sharpe, sortino, skew and drawdowns; use a
+        block_length above 1 to keep autocorrelation in the resamples
+        """
+        return bootstrap_curve_statistics(
+            self.values,
+            times_per_year=self.returns_scalar,
+            n_resamples=n_resamples,
+            block_length=block_length,
+            seed=seed,
+            max_workers=max_workers,
+        )
 
-        return np.mean([upper, lower])
+    def tail_statistics(
+        self, extra_percentiles=DEFAULT_TAIL_PERCENTILES
+    ) -> TailStatistics:
+        return calculate_tail_statistics(
+            self.values, extra_percentiles=extra_percentiles
+        )
+
+    def average_quant_ratio(self):
+        return self.tail_statistics(extra_percentiles=()).average_quant_ratio
 
     def quant_ratio_lower(self):
         return quant_ratio_lower_curve(self)
@@ -343,36 +439,18 @@ class AccountCurve(pd.Series):
         x = self.as_ts
         return demeaned_remove_zeros(x)
 
+    def curve_statistics(self) -> CurveStatistics:
+        return self._cached_calculation(
+            ("curve_statistics",),
+            lambda: calculate_curve_statistics(
+                self.values,
+                times_per_year=self.returns_scalar,
+                episodes=self.drawdown_episodes(),
+            ),
+        )
+
     def stats(self):
-        stats_list = [
-            "min",
-            "max",
-            "median",
-            "mean",
-            "std",
-            "skew",
-            "ann_mean",
-            "ann_std",
-            "sharpe",
-            "sortino",
-            "avg_drawdown",
-            "time_in_drawdown",
-            "calmar",
-            "avg_return_to_drawdown",
-            "avg_loss",
-            "avg_gain",
-            "gaintolossratio",
-            "profitfactor",
-            "hitrate",
-            "t_stat",
-            "p_value",
-        ]
-
-        build_stats = []
-        for stat_name in stats_list:
-            stat_method = getattr(self, stat_name)
-            ans = stat_method()
-            build_stats.append((stat_name, "{0:.4g}".format(ans)))
+        build_stats = self.curve_statistics().as_list()
 
         comment1 = (
             "You can also plot / print:",
@@ -382,24 +460,136 @@ class AccountCurve(pd.Series):
         return [build_stats, comment1]
 
 
+class LazyAccountCurve(AccountCurve):
+    """
+    An AccountCurve whose P&L series isn't computed until its values are
+    first needed. It is a real pd.Series throughout, so operators, numpy and
+    pd.concat work as for any AccountCurve; the series is then computed once
+    and held as the curve's only buffer. Derived curves (gross, weekly,
+    percent, ...) are lazy too.
+    """
+
+    def __init__(
+        self,
+        pandl_calculator_with_costs: ProfitAndLossWithGenericCosts,
+        frequency: Frequency = Frequency.BDAY,
+        curve_type: str = NET_CURVE,
+        is_percentage: bool = False,
+        weighted=False,
+    ):
+        ## an empty series until evaluated; set directly, as pandas' own
+        ## __setattr__ would look at the values
+        pd.Series.__init__(self, dtype=float)
+        object.__setattr__(
+            self, "_pandl_calculator_with_costs", pandl_calculator_with_costs
+        )
+        object.__setattr__(self, "_frequency", frequency)
+        object.__setattr__(self, "_curve_type", curve_type)
+        object.__setattr__(self, "_is_percentage", is_percentage)
+        object.__setattr__(self, "_weighted", weighted)
+        object.__setattr__(self, "_calculation_cache", {})
+        object.__setattr__(self, "_is_evaluated", False)
+
+    ## pandas keeps a series' index and values in its block manager, _mgr,
+    ## and goes through it for anything needing them, so building that on
+    ## first access is all it takes to defer the series
+    @property
+    def _mgr(self):
+        if not self.__dict__.get("_is_evaluated", True):
+            self._evaluate()
+
+        return self.__dict__["_lazy_mgr"]
+
+    @_mgr.setter
+    def _mgr(self, mgr):
+        self.__dict__["_lazy_mgr"] = mgr
+        self.__dict__["_is_evaluated"] = True
+
+    def _evaluate(self):
+        as_pd_series = self.pandl_calculator_with_costs.as_pd_series_for_frequency(
+            percent=self.is_percentage,
+            curve_type=self.curve_type,
+            frequency=self.frequency,
+        )
+        object.__setattr__(self, "_mgr", as_pd_series._mgr)
+        object.__setattr__(self, "_name", as_pd_series.name)
+
+    @property
+    def is_evaluated(self) -> bool:
+        return self.__dict__.get("_is_evaluated", True)
+
+    def __repr__(self):
+        if not self.is_evaluated:
+            return "Lazy %s account curve, not yet calculated" % self.curve_type
+
+        return super().__repr__()
+
+    def _derived_curve(self, **kwargs) -> "LazyAccountCurve":
+        curve_arguments = dict(
+            pandl_calculator_with_costs=self.pandl_calculator_with_costs,
+            frequency=self.frequency,
+            curve_type=self.curve_type,
+            is_percentage=self.is_percentage,
+            weighted=self.weighted,
+        )
+        curve_arguments.update(kwargs)
+
+        return LazyAccountCurve(**curve_arguments)
+
+    def weight(self, weight: pd.Series):
+        return self._derived_curve(
+            pandl_calculator_with_costs=self.pandl_calculator_with_costs.weight(weight),
+            weighted=True,
+        )
+
+    @property
+    def gross(self):
+        return self._derived_curve(curve_type=GROSS_CURVE)
+
+    @property
+    def net(self):
+        return self._derived_curve(curve_type=NET_CURVE)
+
+    @property
+    def costs(self):
+        return self._derived_curve(curve_type=COSTS_CURVE)
+
+    @property
+    def daily(self):
+        return self._derived_curve(frequency=Frequency.BDAY)
+
+    @property
+    def weekly(self):
+        return self._derived_curve(frequency=Frequency.WEEK)
+
+    @property
+    def monthly(self):
+        return self._derived_curve(frequency=Frequency.MONTH)
+
+    @property
+    def annual(self):
+        return self._derived_curve(frequency=Frequency.YEAR)
+
+    @property
+    def percent(self):
+        return self._derived_curve(is_percentage=True)
+
+    @property
+    def value_terms(self):
+        return self._derived_curve(is_percentage=False)
+
+
 def quant_ratio_lower_curve(x: pd.Series):
-    demeaned_x = demeaned_remove_zeros(x)
-    raw_ratio = demeaned_x.quantile(QUANT_PERCENTILE_EXTREME) / demeaned_x.quantile(
-        QUANT_PERCENTILE_STD
-    )
-    return raw_ratio / NORMAL_DISTR_RATIO
+    return calculate_tail_statistics(x.values, extra_percentiles=()).quant_ratio_lower
 
 
 def quant_ratio_upper_curve(x: pd.Series):
-    demeaned_x = demeaned_remove_zeros(x)
-    raw_ratio = demeaned_x.quantile(1 - QUANT_PERCENTILE_EXTREME) / demeaned_x.quantile(
-        1 - QUANT_PERCENTILE_STD
-    )
-    return raw_ratio / NORMAL_DISTR_RATIO
+    return calculate_tail_statistics(x.values, extra_percentiles=()).quant_ratio_upper
 
 
 def demeaned_remove_zeros(x: pd.Series) -> pd.Series:
-    x[x == 0] = np.nan
+    ## a copy, so the caller's series keeps its zeros
+    x = x.where(x != 0)
     return x - x.mean()
 
 
@@ -0,0 +1,307 @@
+"""
+Many account curves held together as one (time x member) frame.
+
+Statistics come from calculate_curve_statistics on the 2-D array of returns,
+so a report over a thousand strategies is one set of column-wise array
+operations rather than a loop over AccountCurve objects. Individual members
+are still available as AccountCurves for drill-down.
+"""
+
+from dataclasses import fields
+from typing import Callable
+import numpy as np
+import pandas as pd
+from src.accounts.curve import AccountCurve, drawdown
+from src.accounts.curve_stats import CurveStatistics, calculate_curve_statistics
+from src.accounts.panel import PanelProfitAndLoss
+from src.utils.references import (
+    Frequency,
+    NET_CURVE,
+    arg_not_supplied,
+    from_frequency_to_times_per_year,
+)
+
+PORTFOLIO_MEMBER_NAME = "portfolio"
+
+
+class AccountCurveGroup:
+    def __init__(
+        self,
+        returns: pd.DataFrame,
+        frequency: Frequency = Frequency.BDAY,
+        curve_type: str = NET_CURVE,
+        is_percentage: bool = False,
+        get_member: Callable[[str], AccountCurve] = arg_not_supplied,
+        lengths: pd.Series = arg_not_supplied,
+    ):
+        """
+        :param returns: period returns, one column per member
+        :param get_member: gives the AccountCurve for a member name, for
+            drill-down
+        :param lengths: periods in each member's own curve, where members
+            have been padded onto a longer shared index; by default each
+            member runs from its first to its last valid return
+        """
+        self._returns = returns
+        self._lengths = lengths
+        self._frequency = frequency
+        self._curve_type = curve_type
+        self._is_percentage = is_percentage
+        self._get_member = get_member
+        self._cache = {}
+
+    @classmethod
+    def from_account_curves(cls, account_curves: dict) -> "AccountCurveGroup":
+        """
+        Group of existing curves, keyed by member name; they should share a
+        frequency, curve type and percentage setting
+        """
+        if len(account_curves) == 0:
+            raise Exception("Need at least one account curve to make a group")
+
+        first_curve = next(iter(account_curves.values()))
+        returns = pd.concat(
+            {name: curve.as_ts for name, curve in account_curves.items()}, axis=1
+        )
+
+        return cls(
+            returns,
+            frequency=first_curve.frequency,
+            curve_type=first_curve.curve_type,
+            is_percentage=first_curve.is_percentage,
+            get_member=account_curves.__getitem__,
+            lengths=pd.Series(
+                {name: len(curve) for name, curve in account_curves.items()}
+            ),
+        )
+
+    @classmethod
+    def from_panel(
+        cls,
+        panel: PanelProfitAndLoss,
+        frequency: Frequency = Frequency.BDAY,
+        curve_type: str = NET_CURVE,
+        is_percentage: bool = False,
+    ) -> "AccountCurveGroup":
+        """
+        One member per instrument of a panel, sharing its calculations
+        """
+        returns = panel.as_pd_frame_for_frequency(
+            frequency, percent=is_percentage, curve_type=curve_type
+        )
+
+        return cls(
+            returns,
+            frequency=frequency,
+            curve_type=curve_type,
+            is_percentage=is_percentage,
+            get_member=lambda instrument: panel.account_curve(
+                instrument,
+                frequency=frequency,
+                curve_type=curve_type,
+                is_percentage=is_percentage,
+            ),
+        )
+
+    def _cached_calculation(self, cache_key: tuple, calculation):
+        try:
+            return self._cache[cache_key]
+        except KeyError:
+            result = calculation()
+            self._cache[cache_key] = result
+            return result
+
+    def __repr__(self):
+        return "AccountCurveGroup of %d members, %s curves, %s" % (
+            len(self.members),
+            self.curve_type,
+            "percentage" if self.is_percentage else "value terms",
+        )
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __getitem__(self, member: str) -> AccountCurve:
+        return self.member(member)
+
+    def member(self, member: str) -> AccountCurve:
+        """
+        The full AccountCurve for one member
+        """
+        if self._get_member is arg_not_supplied:
+            raise Exception("This group has no account curves to drill down into")
+
+        return self._get_member(member)
+
+    def select(self, members: list) -> "AccountCurveGroup":
+        return AccountCurveGroup(
+            self.as_frame[members],
+            frequency=self.frequency,
+            curve_type=self.curve_type,
+            is_percentage=self.is_percentage,
+            get_member=self._get_member,
+            lengths=(
+                self._lengths
+                if self._lengths is arg_not_supplied
+                else self._lengths[members]
+            ),
+        )
+
+    def portfolio(self) -> "AccountCurveGroup":
+        """
+        The sum of all members, as a group of one
+        """
+        return AccountCurveGroup(
+            self.portfolio_returns().to_frame(PORTFOLIO_MEMBER_NAME),
+            frequency=self.frequency,
+            curve_type=self.curve_type,
+            is_percentage=self.is_percentage,
+        )
+
+    def portfolio_returns(self) -> pd.Series:
+        return self._cached_calculation(
+            ("portfolio_returns",), lambda: self.as_frame.sum(axis=1)
+        )
+
+    @property
+    def as_frame(self) -> pd.DataFrame:
+        return self._returns
+
+    @property
+    def members(self) -> pd.Index:
+        return self.as_frame.columns
+
+    @property
+    def frequency(self) -> Frequency:
+        return self._frequency
+
+    @property
+    def curve_type(self) -> str:
+        return self._curve_type
+
+    @property
+    def is_percentage(self) -> bool:
+        return self._is_percentage
+
+    @property
+    def returns_scalar(self) -> float:
+        return from_frequency_to_times_per_year(self.frequency)
+
+    def curve(self) -> pd.DataFrame:
+        return self._cached_calculation(
+            ("curve",), lambda: self.as_frame.cumsum().ffill()
+        )
+
+    def drawdown(self) -> pd.DataFrame:
+        return drawdown(self.curve())
+
+    def worst_drawdown(self) -> pd.Series:
+        return self.drawdown().min()
+
+    def curve_statistics(self) -> CurveStatistics:
+        """
+        Statistics for every member at once; each field is an array with one
+        entry per member
+        """
+        return self._cached_calculation(
+            ("curve_statistics",),
+            lambda: calculate_curve_statistics(
+                self.as_frame.values,
+                times_per_year=self.returns_scalar,
+                length=self.lengths.values,
+                end=self._ends(),
+            ),
+        )
+
+    @property
+    def lengths(self) -> pd.Series:
+        """
+        Periods each member covers; rows of the shared index outside a
+        member's own curve mustn't count towards its annualised returns
+        """
+        if self._lengths is not arg_not_supplied:
+            return self._lengths.reindex(self.members)
+
+        has_valid, first_valid, last_valid = self._valid_span()
+
+        return pd.Series(
+            np.where(has_valid, last_valid - first_valid + 1, len(self.as_frame)),
+            index=self.members,
+        )
+
+    def _ends(self) -> np.ndarray:
+        ## row after each member's last return; later rows are padding
+        has_valid, _, last_valid = self._valid_span()
+
+        return np.where(has_valid, last_valid + 1, len(self.as_frame))
+
+    def _valid_span(self) -> tuple:
+        valid = self.as_frame.notna().values
+        has_valid = valid.any(axis=0)
+        first_valid = valid.argmax(axis=0)
+        last_valid = len(valid) - 1 - valid[::-1].argmax(axis=0)
+
+        return has_valid, first_valid, last_valid
+
+    def stats(self) -> pd.DataFrame:
+        """
+        One row per statistic, as in AccountCurve.stats(), and one column per
+        member
+        """
+        curve_statistics = self.curve_statistics()
+        return pd.DataFrame(
+            {
+                field.name: getattr(curve_statistics, field.name)
+                for field in fields(curve_statistics)
+            },
+            index=self.members,
+        ).T
+
+    def _statistic(self, stat_name: str) -> pd.Series:
+        return pd.Series(
+            np.asarray(getattr(self.curve_statistics(), stat_name)),
+            index=self.members,
+            name=stat_name,
+        )
+
+    def mean(self) -> pd.Series:
+        return self._statistic("mean")
+
+    def std(self) -> pd.Series:
+        return self._statistic("std")
+
+    def ann_mean(self) -> pd.Series:
+        return self._statistic("ann_mean")
+
+    def ann_std(self) -> pd.Series:
+        return self._statistic("ann_std")
+
+    def sharpe(self) -> pd.Series:
+        return self._statistic("sharpe")
+
+    def sortino(self) -> pd.Series:
+        return self._statistic("sortino")
+
+    def skew(self) -> pd.Series:
+        return self._statistic("skew")
+
+    def avg_drawdown(self) -> pd.Series:
+        return self._statistic("avg_drawdown")
+
+    def time_in_drawdown(self) -> pd.Series:
+        return self._statistic("time_in_drawdown")
+
+    def calmar(self) -> pd.Series:
+        return self._statistic("calmar")
+
+    def avg_return_to_drawdown(self) -> pd.Series:
+        return self._statistic("avg_return_to_drawdown")
+
+    def hitrate(self) -> pd.Series:
+        return self._statistic("hitrate")
+
+    def t_stat(self) -> pd.Series:
+        return self._statistic("t_stat")
+
+    def p_value(self) -> pd.Series:
+        return self._statistic("p_value")
@@ -0,0 +1,298 @@
+"""
+Single pass statistics for account curves.
+
+Every metric reported by AccountCurve.stats() is derived from one set of shared
+intermediate arrays (cleaned values, moments, gain/loss partitions and the
+drawdown series) rather than each metric rebuilding them from scratch.
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Union
+import numpy as np
+from scipy.stats import norm, t as t_distribution
+from src.accounts.drawdown import DrawdownEpisodes
+
+StatValue = Union[float, np.ndarray]
+
+
+@dataclass(frozen=True)
+class CurveStatistics:
+    """
+    Typed result of calculate_curve_statistics. Each field is a float for a
+    single curve, or an array with one entry per column for a 2-D input.
+    """
+
+    min: StatValue
+    max: StatValue
+    median: StatValue
+    mean: StatValue
+    std: StatValue
+    skew: StatValue
+    ann_mean: StatValue
+    ann_std: StatValue
+    sharpe: StatValue
+    sortino: StatValue
+    avg_drawdown: StatValue
+    ## not listed by stats(), which reports it through calmar
+    worst_drawdown: StatValue = field(metadata=dict(in_stats=False))
+    time_in_drawdown: StatValue
+    calmar: StatValue
+    avg_return_to_drawdown: StatValue
+    avg_loss: StatValue
+    avg_gain: StatValue
+    gaintolossratio: StatValue
+    profitfactor: StatValue
+    hitrate: StatValue
+    t_stat: StatValue
+    p_value: StatValue
+
+    def as_list(self) -> list:
+        """
+        Formatted (name, value) pairs in the order used by AccountCurve.stats()
+        """
+        return [
+            (statistic.name, "{0:.4g}".format(getattr(self, statistic.name)))
+            for statistic in fields(self)
+            if statistic.metadata.get("in_stats", True)
+        ]
+
+
+def calculate_curve_statistics(
+    values: np.ndarray,
+    times_per_year: float,
+    length: np.ndarray = None,
+    episodes: DrawdownEpisodes = None,
+    end: np.ndarray = None,
+) -> CurveStatistics:
+    """
+    Calculate all account curve statistics in one vectorised pass.
+
+    :param values: period returns, 1-D for one curve or 2-D (time x curve); nans allowed
+    :param times_per_year: number of periods in a year, used for annualisation
+    :param length: periods each curve covers, for annualised means; all rows
+        if not given, which is wrong for curves padded onto a longer index
+    :param episodes: drawdown episodes of a single curve, if already found; the
+        drawdown statistics then come from them instead of a second pass
+    :param end: row after each curve's last period, for curves padded onto a
+        longer index; the padding isn't counted as time in drawdown
+
+    >>> stats = calculate_curve_statistics(np.array([1.0, -1.0, 2.0, np.nan]), 256.0)
+    >>> float(stats.hitrate)
+    0.6666666666666666
+    >>> float(stats.ann_mean)
+    128.0
+    """
+    returns = np.asarray(values, dtype=float)
+    is_single_curve = returns.ndim == 1
+    if is_single_curve:
+        returns = returns[:, np.newaxis]
+
+    ## length includes nans, as with len() on the curve
+    if length is None:
+        length = returns.shape[0]
+    valid = ~np.isnan(returns)
+    filled = np.where(valid, returns, 0.0)
+    losses = valid & (returns < 0)
+    gains = valid & (returns > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        count = valid.sum(axis=0)
+        total = filled.sum(axis=0)
+        mean = total / count
+
+        demeaned = np.where(valid, returns - mean, 0.0)
+        demeaned_squared = demeaned * demeaned
+        moment2 = demeaned_squared.sum(axis=0) / count
+        moment3 = (demeaned_squared * demeaned).sum(axis=0) / count
+        std = np.sqrt(moment2 * count / (count - 1))
+
+        ## same degenerate case handling as scipy.stats.skew
+        zero_variance = moment2 <= (np.finfo(float).resolution * mean) ** 2
+        skew = np.where(zero_variance, np.nan, moment3 / moment2**1.5)
+
+        vol_scalar = times_per_year**0.5
+        ann_mean = total / (length / times_per_year)
+        ann_std = std * vol_scalar
+        sharpe = ann_mean / ann_std
+
+        loss_count = losses.sum(axis=0)
+        loss_total = np.where(losses, returns, 0.0).sum(axis=0)
+        avg_loss = loss_total / loss_count
+        loss_demeaned = np.where(losses, returns - avg_loss, 0.0)
+        loss_std = np.sqrt((loss_demeaned * loss_demeaned).sum(axis=0) / loss_count)
+        sortino = ann_mean / (loss_std * vol_scalar)
+
+        gain_count = gains.sum(axis=0)
+        gain_total = np.where(gains, returns, 0.0).sum(axis=0)
+        avg_gain = gain_total / gain_count
+
+        if episodes is None:
+            avg_drawdown, worst_drawdown, time_in_drawdown = _drawdown_statistics(
+                filled, valid, end=end
+            )
+        else:
+            avg_drawdown = np.array([episodes.avg_drawdown()])
+            worst_drawdown = np.array([episodes.worst_drawdown()])
+            time_in_drawdown = np.array([episodes.time_in_drawdown()])
+
+        t_stat = mean / (std / np.sqrt(count))
+        p_value = 2.0 * t_distribution.sf(np.abs(t_stat), count - 1)
+
+        statistics = dict(
+            min=_nan_reduce(np.min, returns, valid, np.inf),
+            max=_nan_reduce(np.max, returns, valid, -np.inf),
+            median=_nanmedian(returns, count),
+            mean=mean,
+            std=std,
+            skew=skew,
+            ann_mean=ann_mean,
+            ann_std=ann_std,
+            sharpe=sharpe,
+            sortino=sortino,
+            avg_drawdown=avg_drawdown,
+            worst_drawdown=worst_drawdown,
+            time_in_drawdown=time_in_drawdown,
+            calmar=ann_mean / -worst_drawdown,
+            avg_return_to_drawdown=ann_mean / -avg_drawdown,
+            avg_loss=avg_loss,
+            avg_gain=avg_gain,
+            gaintolossratio=avg_gain / -avg_loss,
+            profitfactor=gain_total / -loss_total,
+            hitrate=gain_count / (loss_count + gain_count),
+            t_stat=t_stat,
+            p_value=p_value,
+        )
+
+    if is_single_curve:
+        statistics = {
+            name: float(np.asarray(value).reshape(-1)[0])
+            for name, value in statistics.items()
+        }
+
+    return CurveStatistics(**statistics)
+
+
+def _drawdown_statistics(
+    filled: np.ndarray, valid: np.ndarray, end: np.ndarray = None
+) -> tuple:
+    ## average, worst and time in drawdown for each column
+    underwater = _drawdown_given_valid_returns(filled, valid)
+    if end is not None:
+        ## the forward fill would otherwise carry on through the padding
+        after_end = np.arange(underwater.shape[0])[:, np.newaxis] >= end
+        underwater = np.where(after_end, np.nan, underwater)
+    underwater_valid = ~np.isnan(underwater)
+    underwater_count = underwater_valid.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_drawdown = np.where(underwater_valid, underwater, 0.0).sum(
+            axis=0
+        ) / np.where(underwater_count > 0, underwater_count, np.nan)
+        worst_drawdown = np.where(
+            underwater_count > 0,
+            np.where(underwater_valid, underwater, np.inf).min(axis=0),
+            np.nan,
+        )
+        time_in_drawdown = (underwater < 0).sum(axis=0) / underwater_count
+
+    return avg_drawdown, worst_drawdown, time_in_drawdown
+
+
+def _drawdown_given_valid_returns(filled: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    ## equivalent to drawdown(curve.cumsum().ffill()): nans before the first
+    ## valid return stay nan, later gaps carry the cumulated value forward
+    started = np.logical_or.accumulate(valid, axis=0)
+    cumulated = np.where(started, np.cumsum(filled, axis=0), np.nan)
+    running_max = np.fmax.accumulate(cumulated, axis=0)
+
+    return cumulated - running_max
+
+
+def _nan_reduce(
+    reducer, returns: np.ndarray, valid: np.ndarray, fill_value: float
+) -> np.ndarray:
+    reduced = reducer(np.where(valid, returns, fill_value), axis=0)
+    return np.where(valid.any(axis=0), reduced, np.nan)
+
+
+def _nanmedian(returns: np.ndarray, count: np.ndarray) -> np.ndarray:
+    if returns.shape[0] == 0:
+        return np.full(returns.shape[1], np.nan)
+    ## nans sort to the end, so the median sits in the first `count` rows
+    ordered = np.sort(returns, axis=0)
+    columns = np.arange(returns.shape[1])
+    lower_index = np.clip((count - 1) // 2, 0, None)
+    upper_index = np.clip(count // 2, 0, None)
+    median = 0.5 * (ordered[lower_index, columns] + ordered[upper_index, columns])
+
+    return np.where(count > 0, median, np.nan)
+
+
+QUANT_PERCENTILE_EXTREME = 0.01
+QUANT_PERCENTILE_STD = 0.3
+NORMAL_DISTR_RATIO = norm.ppf(QUANT_PERCENTILE_EXTREME) / norm.ppf(QUANT_PERCENTILE_STD)
+QUANT_RATIO_PERCENTILES = (
+    QUANT_PERCENTILE_EXTREME,
+    QUANT_PERCENTILE_STD,
+    1 - QUANT_PERCENTILE_STD,
+    1 - QUANT_PERCENTILE_EXTREME,
+)
+DEFAULT_TAIL_PERCENTILES = (0.001, 0.05, 0.1, 0.9, 0.95, 0.999)
+
+
+@dataclass(frozen=True)
+class TailStatistics:
+    """
+    Result of calculate_tail_statistics: quantiles of the demeaned non zero
+    returns, keyed by percentile, and the quant ratios derived from them
+    """
+
+    quantiles: dict
+
+    @property
+    def quant_ratio_lower(self) -> float:
+        raw_ratio = (
+            self.quantiles[QUANT_PERCENTILE_EXTREME]
+            / self.quantiles[QUANT_PERCENTILE_STD]
+        )
+        return raw_ratio / NORMAL_DISTR_RATIO
+
+    @property
+    def quant_ratio_upper(self) -> float:
+        raw_ratio = (
+            self.quantiles[1 - QUANT_PERCENTILE_EXTREME]
+            / self.quantiles[1 - QUANT_PERCENTILE_STD]
+        )
+        return raw_ratio / NORMAL_DISTR_RATIO
+
+    @property
+    def average_quant_ratio(self) -> float:
+        return np.mean([self.quant_ratio_upper, self.quant_ratio_lower])
+
+
+def calculate_tail_statistics(
+    values: np.ndarray, extra_percentiles: tuple = DEFAULT_TAIL_PERCENTILES
+) -> TailStatistics:
+    """
+    Quant ratios, plus quantiles at extra_percentiles for risk reports, from
+    one demeaning and one partition of the returns. Zeros and nans are left
+    out, and values is not changed.
+
+    >>> tail_statistics = calculate_tail_statistics(np.arange(-50.0, 51.0), (0.5,))
+    >>> float(tail_statistics.quantiles[0.5])
+    0.0
+    >>> bool(np.isclose(tail_statistics.quant_ratio_lower, tail_statistics.quant_ratio_upper))
+    True
+    """
+    returns = np.asarray(values, dtype=float)
+    returns = returns[~np.isnan(returns) & (returns != 0)]
+    percentiles = sorted(set(QUANT_RATIO_PERCENTILES) | set(extra_percentiles))
+
+    if len(returns) == 0:
+        quantiles = np.full(len(percentiles), np.nan)
+    else:
+        ## np.quantile finds every percentile from a single partition, with
+        ## the same linear interpolation as pd.Series.quantile
+        quantiles = np.quantile(returns - returns.mean(), percentiles)
+
+    return TailStatistics(quantiles=dict(zip(percentiles, quantiles)))
@@ -0,0 +1,176 @@
+"""
+Drawdown episodes of an account curve, found in one NumPy pass.
+
+An episode starts on the first period below the running maximum, reaches its
+trough at the lowest point, and recovers on the first period back at (or
+above) the previous peak. Every drawdown metric is answered from the episode
+arrays rather than by recomputing the curve and its running maximum.
+"""
+
+from dataclasses import dataclass
+from typing import Union
+import numpy as np
+import pandas as pd
+
+NOT_RECOVERED = -1
+
+
+@dataclass(frozen=True)
+class DrawdownEpisodes:
+    """
+    One entry per episode in each array; start, trough and recovery are
+    integer locations in the curve, with recovery NOT_RECOVERED for an episode
+    still open at the end. depth is the (negative) drawdown at the trough,
+    area the sum of the drawdowns over the episode, and duration the number of
+    periods spent below the peak.
+    """
+
+    start: np.ndarray
+    trough: np.ndarray
+    recovery: np.ndarray
+    depth: np.ndarray
+    area: np.ndarray
+    duration: np.ndarray
+    ## periods with a valid drawdown, ie from the start of the curve
+    valid_count: int
+    index: pd.Index = None
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def worst_drawdown(self) -> float:
+        if self.valid_count == 0:
+            return np.nan
+        if len(self) == 0:
+            return 0.0
+
+        return float(self.depth.min())
+
+    def avg_drawdown(self) -> float:
+        if self.valid_count == 0:
+            return np.nan
+
+        return float(self.area.sum() / self.valid_count)
+
+    def time_in_drawdown(self) -> float:
+        if self.valid_count == 0:
+            return np.nan
+
+        return float(self.duration.sum() / self.valid_count)
+
+    def max_drawdown_duration(self) -> int:
+        if len(self) == 0:
+            return 0
+
+        return int(self.duration.max())
+
+    def recovery_time(self) -> np.ndarray:
+        """
+        Periods from trough to recovery for recovered episodes
+        """
+        recovered = self.recovery != NOT_RECOVERED
+
+        return self.recovery[recovered] - self.trough[recovered]
+
+    def avg_recovery_time(self) -> float:
+        recovery_time = self.recovery_time()
+        if len(recovery_time) == 0:
+            return np.nan
+
+        return float(recovery_time.mean())
+
+    def max_recovery_time(self) -> float:
+        recovery_time = self.recovery_time()
+        if len(recovery_time) == 0:
+            return np.nan
+
+        return float(recovery_time.max())
+
+    def as_frame(self) -> pd.DataFrame:
+        """
+        One row per episode, with dates if the curve had an index
+        """
+        as_frame = pd.DataFrame(
+            dict(
+                start=self.start,
+                trough=self.trough,
+                recovery=self.recovery,
+                depth=self.depth,
+                duration=self.duration,
+            )
+        )
+        if self.index is not None:
+            for column in ["start", "trough", "recovery"]:
+                locations = as_frame[column].values
+                dates = self.index[np.clip(locations, 0, None)].to_series().values
+                as_frame[column] = dates
+                as_frame.loc[locations == NOT_RECOVERED, column] = pd.NaT
+
+        return as_frame
+
+
+def drawdown_episodes(curve: Union[pd.Series, np.ndarray]) -> DrawdownEpisodes:
+    """
+    Episodes of a cumulated curve (eg AccountCurve.curve()); leading nans
+    are ignored, as with drawdown()
+
+    >>> episodes = drawdown_episodes(np.array([1.0, 2.0, 3.0, 2.0, 1.0, 4.0, 5.0, 4.5]))
+    >>> episodes.start, episodes.trough, episodes.recovery
+    (array([3, 7]), array([4, 7]), array([ 5, -1]))
+    >>> episodes.depth, episodes.duration
+    (array([-2. , -0.5]), array([2, 1]))
+    """
+    index = curve.index if isinstance(curve, pd.Series) else None
+    curve = np.asarray(curve, dtype=float)
+
+    running_max = np.fmax.accumulate(curve) if len(curve) else curve
+    underwater = curve - running_max
+    valid_count = int((~np.isnan(underwater)).sum())
+    ## nan compares false, so is never in a drawdown
+    in_drawdown = underwater < 0
+
+    previous_in_drawdown = np.concatenate([[False], in_drawdown[:-1]])
+    start = np.flatnonzero(in_drawdown & ~previous_in_drawdown)
+    end = np.flatnonzero(~in_drawdown & previous_in_drawdown)
+    recovery = np.full(len(start), NOT_RECOVERED)
+    recovery[: len(end)] = end
+    ## open episodes run to the end of the curve
+    episode_end = np.where(recovery == NOT_RECOVERED, len(curve), recovery)
+
+    if len(start):
+        episode_underwater = np.where(in_drawdown, underwater, 0.0)
+        depth = np.minimum.reduceat(episode_underwater, start)
+        area = np.add.reduceat(episode_underwater, start)
+        trough = _first_location_of_minimum(episode_underwater, start, depth)
+    else:
+        depth = area = np.array([], dtype=float)
+        trough = np.array([], dtype=int)
+
+    return DrawdownEpisodes(
+        start=start,
+        trough=trough,
+        recovery=recovery,
+        depth=depth,
+        area=area,
+        duration=episode_end - start,
+        valid_count=valid_count,
+        index=index,
+    )
+
+
+def _first_location_of_minimum(
+    episode_underwater: np.ndarray, start: np.ndarray, depth: np.ndarray
+) -> np.ndarray:
+    ## reduceat segments run from each start to the next; outside episodes
+    ## the values are zero, which can't be an episode's (negative) minimum
+    is_start = np.zeros(len(episode_underwater), dtype=int)
+    is_start[start] = 1
+    episode_number = np.cumsum(is_start) - 1
+    at_minimum = (episode_number >= 0) & (
+        episode_underwater == depth[np.clip(episode_number, 0, None)]
+    )
+    locations = np.flatnonzero(at_minimum)
+    ## locations are in order, so the first of each episode is where it changes
+    first = np.flatnonzero(np.diff(episode_number[locations], prepend=-1))
+
+    return locations[first]
@@ -0,0 +1,342 @@
+"""
+Append only account curves for live monitoring.
+
+Rather than rebuilding the P&L calculator and AccountCurve over the whole
+history when a new bar arrives, the state needed for the headline statistics
+is kept as running values: the cumulative P&L and its running maximum for
+drawdowns, and Welford style running moments for the mean, standard
+deviation and skew. Each new bar is then O(1).
+"""
+
+import numpy as np
+from src.utils.references import GROSS_CURVE, NET_CURVE, COSTS_CURVE, curve_types
+from src.accounts.profit_and_loss import ProfitAndLossWithTradeCosts
+
+
+class RunningCurveStatistics:
+    """
+    Statistics of a curve of period returns that is only ever appended to.
+    Definitions match calculate_curve_statistics.
+    """
+
+    def __init__(self, times_per_year: float):
+        self._times_per_year = times_per_year
+        ## length includes nans, as with len() on the curve
+        self._length = 0
+        self._count = 0
+        self._total = 0.0
+        self._mean = 0.0
+        self._sum_squared_deviations = 0.0
+        self._sum_cubed_deviations = 0.0
+        self._cumulative = np.nan
+        self._running_max = np.nan
+        self._drawdown_total = 0.0
+        self._drawdown_count = 0
+        self._in_drawdown_count = 0
+        self._worst_drawdown = np.nan
+
+    @classmethod
+    def from_values(
+        cls, values: np.ndarray, times_per_year: float
+    ) -> "RunningCurveStatistics":
+        """
+        Running statistics already updated with a history of returns, found
+        in one vectorised pass rather than a loop over update()
+        """
+        running_statistics = cls(times_per_year)
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        valid_values = values[valid]
+
+        running_statistics._length = len(values)
+        running_statistics._count = len(valid_values)
+        if len(valid_values) == 0:
+            return running_statistics
+
+        mean = valid_values.mean()
+        deviations = valid_values - mean
+        running_statistics._total = valid_values.sum()
+        running_statistics._mean = mean
+        running_statistics._sum_squared_deviations = (deviations**2).sum()
+        running_statistics._sum_cubed_deviations = (deviations**3).sum()
+
+        ## as drawdown(curve.cumsum().ffill()), from the first valid return
+        first_valid = np.argmax(valid)
+        cumulated = np.cumsum(np.nan_to_num(values[first_valid:]))
+        running_max = np.maximum.accumulate(cumulated)
+        drawdowns = cumulated - running_max
+        running_statistics._cumulative = cumulated[-1]
+        running_statistics._running_max = running_max[-1]
+        running_statistics._drawdown_total = drawdowns.sum()
+        running_statistics._drawdown_count = len(drawdowns)
+        running_statistics._in_drawdown_count = int((drawdowns < 0).sum())
+        running_statistics._worst_drawdown = drawdowns.min()
+
+        return running_statistics
+
+    def update(self, value: float):
+        self._length += 1
+        if np.isnan(value):
+            if self._count > 0:
+                ## the curve is filled forward over a missing return
+                self._update_drawdown()
+            return
+
+        ## Welford / Terriberry updates of the central moments
+        previous_count = self._count
+        self._count += 1
+        deviation = value - self._mean
+        deviation_over_count = deviation / self._count
+        second_order_term = deviation * deviation_over_count * previous_count
+        self._mean += deviation_over_count
+        self._sum_cubed_deviations += (
+            second_order_term * deviation_over_count * (self._count - 2)
+            - 3.0 * deviation_over_count * self._sum_squared_deviations
+        )
+        self._sum_squared_deviations += second_order_term
+        self._total += value
+
+        if previous_count == 0:
+            self._cumulative = value
+            self._running_max = value
+        else:
+            self._cumulative += value
+            self._running_max = max(self._running_max, self._cumulative)
+        self._update_drawdown()
+
+    def _update_drawdown(self):
+        current_drawdown = self.drawdown
+        self._drawdown_total += current_drawdown
+        self._drawdown_count += 1
+        self._in_drawdown_count += current_drawdown < 0
+        self._worst_drawdown = np.fmin(self._worst_drawdown, current_drawdown)
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def cumulative(self) -> float:
+        return self._cumulative
+
+    @property
+    def drawdown(self) -> float:
+        return self._cumulative - self._running_max
+
+    def worst_drawdown(self) -> float:
+        return self._worst_drawdown
+
+    def avg_drawdown(self) -> float:
+        return _divide(self._drawdown_total, self._drawdown_count)
+
+    def time_in_drawdown(self) -> float:
+        return _divide(self._in_drawdown_count, self._drawdown_count)
+
+    def mean(self) -> float:
+        return self._mean if self._count > 0 else np.nan
+
+    def std(self) -> float:
+        return np.sqrt(_divide(self._sum_squared_deviations, self._count - 1))
+
+    def skew(self) -> float:
+        moment2 = _divide(self._sum_squared_deviations, self._count)
+        moment3 = _divide(self._sum_cubed_deviations, self._count)
+        ## same degenerate case handling as scipy.stats.skew
+        if not moment2 > (np.finfo(float).resolution * self._mean) ** 2:
+            return np.nan
+
+        return moment3 / moment2**1.5
+
+    def ann_mean(self) -> float:
+        return _divide(self._total, self._length / self._times_per_year)
+
+    def ann_std(self) -> float:
+        return self.std() * self._times_per_year**0.5
+
+    def sharpe(self) -> float:
+        return _divide(self.ann_mean(), self.ann_std())
+
+
+class IncrementalAccountCurve:
+    """
+    An account curve that is extended one bar at a time, with each bar one
+    period of the curve. Costs are trade costs, as for
+    ProfitAndLossWithTradeCosts; start from an existing AccountCurve with
+    AccountCurve.incremental().
+    """
+
+    def __init__(
+        self,
+        times_per_year: float,
+        value_per_point: float = 1.0,
+        fx: float = 1.0,
+        capital: float = 1.0,
+        roundpositions: bool = False,
+        delayfill: bool = False,
+        commission_per_contract: float = 0.0,
+        percentage_fee: float = 0.0,
+        spread_in_points: float = 0.0,
+        curve_type: str = NET_CURVE,
+        is_percentage: bool = False,
+    ):
+        if curve_type not in curve_types:
+            raise Exception(
+                "Curve type %s not recognised! Must be one of %s"
+                % (curve_type, curve_types)
+            )
+
+        self._statistics = RunningCurveStatistics(times_per_year)
+        self._value_per_point = value_per_point
+        self._fx = fx
+        self._capital = capital
+        self._roundpositions = roundpositions
+        self._delayfill = delayfill
+        self._commission_per_contract = commission_per_contract
+        self._percentage_fee = percentage_fee
+        self._spread_in_points = spread_in_points
+        self._curve_type = curve_type
+        self._is_percentage = is_percentage
+
+        self._last_price = np.nan
+        self._position_held = np.nan
+        self._last_passed_position = np.nan
+
+    @classmethod
+    def from_account_curve(cls, account_curve) -> "IncrementalAccountCurve":
+        pandl_calculator = account_curve.pandl_calculator_with_costs
+        if account_curve.curve_type != GROSS_CURVE and not isinstance(
+            pandl_calculator, ProfitAndLossWithTradeCosts
+        ):
+            raise Exception(
+                "Only gross curves, or curves with trade costs, can be updated incrementally"
+            )
+
+        trade_costs = dict(
+            commission_per_contract=getattr(
+                pandl_calculator, "commission_per_contract", 0.0
+            ),
+            percentage_fee=getattr(pandl_calculator, "percentage_fee", 0.0),
+            spread_in_points=getattr(pandl_calculator, "spread_in_points", 0.0),
+        )
+        incremental_curve = cls(
+            times_per_year=account_curve.returns_scalar,
+            value_per_point=pandl_calculator.value_per_point,
+            fx=_last_valid_value(pandl_calculator.fx.values),
+            capital=_last_valid_value(pandl_calculator.capital.values),
+            roundpositions=pandl_calculator.roundpositions,
+            delayfill=pandl_calculator.delayfill,
+            curve_type=account_curve.curve_type,
+            is_percentage=account_curve.is_percentage,
+            **trade_costs,
+        )
+        incremental_curve._statistics = RunningCurveStatistics.from_values(
+            account_curve.values, times_per_year=account_curve.returns_scalar
+        )
+        incremental_curve._last_price = _last_valid_value(pandl_calculator.price.values)
+        incremental_curve._position_held = _last_valid_value(
+            pandl_calculator.positions.values
+        )
+        passed_positions = pandl_calculator._get_passed_positions()
+        if len(passed_positions):
+            incremental_curve._last_passed_position = passed_positions.values[-1]
+
+        return incremental_curve
+
+    def append(self, price: float, position: float) -> float:
+        """
+        Add a bar, returning its P&L; position is the position wanted from
+        this bar on
+        """
+        position_to_use = self._process_position(position)
+        pandl = self._pandl_in_base_currency(price, position_to_use)
+        self._statistics.update(pandl)
+
+        if not np.isnan(price):
+            self._last_price = price
+        if not np.isnan(position_to_use):
+            self._position_held = position_to_use
+
+        return pandl
+
+    def _process_position(self, position: float) -> float:
+        ## as ProfitAndLoss._process_positions, one bar at a time
+        if self.delayfill:
+            position_to_use = self._last_passed_position
+            self._last_passed_position = position
+        else:
+            position_to_use = position
+
+        if self.roundpositions:
+            position_to_use = np.round(position_to_use)
+
+        return position_to_use
+
+    def _pandl_in_base_currency(self, price: float, position_to_use: float) -> float:
+        pandl_in_points = 0.0
+        if self.curve_type != COSTS_CURVE:
+            ## missing prices and positions are zero P&L, as with the kernel
+            pandl_in_points += np.nan_to_num(
+                self._position_held * (price - self._last_price)
+            )
+        if self.curve_type != GROSS_CURVE:
+            pandl_in_points += self._trade_costs_in_points(price, position_to_use)
+
+        pandl = pandl_in_points * self._value_per_point * self._fx
+        if self.is_percentage:
+            pandl = 100.0 * pandl / self._capital
+
+        return pandl
+
+    def _trade_costs_in_points(self, price: float, position_to_use: float) -> float:
+        if np.isnan(position_to_use):
+            return 0.0
+        trade = position_to_use - np.nan_to_num(self._position_held)
+        if trade == 0.0:
+            return 0.0
+        fill_price = self._last_price if np.isnan(price) else price
+        cost_per_contract = (
+            self._commission_per_contract / self._value_per_point
+            + self._percentage_fee * abs(fill_price)
+            + self._spread_in_points / 2.0
+        )
+
+        return -abs(trade) * cost_per_contract
+
+    @property
+    def statistics(self) -> RunningCurveStatistics:
+        return self._statistics
+
+    @property
+    def curve_type(self) -> str:
+        return self._curve_type
+
+    @property
+    def is_percentage(self) -> bool:
+        return self._is_percentage
+
+    @property
+    def delayfill(self) -> bool:
+        return self._delayfill
+
+    @property
+    def roundpositions(self) -> bool:
+        return self._roundpositions
+
+
+def _divide(numerator: float, denominator: float) -> float:
+    if denominator == 0:
+        return np.nan
+
+    return numerator / denominator
+
+
+def _last_valid_value(values: np.ndarray) -> float:
+    valid_values = values[~np.isnan(values)]
+    if len(valid_values) == 0:
+        return np.nan
+
+    return valid_values[-1]
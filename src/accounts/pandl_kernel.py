@@ -0,0 +1,229 @@
+"""
+Array kernels for profit and loss calculations.
+
+Series are handled as int64 nanosecond timestamps plus float64 value buffers,
+so aligning prices and positions needs no intermediate DataFrames.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def index_as_int64(index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Nanosecond timestamps of a DatetimeIndex (UTC based when tz aware)
+    """
+    return index.as_unit("ns").asi8
+
+
+def int64_as_index(timestamps: np.ndarray, like: pd.DatetimeIndex) -> pd.DatetimeIndex:
+    """
+    Inverse of index_as_int64, keeping the timezone of `like`
+    """
+    index = pd.DatetimeIndex(timestamps.view("M8[ns]"))
+    if like.tz is not None:
+        index = index.tz_localize("UTC").tz_convert(like.tz)
+
+    return index
+
+
+def can_use_kernel(*series: pd.Series) -> bool:
+    """
+    The kernel needs datetime indexes without missing timestamps
+    """
+    return all(
+        isinstance(each_series.index, pd.DatetimeIndex)
+        and not each_series.index.hasnans
+        for each_series in series
+    )
+
+
+def sorted_timestamps_and_values(series: pd.Series) -> tuple:
+    """
+    Timestamps and float values of a series, stably sorted by time
+    """
+    timestamps = index_as_int64(series.index)
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    if len(timestamps) > 1 and not (np.diff(timestamps) >= 0).all():
+        order = np.argsort(timestamps, kind="stable")
+        timestamps = timestamps[order]
+        values = values[order]
+
+    return timestamps, values
+
+
+def ffill_align(
+    source_timestamps: np.ndarray,
+    source_values: np.ndarray,
+    target_timestamps: np.ndarray,
+    skip_nan: bool = False,
+) -> np.ndarray:
+    """
+    Value at or before each target timestamp, from sorted source timestamps.
+
+    With skip_nan=False this is reindex(method="ffill"); with skip_nan=True nans
+    in the source are also filled forward, as with a concat followed by ffill.
+    For duplicated source timestamps the last (valid) value wins. Values may
+    be 2-D (time x instrument), in which case each column is aligned.
+
+    >>> ffill_align(np.array([1, 3, 5]), np.array([1.0, np.nan, 5.0]), np.array([0, 3, 4, 6]))
+    array([nan, nan, nan,  5.])
+    >>> ffill_align(np.array([1, 3, 5]), np.array([1.0, np.nan, 5.0]), np.array([0, 3, 4, 6]), skip_nan=True)
+    array([nan,  1.,  1.,  5.])
+    """
+    source_location = (
+        np.searchsorted(source_timestamps, target_timestamps, side="right") - 1
+    )
+    if skip_nan:
+        return _values_at_last_valid(source_values, source_location)
+
+    if len(source_values) == 0:
+        return np.full((len(target_timestamps),) + source_values.shape[1:], np.nan)
+    aligned = source_values[np.clip(source_location, 0, None)]
+    found = _as_rows(source_location >= 0, aligned.ndim)
+
+    return np.where(found, aligned, np.nan)
+
+
+def reindex_values(
+    source_timestamps: np.ndarray,
+    source_values: np.ndarray,
+    target_timestamps: np.ndarray,
+) -> np.ndarray:
+    """
+    As reindex() without a fill method: nan where a target timestamp is not in
+    the (sorted) source timestamps
+
+    >>> reindex_values(np.array([1, 3, 5]), np.array([1.0, 3.0, 5.0]), np.array([0, 3, 4, 5]))
+    array([nan,  3., nan,  5.])
+    """
+    aligned = ffill_align(source_timestamps, source_values, target_timestamps)
+    if len(source_timestamps) == 0:
+        return aligned
+    source_location = (
+        np.searchsorted(source_timestamps, target_timestamps, side="right") - 1
+    )
+    exact_match = (source_location >= 0) & (
+        source_timestamps[np.clip(source_location, 0, None)] == target_timestamps
+    )
+
+    return np.where(_as_rows(exact_match, aligned.ndim), aligned, np.nan)
+
+
+def last_valid_location(values: np.ndarray) -> np.ndarray:
+    """
+    Location of the last non nan value at or before each element, -1 if none;
+    2-D values are handled column by column
+
+    >>> last_valid_location(np.array([np.nan, 1.0, np.nan, 2.0]))
+    array([-1,  1,  1,  3])
+    """
+    row_number = _as_rows(np.arange(len(values)), values.ndim)
+    locations = np.where(~np.isnan(values), row_number, -1)
+
+    return np.maximum.accumulate(locations, axis=0) if len(locations) else locations
+
+
+def ffill_values(values: np.ndarray) -> np.ndarray:
+    """
+    >>> ffill_values(np.array([np.nan, 1.0, np.nan, 2.0]))
+    array([nan,  1.,  1.,  2.])
+    """
+    if len(values) == 0:
+        return values
+    locations = last_valid_location(values)
+    filled = np.take_along_axis(values, np.clip(locations, 0, None), axis=0)
+
+    return np.where(locations >= 0, filled, np.nan)
+
+
+def bfill_values(values: np.ndarray) -> np.ndarray:
+    """
+    >>> bfill_values(np.array([np.nan, 1.0, np.nan, 2.0, np.nan]))
+    array([ 1.,  1.,  2.,  2., nan])
+    """
+    return ffill_values(values[::-1])[::-1]
+
+
+def points_pandl_kernel(
+    position_timestamps: np.ndarray,
+    positions: np.ndarray,
+    price_timestamps: np.ndarray,
+    prices: np.ndarray,
+) -> tuple:
+    """
+    Points P&L over the union of the (sorted) position and price timestamps:
+    the position held at the previous timestamp times the change in price,
+    with both filled forward and missing values counted as zero P&L. Positions
+    may be 2-D (time x column), with prices either 1-D or of the same shape.
+
+    :returns: (timestamps, pandl) as int64 and float64 arrays
+
+    >>> points_pandl_kernel(np.array([1, 2]), np.array([1.0, 2.0]), np.array([1, 2, 3]), np.array([10.0, 11.0, 13.0]))
+    (array([1, 2, 3]), array([0., 1., 4.]))
+    """
+    timestamps, position_location, price_location = merge_sorted_timestamps(
+        position_timestamps, price_timestamps
+    )
+    positions_aligned = _values_at_last_valid(positions, position_location)
+    prices_aligned = _values_at_last_valid(prices, price_location)
+    if positions_aligned.ndim > prices_aligned.ndim:
+        ## one price series shared by several columns of positions
+        prices_aligned = prices_aligned[:, np.newaxis]
+
+    pandl = np.zeros(np.broadcast_shapes(positions_aligned.shape, prices_aligned.shape))
+    if len(timestamps) > 1:
+        np.multiply(
+            positions_aligned[:-1], np.diff(prices_aligned, axis=0), out=pandl[1:]
+        )
+        pandl[np.isnan(pandl)] = 0.0
+
+    return timestamps, pandl
+
+
+def merge_sorted_timestamps(
+    first_timestamps: np.ndarray, second_timestamps: np.ndarray
+) -> tuple:
+    """
+    Sorted union of two sorted timestamp arrays, plus the location in each input
+    of the last element at or before every union timestamp (-1 if none).
+
+    A stable sort of two sorted runs is a linear merge, which is cheaper than
+    np.union1d followed by two binary searches.
+
+    >>> merge_sorted_timestamps(np.array([1, 3]), np.array([2, 3, 4]))
+    (array([1, 2, 3, 4]), array([0, 0, 1, 1]), array([-1,  0,  1,  2]))
+    """
+    combined = np.concatenate([first_timestamps, second_timestamps])
+    order = np.argsort(combined, kind="stable")
+    merged = combined[order]
+
+    from_first = order < len(first_timestamps)
+    first_location = np.cumsum(from_first) - 1
+    second_location = np.cumsum(~from_first) - 1
+
+    last_of_run = np.ones(len(merged), dtype=bool)
+    np.not_equal(merged[1:], merged[:-1], out=last_of_run[:-1])
+
+    return (
+        merged[last_of_run],
+        first_location[last_of_run],
+        second_location[last_of_run],
+    )
+
+
+def _values_at_last_valid(values: np.ndarray, location: np.ndarray) -> np.ndarray:
+    ## as ffill_align(skip_nan=True), given locations already found by a merge
+    if len(values) == 0:
+        return np.full((len(location),) + values.shape[1:], np.nan)
+    last_valid = last_valid_location(values)
+    found = _as_rows(location >= 0, values.ndim)
+    location = np.where(found, last_valid[np.clip(location, 0, None)], -1)
+    aligned = np.take_along_axis(values, np.clip(location, 0, None), axis=0)
+
+    return np.where(location >= 0, aligned, np.nan)
+
+
+def _as_rows(row_values: np.ndarray, ndim: int) -> np.ndarray:
+    ## shape a per row array to broadcast against (time x instrument) values
+    return row_values.reshape((-1,) + (1,) * (ndim - 1))
@@ -0,0 +1,536 @@
+"""
+Profit and loss for a panel of instruments.
+
+Prices, positions, fx and costs are (time x instrument) frames, so gross, costs
+and net P&L for a whole portfolio are calculated in one set of array operations
+instead of one ProfitAndLoss calculator per instrument.
+"""
+
+from typing import Union
+import numpy as np
+import pandas as pd
+from src.accounts.curve import AccountCurve
+from src.accounts.profit_and_loss import (
+    ProfitAndLoss,
+    ProfitAndLossWithSharpeRatioCosts,
+    SR_cost_per_period_kernel,
+    add_gross_and_costs_arrays,
+    apply_weighting,
+)
+from src.accounts.pandl_kernel import (
+    sorted_timestamps_and_values,
+    merge_sorted_timestamps,
+    points_pandl_kernel,
+    ffill_align,
+    int64_as_index,
+)
+from src.strategies.vol import robust_daily_vol_given_price_panel
+from src.strategies.vol_provider import VolatilityProvider
+from src.utils.references import (
+    Frequency,
+    DAILY_PRICE_FREQ,
+    from_config_frequency_pandas_resample,
+    arg_not_supplied,
+    curve_types,
+    NET_CURVE,
+    GROSS_CURVE,
+    COSTS_CURVE,
+    ROOT_BDAYS_INYEAR,
+)
+
+
+class PanelProfitAndLoss:
+    def __init__(
+        self,
+        price: pd.DataFrame,
+        positions: pd.DataFrame,
+        fx: pd.DataFrame = arg_not_supplied,
+        capital: Union[pd.Series, float] = arg_not_supplied,
+        value_per_point: Union[pd.Series, float] = 1.0,
+        roundpositions: bool = False,
+        delayfill: bool = False,
+    ):
+        self._price = price
+        self._positions = positions.reindex(columns=price.columns)
+        self._fx = fx
+        self._capital = capital
+        self._value_per_point = value_per_point
+        self._roundpositions = roundpositions
+        self._delayfill = delayfill
+        self._cache = {}
+
+    def _cached_calculation(self, cache_key: tuple, calculation):
+        try:
+            return self._cache[cache_key]
+        except KeyError:
+            result = calculation()
+            self._cache[cache_key] = result
+            return result
+
+    def account_curve(self, instrument: str, **kwargs) -> AccountCurve:
+        """
+        Account curve for one instrument, a view on the panel's calculations
+        """
+        return AccountCurve(PanelInstrumentProfitAndLoss(self, instrument), **kwargs)
+
+    def portfolio_account_curve(self, **kwargs) -> AccountCurve:
+        """
+        Account curve for the sum across all instruments
+        """
+        return AccountCurve(PanelPortfolioProfitAndLoss(self), **kwargs)
+
+    def weight(self, weight: pd.Series) -> "PanelProfitAndLoss":
+        """
+        Panel with every instrument's positions and the capital weighted, as
+        ProfitAndLoss.weight; like it, the positions weighted are the ones
+        already delayed and rounded
+        """
+        return PanelProfitAndLoss(
+            self.price,
+            _apply_weighting_to_frame(weight, self.positions),
+            fx=self._fx,
+            capital=apply_weighting(weight, self.capital),
+            value_per_point=self.value_per_point,
+            roundpositions=self.roundpositions,
+            delayfill=self.delayfill,
+        )
+
+    def instrument_calculator(self, instrument: str) -> ProfitAndLoss:
+        """
+        Single instrument calculator for one column of the panel
+        """
+        return ProfitAndLoss(**self._instrument_calculator_kwargs(instrument))
+
+    def _instrument_calculator_kwargs(self, instrument: str) -> dict:
+        value_per_point = self.value_per_point
+        if isinstance(value_per_point, pd.Series):
+            value_per_point = float(value_per_point[instrument])
+
+        return dict(
+            price=self.price[instrument],
+            positions=self._positions[instrument],
+            fx=arg_not_supplied
+            if self._fx is arg_not_supplied
+            else self.fx[instrument],
+            capital=self.capital,
+            value_per_point=value_per_point,
+            roundpositions=self.roundpositions,
+            delayfill=self.delayfill,
+            passed_diagnostic_df=arg_not_supplied,
+        )
+
+    def as_pd_frame_for_frequency(
+        self,
+        frequency: Frequency = DAILY_PRICE_FREQ,
+        percent: bool = False,
+        curve_type: str = NET_CURVE,
+    ) -> pd.DataFrame:
+        return self._cached_calculation(
+            ("as_pd_frame_for_frequency", frequency, percent, curve_type),
+            lambda: self.as_pd_frame(percent=percent, curve_type=curve_type)
+            .resample(from_config_frequency_pandas_resample(frequency))
+            .sum(),
+        )
+
+    def portfolio_pd_series_for_frequency(
+        self,
+        frequency: Frequency = DAILY_PRICE_FREQ,
+        percent: bool = False,
+        curve_type: str = NET_CURVE,
+    ) -> pd.Series:
+        return self._cached_calculation(
+            ("portfolio_pd_series_for_frequency", frequency, percent, curve_type),
+            lambda: self.as_pd_frame_for_frequency(
+                frequency, percent=percent, curve_type=curve_type
+            ).sum(axis=1),
+        )
+
+    def capital_as_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ
+    ) -> pd.Series:
+        resample_freq = from_config_frequency_pandas_resample(frequency)
+        return self.capital.resample(resample_freq).ffill()
+
+    def as_pd_frame(self, percent=False, curve_type=NET_CURVE) -> pd.DataFrame:
+        if curve_type not in curve_types:
+            raise Exception(
+                "Curve type %s not recognised! Must be one of %s"
+                % (curve_type, curve_types)
+            )
+
+        return self._cached_calculation(
+            ("as_pd_frame", percent, curve_type),
+            lambda: self._as_frame(
+                self._pandl_array(percent=percent, curve_type=curve_type)
+            ),
+        )
+
+    def _pandl_array(self, percent: bool, curve_type: str) -> np.ndarray:
+        if curve_type == NET_CURVE:
+            gross = self._pandl_array(percent=percent, curve_type=GROSS_CURVE)
+            costs = self._pandl_array(percent=percent, curve_type=COSTS_CURVE)
+            return add_gross_and_costs_arrays(gross, costs)
+
+        if curve_type == GROSS_CURVE:
+            in_points = self.pandl_in_points_array()
+        else:
+            in_points = self.costs_pandl_in_points_array()
+
+        in_base = in_points * self._value_per_point_array * self._fx_array
+        if percent:
+            return 100.0 * in_base / self._capital_array[:, np.newaxis]
+
+        return in_base
+
+    def pandl_in_points_array(self) -> np.ndarray:
+        return self._cached_calculation(
+            ("pandl_in_points_array",),
+            lambda: points_pandl_kernel(
+                self._position_timestamps,
+                self._position_values,
+                self._price_timestamps,
+                self._price_values,
+            )[1],
+        )
+
+    def costs_pandl_in_points_array(self) -> np.ndarray:
+        ## no costs; subclasses fill in the price timestamp rows
+        return np.zeros(self._pandl_shape)
+
+    def pandl_in_points(self) -> pd.DataFrame:
+        return self._as_frame(self.pandl_in_points_array())
+
+    def costs_pandl_in_points(self) -> pd.DataFrame:
+        return self._as_frame(self.costs_pandl_in_points_array())
+
+    def _as_frame(self, values: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(values, index=self.index, columns=self.instruments)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return self._cached_calculation(
+            ("index",),
+            lambda: int64_as_index(self._timestamps, like=self.price.index),
+        )
+
+    @property
+    def _pandl_shape(self) -> tuple:
+        return (len(self._timestamps), len(self.instruments))
+
+    @property
+    def _timestamps(self) -> np.ndarray:
+        return self._merged_timestamps[0]
+
+    @property
+    def _price_rows(self) -> np.ndarray:
+        ## rows of the union index that are price timestamps
+        return np.searchsorted(self._timestamps, self._price_timestamps)
+
+    @property
+    def _merged_timestamps(self) -> tuple:
+        return self._cached_calculation(
+            ("merged_timestamps",),
+            lambda: merge_sorted_timestamps(
+                self._position_timestamps, self._price_timestamps
+            ),
+        )
+
+    @property
+    def _price_timestamps(self) -> np.ndarray:
+        return self._sorted_price[0]
+
+    @property
+    def _price_values(self) -> np.ndarray:
+        return self._sorted_price[1]
+
+    @property
+    def _sorted_price(self) -> tuple:
+        return self._cached_calculation(
+            ("sorted_price",), lambda: sorted_timestamps_and_values(self.price)
+        )
+
+    @property
+    def _position_timestamps(self) -> np.ndarray:
+        return self._sorted_positions[0]
+
+    @property
+    def _position_values(self) -> np.ndarray:
+        return self._sorted_positions[1]
+
+    @property
+    def _sorted_positions(self) -> tuple:
+        return self._cached_calculation(
+            ("sorted_positions",),
+            lambda: sorted_timestamps_and_values(self.positions),
+        )
+
+    @property
+    def _fx_array(self) -> np.ndarray:
+        return self._cached_calculation(
+            ("fx_array",), lambda: self._aligned_to_index(self.fx)
+        )
+
+    @property
+    def _capital_array(self) -> np.ndarray:
+        return self._cached_calculation(
+            ("capital_array",), lambda: self._aligned_to_index(self.capital)
+        )
+
+    def _aligned_to_index(self, data: Union[pd.Series, pd.DataFrame]) -> np.ndarray:
+        ## as reindex(index, method="ffill")
+        timestamps, values = sorted_timestamps_and_values(data)
+        return ffill_align(timestamps, values, self._timestamps)
+
+    @property
+    def _value_per_point_array(self) -> Union[np.ndarray, float]:
+        value_per_point = self.value_per_point
+        if isinstance(value_per_point, pd.Series):
+            return value_per_point.reindex(self.instruments).to_numpy(dtype=float)
+
+        return float(value_per_point)
+
+    @property
+    def instruments(self) -> pd.Index:
+        return self.price.columns
+
+    @property
+    def price(self) -> pd.DataFrame:
+        return self._price
+
+    @property
+    def positions(self) -> pd.DataFrame:
+        positions = self._positions
+        if self.delayfill:
+            positions = positions.shift(1)
+        if self.roundpositions:
+            positions = positions.round()
+
+        return positions
+
+    @property
+    def length_in_months(self) -> pd.Series:
+        positions_monthly = self.positions.resample("1M").last()
+
+        return positions_monthly.ffill().notna().sum()
+
+    @property
+    def fx(self) -> pd.DataFrame:
+        fx = self._fx
+        if fx is arg_not_supplied:
+            fx = pd.DataFrame(1.0, index=self.price.index, columns=self.instruments)
+
+        return fx.reindex(columns=self.instruments)
+
+    @property
+    def capital(self) -> pd.Series:
+        capital = self._capital
+        if capital is arg_not_supplied:
+            capital = 1.0
+
+        if type(capital) is float or type(capital) is int:
+            capital = pd.Series(float(capital), index=self.price.index)
+
+        return capital
+
+    @property
+    def value_per_point(self) -> Union[pd.Series, float]:
+        return self._value_per_point
+
+    @property
+    def delayfill(self) -> bool:
+        return self._delayfill
+
+    @property
+    def roundpositions(self) -> bool:
+        return self._roundpositions
+
+
+class PanelProfitAndLossWithSharpeRatioCosts(PanelProfitAndLoss):
+    def __init__(
+        self,
+        *args,
+        SR_cost: Union[pd.Series, float],
+        average_position: pd.DataFrame,
+        daily_returns_volatility: pd.DataFrame = arg_not_supplied,
+        vol_provider: VolatilityProvider = arg_not_supplied,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._SR_cost = SR_cost
+        self._average_position = average_position.reindex(columns=self.instruments)
+        self._daily_returns_volatility = daily_returns_volatility
+        self._vol_provider = vol_provider
+
+    def weight(self, weight: pd.Series) -> "PanelProfitAndLossWithSharpeRatioCosts":
+        return PanelProfitAndLossWithSharpeRatioCosts(
+            self.price,
+            _apply_weighting_to_frame(weight, self.positions),
+            fx=self._fx,
+            capital=apply_weighting(weight, self.capital),
+            value_per_point=self.value_per_point,
+            roundpositions=self.roundpositions,
+            delayfill=self.delayfill,
+            SR_cost=self.SR_cost,
+            average_position=_apply_weighting_to_frame(weight, self.average_position),
+            daily_returns_volatility=self.daily_returns_volatility,
+            vol_provider=self.vol_provider,
+        )
+
+    def instrument_calculator(
+        self, instrument: str
+    ) -> ProfitAndLossWithSharpeRatioCosts:
+        SR_cost = self.SR_cost
+        if isinstance(SR_cost, pd.Series):
+            SR_cost = float(SR_cost[instrument])
+        daily_returns_volatility = self.daily_returns_volatility
+        if daily_returns_volatility is not arg_not_supplied:
+            daily_returns_volatility = daily_returns_volatility[instrument]
+
+        return ProfitAndLossWithSharpeRatioCosts(
+            SR_cost=SR_cost,
+            average_position=self.average_position[instrument],
+            daily_returns_volatility=daily_returns_volatility,
+            vol_provider=self.vol_provider,
+            **self._instrument_calculator_kwargs(instrument),
+        )
+
+    def costs_pandl_in_points_array(self) -> np.ndarray:
+        return self._cached_calculation(
+            ("costs_pandl_in_points_array",), self._costs_pandl_in_points_array
+        )
+
+    def _costs_pandl_in_points_array(self) -> np.ndarray:
+        vol_timestamps, annualised_vol = sorted_timestamps_and_values(
+            self.daily_price_volatility_points
+        )
+        annualised_vol = annualised_vol * ROOT_BDAYS_INYEAR
+        average_position_timestamps, average_position = sorted_timestamps_and_values(
+            self.average_position
+        )
+        average_position_aligned_to_vol = ffill_align(
+            average_position_timestamps, average_position, vol_timestamps
+        )
+        SR_cost_as_annualised_figure = (
+            -self._SR_cost_array * average_position_aligned_to_vol * annualised_vol
+        )
+
+        SR_cost_per_period = SR_cost_per_period_kernel(
+            self._position_timestamps,
+            self._position_values,
+            SR_cost_timestamps=vol_timestamps,
+            SR_cost_values=SR_cost_as_annualised_figure,
+            price_timestamps=self._price_timestamps,
+        )
+
+        costs = np.full(self._pandl_shape, np.nan)
+        costs[self._price_rows] = SR_cost_per_period
+
+        return costs
+
+    @property
+    def _SR_cost_array(self) -> Union[np.ndarray, float]:
+        SR_cost = self.SR_cost
+        if isinstance(SR_cost, pd.Series):
+            return SR_cost.reindex(self.instruments).to_numpy(dtype=float)
+
+        return float(SR_cost)
+
+    @property
+    def daily_price_volatility_points(self) -> pd.DataFrame:
+        daily_price_volatility = self.daily_returns_volatility
+        if daily_price_volatility is arg_not_supplied:
+            if self.vol_provider is arg_not_supplied:
+                daily_price_volatility = robust_daily_vol_given_price_panel(self.price)
+            else:
+                daily_price_volatility = (
+                    self.vol_provider.robust_daily_vol_given_price_panel(self.price)
+                )
+
+        return daily_price_volatility.reindex(columns=self.instruments)
+
+    @property
+    def daily_returns_volatility(self) -> pd.DataFrame:
+        return self._daily_returns_volatility
+
+    @property
+    def vol_provider(self) -> VolatilityProvider:
+        return self._vol_provider
+
+    @property
+    def SR_cost(self) -> Union[pd.Series, float]:
+        return self._SR_cost
+
+    @property
+    def average_position(self) -> pd.DataFrame:
+        return self._average_position
+
+
+class PanelInstrumentProfitAndLoss:
+    """
+    One instrument of a panel, in the form AccountCurve expects from a
+    P&L calculator. Series are copies of columns of the panel's frames.
+    """
+
+    def __init__(self, panel: PanelProfitAndLoss, instrument: str):
+        self._panel = panel
+        self._instrument = instrument
+
+    def as_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
+    ) -> pd.Series:
+        ## a copy, so changing the curve can't change the panel's cache
+        return self.panel.as_pd_frame_for_frequency(frequency, **kwargs)[
+            self.instrument
+        ].copy()
+
+    def capital_as_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ
+    ) -> pd.Series:
+        return self.panel.capital_as_pd_series_for_frequency(frequency)
+
+    def weight(self, weight: pd.Series):
+        ## weighting one instrument doesn't need the rest of the panel
+        return self.panel.instrument_calculator(self.instrument).weight(weight)
+
+    @property
+    def length_in_months(self) -> int:
+        return int(self.panel.length_in_months[self.instrument])
+
+    @property
+    def panel(self) -> PanelProfitAndLoss:
+        return self._panel
+
+    @property
+    def instrument(self) -> str:
+        return self._instrument
+
+
+class PanelPortfolioProfitAndLoss(PanelInstrumentProfitAndLoss):
+    """
+    Sum across every instrument of a panel, in the form AccountCurve expects
+    """
+
+    def __init__(self, panel: PanelProfitAndLoss):
+        super().__init__(panel, instrument=None)
+
+    def as_pd_series_for_frequency(
+        self, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
+    ) -> pd.Series:
+        ## a copy, so changing the curve can't change the panel's cache
+        return self.panel.portfolio_pd_series_for_frequency(frequency, **kwargs).copy()
+
+    def weight(self, weight: pd.Series):
+        return PanelPortfolioProfitAndLoss(self.panel.weight(weight))
+
+    @property
+    def length_in_months(self) -> int:
+        return int(self.panel.length_in_months.max())
+
+
+def _apply_weighting_to_frame(
+    weight: pd.Series, thing_to_weight: pd.DataFrame
+) -> pd.DataFrame:
+    ## apply_weighting for every column of a frame
+    aligned_weight = weight.reindex(thing_to_weight.index).ffill()
+
+    return thing_to_weight.mul(aligned_weight, axis=0)
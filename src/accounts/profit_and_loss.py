@@ -1,10 +1,14 @@
+import functools
+import numpy as np
 import pandas as pd
 from src.utils.references import (
     Frequency,
     DAILY_PRICE_FREQ,
     from_config_frequency_pandas_resample,
+    from_frequency_to_times_per_year,
     arg_not_supplied,
     SECONDS_IN_YEAR,
+    UNIXTIME_IN_YEAR,
     ROOT_BDAYS_INYEAR,
     curve_types,
     NET_CURVE,
@@ -12,7 +16,21 @@ from src.utils.references import (
     COSTS_CURVE,
 )
 from src.strategies.vol import robust_daily_vol_given_price
+from src.strategies.vol_provider import VolatilityProvider
+from src.accounts.pandl_kernel import (
+    can_use_kernel,
+    sorted_timestamps_and_values,
+    points_pandl_kernel,
+    ffill_align,
+    bfill_values,
+    ffill_values,
+    reindex_values,
+    int64_as_index,
+    index_as_int64,
+)
+from src.accounts.curve_stats import calculate_curve_statistics
 from src.utils.exceptions import MissingData
+from src.utils.result_cache import ResultCache, hash_for_cache
 
 from src.utils.references import (
     ARBITRARY_FORECAST_ANNUAL_RISK_TARGET_PERCENTAGE,
@@ -22,6 +40,22 @@ from src.utils.references import (
 )
 
 
+def memoized_calculation(method):
+    """
+    Cache the result of a calculator method (or property) until the
+    calculator's inputs change. Cached series are shared, so treat them as
+    read only.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self):
+        return self._cached_calculation(
+            (method.__qualname__,), functools.partial(method, self)
+        )
+
+    return wrapper
+
+
 class ProfitAndLoss:
     def __init__(
         self,
@@ -33,6 +67,7 @@ class ProfitAndLoss:
         roundpositions: bool,  # init False
         delayfill: bool,  # init False
         passed_diagnostic_df: pd.DataFrame,
+        result_cache: ResultCache = arg_not_supplied,
     ):
         self._price = price
         self._positions = positions
@@ -42,6 +77,49 @@ class ProfitAndLoss:
         self._passed_diagnostic_df = passed_diagnostic_df
         self._delayfill = delayfill
         self._roundpositions = roundpositions
+        self._result_cache = result_cache
+        self._cache = {}
+
+    def _cached_calculation(self, cache_key: tuple, calculation):
+        ## results are shared between every curve derived from this calculator
+        try:
+            return self._cache[cache_key]
+        except KeyError:
+            result = calculation()
+            self._cache[cache_key] = result
+            return result
+
+    def _invalidate_cache(self):
+        self._cache = {}
+
+    def _stored_calculation(self, cache_key: tuple, calculation):
+        ## as _cached_calculation, and also kept on disk between runs when
+        ## we have a result cache
+        if self.result_cache is arg_not_supplied:
+            return self._cached_calculation(cache_key, calculation)
+
+        stored_key = hash_for_cache(self.inputs_fingerprint(), cache_key)
+
+        return self._cached_calculation(
+            cache_key,
+            lambda: self.result_cache.get_or_calculate(stored_key, calculation),
+        )
+
+    @memoized_calculation
+    def inputs_fingerprint(self) -> str:
+        return hash_for_cache(type(self).__name__, self._fingerprint_items())
+
+    def _fingerprint_items(self) -> tuple:
+        ## everything the P&L depends on; extended by calculators with costs
+        return (
+            self.price,
+            self._positions,
+            self._fx,
+            self._capital,
+            self.value_per_point,
+            self.roundpositions,
+            self.delayfill,
+        )
 
     def calculations_and_diagnostic_df(self) -> pd.DataFrame:
         diagnostic_df = self.passed_diagnostic_df
@@ -68,11 +146,20 @@ class ProfitAndLoss:
             roundpositions=self.roundpositions,
             delayfill=self.delayfill,
             passed_diagnostic_df=self._passed_diagnostic_df,
+            result_cache=self.result_cache,
         )
 
     def capital_as_pd_series_for_frequency(
         self, frequency: Frequency = DAILY_PRICE_FREQ
     ) -> pd.Series:
+        capital_at_frequency = self._stored_calculation(
+            ("capital_as_pd_series_for_frequency", frequency),
+            lambda: self._capital_as_pd_series_for_frequency(frequency),
+        )
+
+        return capital_at_frequency.copy()
+
+    def _capital_as_pd_series_for_frequency(self, frequency: Frequency) -> pd.Series:
         capital = self.capital
         resample_freq = from_config_frequency_pandas_resample(frequency)
         capital_at_frequency = capital.resample(resample_freq).ffill()
@@ -82,22 +169,140 @@ class ProfitAndLoss:
     def as_pd_series_for_frequency(
         self, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
     ) -> pd.Series:
-        as_pd_series = self.as_pd_series(**kwargs)
+        ## keyed on eg (frequency, curve_type, percent); a weighted calculator
+        ## is a different object so has its own cache
+        pd_series_at_frequency = self._stored_calculation(
+            ("as_pd_series_for_frequency", frequency, _cache_key_for_kwargs(kwargs)),
+            lambda: self._as_pd_series_for_frequency(frequency, **kwargs),
+        )
+
+        return pd_series_at_frequency.copy()
+
+    def _as_pd_series_for_frequency(self, frequency: Frequency, **kwargs) -> pd.Series:
+        as_pd_series = self._cached_as_pd_series(**kwargs)
 
         ## FIXME: Ugly to get pandas 2.x working
-        as_pd_series.index = pd.to_datetime(as_pd_series.index)
+        as_pd_series = as_pd_series.set_axis(pd.to_datetime(as_pd_series.index))
 
         resample_freq = from_config_frequency_pandas_resample(frequency)
         pd_series_at_frequency = as_pd_series.resample(resample_freq).sum()
 
         return pd_series_at_frequency
 
+    def _cached_as_pd_series(self, **kwargs) -> pd.Series:
+        ## the un-resampled series is shared across every frequency
+        return self._cached_calculation(
+            ("as_pd_series", _cache_key_for_kwargs(kwargs)),
+            lambda: self.as_pd_series(**kwargs),
+        )
+
     def as_pd_series(self, percent=False):
         if percent:
             return self.percentage_pandl()
         else:
             return self.pandl_in_base_currency()
 
+    def bulk_weighting_stats(
+        self, weights: pd.DataFrame, frequency: Frequency = DAILY_PRICE_FREQ, **kwargs
+    ) -> pd.DataFrame:
+        """
+        Annualised mean, standard deviation and Sharpe ratio of the weighted
+        P&L for each column of candidate weights, in one pass and without
+        building a calculator per candidate.
+
+        Weights apply to the positions held, ie after any delayfill or
+        rounding, and the weighted positions aren't delayed or rounded again.
+        weight() does process its weighted positions again, so this matches
+        AccountCurve(self.weight(weights[column])) only with delayfill and
+        roundpositions off; otherwise it matches weight() on a calculator
+        given self.positions with both off.
+        """
+        weighted_pandl = self.weighted_pandl_frame(weights, **kwargs)
+        resample_freq = from_config_frequency_pandas_resample(frequency)
+        weighted_pandl_at_frequency = weighted_pandl.resample(resample_freq).sum()
+        curve_statistics = calculate_curve_statistics(
+            weighted_pandl_at_frequency.values,
+            times_per_year=from_frequency_to_times_per_year(frequency),
+        )
+
+        return pd.DataFrame(
+            dict(
+                ann_mean=curve_statistics.ann_mean,
+                ann_std=curve_statistics.ann_std,
+                sharpe=curve_statistics.sharpe,
+            ),
+            index=weights.columns,
+        )
+
+    def weighted_pandl_frame(
+        self, weights: pd.DataFrame, percent=False
+    ) -> pd.DataFrame:
+        """
+        P&L in base currency (or percent of weighted capital) with one column
+        per column of candidate weights
+        """
+        timestamps, weighted_pandl_in_points = self._weighted_pandl_in_points(weights)
+        weighted_pandl = self._weighted_points_to_base_pandl(
+            timestamps, weighted_pandl_in_points, weights=weights, percent=percent
+        )
+
+        return self._weighted_pandl_as_frame(timestamps, weighted_pandl, weights)
+
+    def _weighted_pandl_in_points(self, weights: pd.DataFrame) -> tuple:
+        if not can_use_kernel(self.price, self.positions, weights):
+            raise Exception("Bulk weighting needs datetime indexed inputs")
+
+        position_timestamps, weighted_positions = self._weighted_positions(weights)
+        price_timestamps, price_values = sorted_timestamps_and_values(self.price)
+
+        return points_pandl_kernel(
+            position_timestamps, weighted_positions, price_timestamps, price_values
+        )
+
+    def _weighted_positions(self, weights: pd.DataFrame) -> tuple:
+        position_timestamps, position_values = sorted_timestamps_and_values(
+            self.positions
+        )
+        weights_aligned = _weights_aligned_to_timestamps(weights, position_timestamps)
+
+        return position_timestamps, position_values[:, np.newaxis] * weights_aligned
+
+    def _weighted_points_to_base_pandl(
+        self,
+        timestamps: np.ndarray,
+        weighted_pandl_in_points: np.ndarray,
+        weights: pd.DataFrame,
+        percent: bool,
+    ) -> np.ndarray:
+        ## same steps as pandl_in_base_currency and percentage_pandl
+        fx_timestamps, fx_values = sorted_timestamps_and_values(self.fx)
+        fx_aligned = ffill_align(fx_timestamps, fx_values, timestamps)
+        weighted_pandl = (
+            weighted_pandl_in_points * self.value_per_point * fx_aligned[:, np.newaxis]
+        )
+        if not percent:
+            return weighted_pandl
+
+        capital_timestamps, capital_values = sorted_timestamps_and_values(self.capital)
+        weighted_capital = capital_values[
+            :, np.newaxis
+        ] * _weights_aligned_to_timestamps(weights, capital_timestamps)
+        weighted_capital_aligned = ffill_align(
+            capital_timestamps, weighted_capital, timestamps
+        )
+
+        return 100.0 * weighted_pandl / weighted_capital_aligned
+
+    def _weighted_pandl_as_frame(
+        self, timestamps: np.ndarray, weighted_pandl: np.ndarray, weights: pd.DataFrame
+    ) -> pd.DataFrame:
+        return pd.DataFrame(
+            weighted_pandl,
+            index=int64_as_index(timestamps, like=self.price.index),
+            columns=weights.columns,
+        )
+
+    @memoized_calculation
     def percentage_pandl(self) -> pd.Series:
         pandl_in_base = self.pandl_in_base_currency()
 
@@ -114,6 +319,7 @@ class ProfitAndLoss:
 
         return 100.0 * pandl_in_base / capital_aligned
 
+    @memoized_calculation
     def pandl_in_base_currency(self) -> pd.Series:
         pandl_in_ccy = self.pandl_in_instrument_currency()
         pandl_in_base = self._base_pandl_given_currency_pandl(pandl_in_ccy)
@@ -126,6 +332,7 @@ class ProfitAndLoss:
 
         return pandl_in_ccy * fx_aligned
 
+    @memoized_calculation
     def pandl_in_instrument_currency(self) -> pd.Series:
         pandl_in_points = self.pandl_in_points()
         pandl_in_ccy = self._pandl_in_instrument_ccy_given_points_pandl(pandl_in_points)
@@ -139,6 +346,7 @@ class ProfitAndLoss:
 
         return pandl_in_points * point_size
 
+    @memoized_calculation
     def pandl_in_points(self) -> pd.Series:
         # print(f"positions: \n{self.positions}")
         # print(self.positions.describe())
@@ -151,7 +359,13 @@ class ProfitAndLoss:
     def price(self) -> pd.Series:
         return self._price
 
+    @price.setter
+    def price(self, price: pd.Series):
+        self._price = price
+        self._invalidate_cache()
+
     @property
+    @memoized_calculation
     def length_in_months(self) -> int:
         positions_monthly = self.positions.resample("1M").last()
         positions_ffill = positions_monthly.ffill()
@@ -160,6 +374,7 @@ class ProfitAndLoss:
         return len(positions_no_nans.index)
 
     @property
+    @memoized_calculation
     def positions(self) -> pd.Series:
         positions = self._get_passed_positions()
         if positions is arg_not_supplied:
@@ -169,6 +384,11 @@ class ProfitAndLoss:
 
         return positions_to_use
 
+    @positions.setter
+    def positions(self, positions: pd.Series):
+        self._positions = positions
+        self._invalidate_cache()
+
     def _process_positions(self, positions: pd.Series) -> pd.Series:
         if self.delayfill:
             positions_to_use = positions.shift(1)
@@ -185,6 +405,10 @@ class ProfitAndLoss:
 
         return positions
 
+    @property
+    def result_cache(self) -> ResultCache:
+        return self._result_cache
+
     @property
     def delayfill(self) -> bool:
         return self._delayfill
@@ -197,6 +421,11 @@ class ProfitAndLoss:
     def value_per_point(self) -> float:
         return self._value_per_point
 
+    @value_per_point.setter
+    def value_per_point(self, value_per_point: float):
+        self._value_per_point = value_per_point
+        self._invalidate_cache()
+
     @property
     def passed_diagnostic_df(self) -> pd.DataFrame:
         diagnostic_df = self._passed_diagnostic_df
@@ -210,15 +439,22 @@ class ProfitAndLoss:
         return diagnostic_df
 
     @property
+    @memoized_calculation
     def fx(self) -> pd.Series:
         fx = self._fx
         if fx is arg_not_supplied:
             price_index = self.price.index
-            fx = pd.Series([1.0] * len(price_index), price_index)
+            fx = pd.Series(1.0, index=price_index)
 
         return fx
 
+    @fx.setter
+    def fx(self, fx: pd.Series):
+        self._fx = fx
+        self._invalidate_cache()
+
     @property
+    @memoized_calculation
     def capital(self) -> pd.Series:
         capital = self._capital
         if capital is arg_not_supplied:
@@ -226,15 +462,33 @@ class ProfitAndLoss:
 
         if type(capital) is float or type(capital) is int:
             align_index = self._index_to_align_capital_to
-            capital = pd.Series([capital] * len(align_index), align_index)
+            capital = pd.Series(capital, index=align_index)
 
         return capital
 
+    @capital.setter
+    def capital(self, capital: pd.Series):
+        self._capital = capital
+        self._invalidate_cache()
+
     @property
     def _index_to_align_capital_to(self):
         return self.price.index
 
 
+def _weights_aligned_to_timestamps(
+    weights: pd.DataFrame, timestamps: np.ndarray
+) -> np.ndarray:
+    ## as weight.reindex(thing_to_weight.index).ffill() in apply_weighting
+    weight_timestamps, weight_values = sorted_timestamps_and_values(weights)
+
+    return ffill_values(reindex_values(weight_timestamps, weight_values, timestamps))
+
+
+def _cache_key_for_kwargs(kwargs: dict) -> tuple:
+    return tuple(sorted(kwargs.items()))
+
+
 def apply_weighting(weight: pd.Series, thing_to_weight: pd.Series) -> pd.Series:
     aligned_weight = weight.reindex(thing_to_weight.index).ffill()
     weighted_thing = thing_to_weight * aligned_weight
@@ -243,6 +497,20 @@ def apply_weighting(weight: pd.Series, thing_to_weight: pd.Series) -> pd.Series:
 
 
 def calculate_pandl(positions: pd.Series, prices: pd.Series):
+    if not can_use_kernel(positions, prices):
+        return calculate_pandl_with_pandas(positions=positions, prices=prices)
+
+    position_timestamps, position_values = sorted_timestamps_and_values(positions)
+    price_timestamps, price_values = sorted_timestamps_and_values(prices)
+    timestamps, returns = points_pandl_kernel(
+        position_timestamps, position_values, price_timestamps, price_values
+    )
+
+    return pd.Series(returns, index=int64_as_index(timestamps, like=prices.index))
+
+
+def calculate_pandl_with_pandas(positions: pd.Series, prices: pd.Series):
+    ## reference implementation of calculate_pandl, used for non datetime indexes
     pos_series = positions.groupby(positions.index).last()
     both_series = pd.concat([pos_series, prices], axis=1)
     both_series.columns = ["positions", "prices"]
@@ -270,14 +538,16 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
             roundpositions=self.roundpositions,
             delayfill=self.delayfill,
             passed_diagnostic_df=None,
+            result_cache=self.result_cache,
         )
 
     def as_pd_series(self, percent=False, curve_type=NET_CURVE):
         if curve_type == NET_CURVE:
-            if percent:
-                return self.net_percentage_pandl()
-            else:
-                return self.net_pandl_in_base_currency()
+            ## same as net_percentage_pandl / net_pandl_in_base_currency, but
+            ## reusing any gross and costs series already calculated
+            gross = self._cached_as_pd_series(percent=percent, curve_type=GROSS_CURVE)
+            costs = self._cached_as_pd_series(percent=percent, curve_type=COSTS_CURVE)
+            return _add_gross_and_costs(gross, costs)
 
         elif curve_type == GROSS_CURVE:
             if percent:
@@ -296,6 +566,7 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
                 % (curve_type, curve_types)
             )
 
+    @memoized_calculation
     def net_percentage_pandl(self) -> pd.Series:
         gross = self.percentage_pandl()
         costs = self.costs_percentage_pandl()
@@ -303,6 +574,7 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
 
         return net
 
+    @memoized_calculation
     def net_pandl_in_base_currency(self) -> pd.Series:
         gross = self.pandl_in_base_currency()
         costs = self.costs_pandl_in_base_currency()
@@ -310,6 +582,7 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
 
         return net
 
+    @memoized_calculation
     def net_pandl_in_instrument_currency(self) -> pd.Series:
         gross = self.pandl_in_instrument_currency()
         costs = self.costs_pandl_in_instrument_currency()
@@ -317,6 +590,7 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
 
         return net
 
+    @memoized_calculation
     def net_pandl_in_points(self) -> pd.Series:
         gross = self.pandl_in_points()
         costs = self.costs_pandl_in_points()
@@ -324,18 +598,21 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
 
         return net
 
+    @memoized_calculation
     def costs_percentage_pandl(self) -> pd.Series:
         costs_in_base = self.costs_pandl_in_base_currency()
         costs = self._percentage_pandl_given_pandl(costs_in_base)
 
         return costs
 
+    @memoized_calculation
     def costs_pandl_in_base_currency(self) -> pd.Series:
         costs_in_instr_ccy = self.costs_pandl_in_instrument_currency()
         costs_in_base = self._base_pandl_given_currency_pandl(costs_in_instr_ccy)
 
         return costs_in_base
 
+    @memoized_calculation
     def costs_pandl_in_instrument_currency(self) -> pd.Series:
         costs_in_points = self.costs_pandl_in_points()
         costs_in_instr_ccy = self._pandl_in_instrument_ccy_given_points_pandl(
@@ -347,6 +624,48 @@ class ProfitAndLossWithGenericCosts(ProfitAndLoss):
     def costs_pandl_in_points(self) -> pd.Series:
         raise NotImplementedError
 
+    def weighted_pandl_frame(
+        self, weights: pd.DataFrame, percent=False, curve_type=NET_CURVE
+    ) -> pd.DataFrame:
+        if curve_type not in curve_types:
+            raise Exception(
+                "Curve type %s not recognised! Must be one of %s"
+                % (curve_type, curve_types)
+            )
+
+        timestamps, weighted_pandl_in_points = self._weighted_pandl_in_points(weights)
+        gross = self._weighted_points_to_base_pandl(
+            timestamps, weighted_pandl_in_points, weights=weights, percent=percent
+        )
+        if curve_type == GROSS_CURVE:
+            return self._weighted_pandl_as_frame(timestamps, gross, weights)
+
+        ## costs are on the price or position index, either of which is a
+        ## subset of the P&L timestamps
+        (
+            costs_timestamps,
+            weighted_costs_in_points,
+        ) = self._weighted_costs_pandl_in_points(weights)
+        costs_in_points = np.full(gross.shape, np.nan)
+        costs_in_points[
+            np.searchsorted(timestamps, costs_timestamps)
+        ] = weighted_costs_in_points
+        costs = self._weighted_points_to_base_pandl(
+            timestamps, costs_in_points, weights=weights, percent=percent
+        )
+        if curve_type == COSTS_CURVE:
+            return self._weighted_pandl_as_frame(timestamps, costs, weights)
+
+        net = add_gross_and_costs_arrays(gross, costs)
+
+        return self._weighted_pandl_as_frame(timestamps, net, weights)
+
+    def _weighted_costs_pandl_in_points(self, weights: pd.DataFrame) -> tuple:
+        ## returns (sorted timestamps, costs with one column per weight)
+        raise NotImplementedError(
+            "Bulk weighting of costs is not supported by %s" % type(self).__name__
+        )
+
 
 def _add_gross_and_costs(gross: pd.Series, costs: pd.Series):
     net = gross.add(costs, fill_value=0)
@@ -354,6 +673,18 @@ def _add_gross_and_costs(gross: pd.Series, costs: pd.Series):
     return net
 
 
+def add_gross_and_costs_arrays(gross: np.ndarray, costs: np.ndarray) -> np.ndarray:
+    """
+    Array version of _add_gross_and_costs: nan only where both are nan
+
+    >>> add_gross_and_costs_arrays(np.array([1.0, np.nan, 1.0, np.nan]), np.array([-0.5, -0.5, np.nan, np.nan]))
+    array([ 0.5, -0.5,  1. ,  nan])
+    """
+    return np.where(
+        np.isnan(gross), costs, np.where(np.isnan(costs), gross, gross + costs)
+    )
+
+
 class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
     def __init__(
         self,
@@ -361,12 +692,14 @@ class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
         SR_cost: float,
         average_position: pd.Series,
         daily_returns_volatility: pd.Series = arg_not_supplied,
+        vol_provider: VolatilityProvider = arg_not_supplied,
         **kwargs,
     ):
         ## Is SR_cost a negative number?
         super().__init__(*args, **kwargs)
         self._SR_cost = SR_cost
         self._daily_returns_volatility = daily_returns_volatility
+        self._vol_provider = vol_provider
         self._average_position = average_position
 
     def weight(self, weight: pd.Series):
@@ -383,11 +716,22 @@ class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
             fx=self.fx,
             SR_cost=self._SR_cost,
             daily_returns_volatility=self.daily_returns_volatility,
+            vol_provider=self.vol_provider,
             value_per_point=self.value_per_point,
             roundpositions=self.roundpositions,
             delayfill=self.delayfill,
+            passed_diagnostic_df=self._passed_diagnostic_df,
+            result_cache=self.result_cache,
         )
 
+    def _fingerprint_items(self) -> tuple:
+        return super()._fingerprint_items() + (
+            self.SR_cost,
+            self.average_position,
+            self.daily_returns_volatility,
+        )
+
+    @memoized_calculation
     def costs_pandl_in_points(self) -> pd.Series:
         SR_cost_as_annualised_figure = self.SR_cost_as_annualised_figure_points()
 
@@ -404,6 +748,41 @@ class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
 
         return SR_cost_per_period
 
+    def _weighted_costs_pandl_in_points(self, weights: pd.DataFrame) -> tuple:
+        ## as costs_pandl_in_points on self.weight(), for every column at once
+        position_timestamps, weighted_positions = self._weighted_positions(weights)
+        (
+            average_position_timestamps,
+            average_position_values,
+        ) = sorted_timestamps_and_values(self.average_position)
+        weighted_average_position = average_position_values[
+            :, np.newaxis
+        ] * _weights_aligned_to_timestamps(weights, average_position_timestamps)
+
+        annualised_price_vol_points = self.annualised_price_volatility_points()
+        vol_timestamps, vol_values = sorted_timestamps_and_values(
+            annualised_price_vol_points
+        )
+        weighted_average_position_aligned_to_vol = ffill_align(
+            average_position_timestamps, weighted_average_position, vol_timestamps
+        )
+        SR_cost_as_annualised_figure = (
+            -self.SR_cost
+            * weighted_average_position_aligned_to_vol
+            * vol_values[:, np.newaxis]
+        )
+
+        price_timestamps = index_as_int64(self.price.index)
+        SR_cost_per_period = SR_cost_per_period_kernel(
+            position_timestamps,
+            weighted_positions,
+            SR_cost_timestamps=vol_timestamps,
+            SR_cost_values=SR_cost_as_annualised_figure,
+            price_timestamps=price_timestamps,
+        )
+
+        return price_timestamps, SR_cost_per_period
+
     def SR_cost_as_annualised_figure_points(self) -> pd.Series:
         SR_cost_with_minus_sign = -self.SR_cost
         annualised_price_vol_points_for_an_average_position = (
@@ -429,17 +808,25 @@ class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
         return self.daily_price_volatility_points * ROOT_BDAYS_INYEAR
 
     @property
+    @memoized_calculation
     def daily_price_volatility_points(self) -> pd.Series:
         daily_price_volatility = self.daily_returns_volatility
-        if daily_price_volatility is arg_not_supplied:
-            daily_price_volatility = robust_daily_vol_given_price(self.price)
+        if daily_price_volatility is not arg_not_supplied:
+            return daily_price_volatility
 
-        return daily_price_volatility
+        if self.vol_provider is arg_not_supplied:
+            return robust_daily_vol_given_price(self.price)
+
+        return self.vol_provider.robust_daily_vol_given_price(self.price)
 
     @property
     def daily_returns_volatility(self) -> pd.Series:
         return self._daily_returns_volatility
 
+    @property
+    def vol_provider(self) -> VolatilityProvider:
+        return self._vol_provider
+
     @property
     def SR_cost(self) -> float:
         return self._SR_cost
@@ -449,6 +836,180 @@ class ProfitAndLossWithSharpeRatioCosts(ProfitAndLossWithGenericCosts):
         return self._average_position
 
 
+class ProfitAndLossWithTradeCosts(ProfitAndLossWithGenericCosts):
+    """
+    Costs charged on each trade, where trades are the changes in the
+    positions held: a commission per contract, a fee as a fraction of the
+    notional value traded, and slippage of half the bid/ask spread.
+    """
+
+    def __init__(
+        self,
+        *args,
+        commission_per_contract: float = 0.0,
+        percentage_fee: float = 0.0,
+        spread_in_points: float = 0.0,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._commission_per_contract = commission_per_contract
+        self._percentage_fee = percentage_fee
+        self._spread_in_points = spread_in_points
+
+    def weight(self, weight: pd.Series):
+        weighted_capital = apply_weighting(weight, self.capital)
+        weighted_positions = apply_weighting(weight, self.positions)
+
+        return ProfitAndLossWithTradeCosts(
+            self.price,
+            positions=weighted_positions,
+            fx=self.fx,
+            capital=weighted_capital,
+            value_per_point=self.value_per_point,
+            roundpositions=self.roundpositions,
+            delayfill=self.delayfill,
+            passed_diagnostic_df=self._passed_diagnostic_df,
+            result_cache=self.result_cache,
+            commission_per_contract=self.commission_per_contract,
+            percentage_fee=self.percentage_fee,
+            spread_in_points=self.spread_in_points,
+        )
+
+    def _fingerprint_items(self) -> tuple:
+        return super()._fingerprint_items() + (
+            self.commission_per_contract,
+            self.percentage_fee,
+            self.spread_in_points,
+        )
+
+    @memoized_calculation
+    def costs_pandl_in_points(self) -> pd.Series:
+        return calculate_trade_costs_in_points(
+            self.positions,
+            price=self.price,
+            commission_per_contract_in_points=self.commission_per_contract_in_points,
+            percentage_fee=self.percentage_fee,
+            half_spread_in_points=self.spread_in_points / 2.0,
+        )
+
+    @property
+    @memoized_calculation
+    def trades(self) -> pd.Series:
+        return calculate_trades(self.positions)
+
+    def _weighted_costs_pandl_in_points(self, weights: pd.DataFrame) -> tuple:
+        position_timestamps, weighted_positions = self._weighted_positions(weights)
+        price_timestamps, price_values = sorted_timestamps_and_values(self.price)
+        fill_price = ffill_align(
+            price_timestamps, price_values, position_timestamps, skip_nan=True
+        )
+        weighted_trade_costs = trade_costs_in_points_kernel(
+            weighted_positions,
+            fill_price=fill_price,
+            commission_per_contract_in_points=self.commission_per_contract_in_points,
+            percentage_fee=self.percentage_fee,
+            half_spread_in_points=self.spread_in_points / 2.0,
+        )
+
+        return position_timestamps, weighted_trade_costs
+
+    @property
+    def commission_per_contract_in_points(self) -> float:
+        return self.commission_per_contract / self.value_per_point
+
+    @property
+    def commission_per_contract(self) -> float:
+        return self._commission_per_contract
+
+    @property
+    def percentage_fee(self) -> float:
+        return self._percentage_fee
+
+    @property
+    def spread_in_points(self) -> float:
+        return self._spread_in_points
+
+
+def calculate_trades(positions: pd.Series) -> pd.Series:
+    """
+    Change in the position held; missing positions are held from the last
+    valid one, and we start flat
+
+    >>> import datetime
+    >>> d = datetime.datetime
+    >>> positions = pd.Series([np.nan, 2.0, np.nan, -1.0], index=[d(2000,1,i) for i in range(1,5)])
+    >>> calculate_trades(positions)
+    2000-01-01    0.0
+    2000-01-02    2.0
+    2000-01-03    0.0
+    2000-01-04   -3.0
+    dtype: float64
+    """
+    positions_held = positions.ffill().fillna(0.0)
+
+    return positions_held.diff().fillna(positions_held)
+
+
+def calculate_trade_costs_in_points(
+    positions: pd.Series,
+    price: pd.Series,
+    commission_per_contract_in_points: float,
+    percentage_fee: float,
+    half_spread_in_points: float,
+) -> pd.Series:
+    ## filled at the last price at or before the time of each trade
+    if can_use_kernel(positions, price):
+        price_timestamps, price_values = sorted_timestamps_and_values(price)
+        fill_price = ffill_align(
+            price_timestamps,
+            price_values,
+            index_as_int64(positions.index),
+            skip_nan=True,
+        )
+    else:
+        fill_price = price.ffill().reindex(positions.index, method="ffill").values
+
+    trade_costs = trade_costs_in_points_kernel(
+        positions.values,
+        fill_price=fill_price,
+        commission_per_contract_in_points=commission_per_contract_in_points,
+        percentage_fee=percentage_fee,
+        half_spread_in_points=half_spread_in_points,
+    )
+
+    return pd.Series(trade_costs, index=positions.index)
+
+
+def trade_costs_in_points_kernel(
+    position_values: np.ndarray,
+    fill_price: np.ndarray,
+    commission_per_contract_in_points: float,
+    percentage_fee: float,
+    half_spread_in_points: float,
+) -> np.ndarray:
+    """
+    Costs (as a negative number) of the trades implied by time ordered
+    positions, which may be 2-D (time x column) with 1-D fill prices
+
+    >>> trade_costs_in_points_kernel(np.array([np.nan, 2.0, np.nan, -1.0]), np.array([np.nan, 100.0, 101.0, 102.0]), 0.5, 0.001, 0.25)
+    array([ 0.   , -1.7  ,  0.   , -2.556])
+    """
+    positions_held = np.nan_to_num(ffill_values(position_values))
+    trades = np.diff(positions_held, axis=0, prepend=np.zeros_like(positions_held[:1]))
+    if trades.ndim > fill_price.ndim:
+        fill_price = fill_price[:, np.newaxis]
+
+    cost_per_contract = (
+        commission_per_contract_in_points
+        + percentage_fee * np.abs(fill_price)
+        + half_spread_in_points
+    )
+    ## no trade is no cost, even before we have a price
+    trade_costs = np.where(trades == 0.0, 0.0, -np.abs(trades) * cost_per_contract)
+
+    return trade_costs
+
+
 def spread_out_annualised_return_over_periods(data_as_annual: pd.Series) -> pd.Series:
     """
     >>> import datetime
@@ -472,6 +1033,74 @@ def spread_out_annualised_return_over_periods(data_as_annual: pd.Series) -> pd.S
 
 def calculate_SR_cost_per_period_of_position_data_match_price_index(
     position: pd.Series, price: pd.Series, SR_cost_as_annualised_figure: pd.Series
+) -> pd.Series:
+    if not can_use_kernel(position, price, SR_cost_as_annualised_figure):
+        return _calculate_SR_cost_per_period_with_pandas(
+            position,
+            price=price,
+            SR_cost_as_annualised_figure=SR_cost_as_annualised_figure,
+        )
+
+    position_timestamps, position_values = sorted_timestamps_and_values(position)
+    SR_cost_timestamps, SR_cost_values = sorted_timestamps_and_values(
+        SR_cost_as_annualised_figure
+    )
+    SR_cost_per_period = SR_cost_per_period_kernel(
+        position_timestamps,
+        position_values,
+        SR_cost_timestamps=SR_cost_timestamps,
+        SR_cost_values=SR_cost_values,
+        price_timestamps=index_as_int64(price.index),
+    )
+
+    return pd.Series(SR_cost_per_period, index=price.index)
+
+
+def SR_cost_per_period_kernel(
+    position_timestamps: np.ndarray,
+    position_values: np.ndarray,
+    SR_cost_timestamps: np.ndarray,
+    SR_cost_values: np.ndarray,
+    price_timestamps: np.ndarray,
+) -> np.ndarray:
+    """
+    Array version of calculate_SR_cost_per_period_of_position_data_match_price_index.
+    Positions and annualised SR costs may be 2-D (time x column).
+    """
+    ## We don't want to lose calculation because of warmup
+    SR_cost_aligned_positions = bfill_values(
+        ffill_align(SR_cost_timestamps, SR_cost_values, position_timestamps)
+    )
+
+    # Don't include costs until we start trading; only want nans at the start
+    position_held = np.logical_or.accumulate(~np.isnan(position_values), axis=0)
+    if SR_cost_aligned_positions.ndim < position_held.ndim:
+        SR_cost_aligned_positions = SR_cost_aligned_positions[:, np.newaxis]
+    SR_cost_when_position_held = np.where(
+        position_held, SR_cost_aligned_positions, np.nan
+    )
+
+    # Actually output in price space to match gross returns; a price timestamp
+    # is only costed once the last position before it is held
+    SR_cost_aligned_to_price = ffill_align(
+        position_timestamps, SR_cost_when_position_held, price_timestamps
+    )
+
+    # These will be annualised figure, make it a small loss every day
+    period_intervals_in_year_fractions = np.full(len(price_timestamps), np.nan)
+    period_intervals_in_year_fractions[1:] = (
+        np.diff(price_timestamps) / UNIXTIME_IN_YEAR
+    )
+    if SR_cost_aligned_to_price.ndim > 1:
+        period_intervals_in_year_fractions = period_intervals_in_year_fractions[
+            :, np.newaxis
+        ]
+
+    return SR_cost_aligned_to_price * period_intervals_in_year_fractions
+
+
+def _calculate_SR_cost_per_period_with_pandas(
+    position: pd.Series, price: pd.Series, SR_cost_as_annualised_figure: pd.Series
 ) -> pd.Series:
     # only want nans at the start
     position_ffill = position.ffill()
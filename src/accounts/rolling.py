@@ -0,0 +1,122 @@
+"""
+Rolling and expanding versions of the account curve statistics.
+
+Cumulative sums of the returns, their powers and the gain / loss partitions
+are found once; every window length is then a difference of those sums, so
+each window costs O(n) however long it is. Drawdowns are measured against the
+highest point of the cumulated curve within the window.
+"""
+
+from typing import Optional
+import numpy as np
+from src.utils.rolling import (
+    rolling_sum,
+    rolling_count,
+    rolling_window_length,
+    rolling_max,
+)
+
+ROLLING_STATISTICS = [
+    "mean",
+    "std",
+    "skew",
+    "ann_mean",
+    "ann_std",
+    "sharpe",
+    "sortino",
+    "hitrate",
+    "t_stat",
+    "drawdown",
+]
+
+
+class RollingCurveStatistics:
+    """
+    Rolling statistics of a curve of period returns, with definitions
+    matching calculate_curve_statistics over each window
+    """
+
+    def __init__(self, values: np.ndarray, times_per_year: float):
+        values = np.asarray(values, dtype=float)
+        ## centred on the overall mean, so the running sums of powers don't
+        ## lose precision to a large mean
+        self._offset = np.nanmean(values) if np.isfinite(values).any() else 0.0
+        self._values = values
+        self._centred = values - self._offset
+        self._times_per_year = times_per_year
+        self._losses = np.where(values < 0, values, np.nan)
+        ## centred in the same way, on the overall mean loss
+        self._loss_offset = (
+            np.nanmean(self._losses) if np.isfinite(self._losses).any() else 0.0
+        )
+        self._centred_losses = self._losses - self._loss_offset
+        self._gains = np.where(values > 0, values, np.nan)
+        started = np.logical_or.accumulate(~np.isnan(values))
+        ## as curve.cumsum().ffill()
+        self._cumulated = np.where(started, np.cumsum(np.nan_to_num(values)), np.nan)
+
+    def for_window(
+        self, window: Optional[int], min_periods: Optional[int] = None
+    ) -> dict:
+        """
+        Each statistic in ROLLING_STATISTICS as an array, for a trailing window
+        of `window` periods (expanding if None). Values need at least
+        min_periods valid returns in the window, by default the whole window
+        (or 2 for an expanding window).
+        """
+        if min_periods is None:
+            min_periods = 2 if window is None else window
+
+        count = rolling_count(self._values, window)
+        window_length = rolling_window_length(len(self._values), window)
+        enough_data = count >= max(min_periods, 1)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centred_sum = rolling_sum(self._centred, window)
+            centred_mean = centred_sum / count
+            moment2 = (
+                rolling_sum(self._centred**2, window) / count - centred_mean**2
+            )
+            moment2 = np.clip(moment2, 0.0, None)
+            moment3 = (
+                rolling_sum(self._centred**3, window) / count
+                - 3.0 * centred_mean * (moment2 + centred_mean**2)
+                + 2.0 * centred_mean**3
+            )
+            mean = centred_mean + self._offset
+            std = np.sqrt(moment2 * count / (count - 1))
+            ## same degenerate case handling as scipy.stats.skew
+            zero_variance = moment2 <= (np.finfo(float).resolution * mean) ** 2
+            skew = np.where(zero_variance, np.nan, moment3 / moment2**1.5)
+
+            vol_scalar = self._times_per_year**0.5
+            total = centred_sum + self._offset * count
+            ann_mean = total / (window_length / self._times_per_year)
+            ann_std = std * vol_scalar
+
+            loss_count = rolling_count(self._losses, window)
+            centred_loss_mean = rolling_sum(self._centred_losses, window) / loss_count
+            loss_variance = (
+                rolling_sum(self._centred_losses**2, window) / loss_count
+                - centred_loss_mean**2
+            )
+            loss_std = np.sqrt(np.clip(loss_variance, 0.0, None))
+            gain_count = rolling_count(self._gains, window)
+
+            statistics = dict(
+                mean=mean,
+                std=std,
+                skew=skew,
+                ann_mean=ann_mean,
+                ann_std=ann_std,
+                sharpe=ann_mean / ann_std,
+                sortino=ann_mean / (loss_std * vol_scalar),
+                hitrate=gain_count / (gain_count + loss_count),
+                t_stat=mean / (std / np.sqrt(count)),
+                drawdown=self._cumulated - rolling_max(self._cumulated, window),
+            )
+
+        return {
+            name: np.where(enough_data, statistic, np.nan)
+            for name, statistic in statistics.items()
+        }
@@ -0,0 +1,391 @@
+"""
+Parameter sweeps of the EWMAC strategy over a universe.
+
+A sweep is a grid of (ticker, fast, slow, costs) combinations. Prices are
+loaded once, by the caller, into a (time x ticker) frame; for a process pool
+its values are copied into shared memory, which every worker maps rather than
+receiving its own copy. Combinations are batched by ticker, so a worker
+calculates each ticker's vol once and each speed's positions once for all the
+cost assumptions, and results stream back batch by batch as a compact table
+of curve statistics.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from itertools import product
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+import numpy as np
+import pandas as pd
+from src.accounts.curve import AccountCurve
+from src.accounts.profit_and_loss import (
+    ProfitAndLossWithTradeCosts,
+    calculate_trades,
+    get_average_notional_position,
+    get_notional_position_for_forecast,
+)
+from src.strategies.trading_rule import DEFAULT_EWMAC_SPEEDS, EWMACTradingRule
+from src.strategies.vol_provider import VolatilityProvider
+from src.utils.references import (
+    ARBITRARY_FORECAST_ANNUAL_RISK_TARGET_PERCENTAGE,
+    ARBITRARY_FORECAST_CAPITAL,
+    ARBITRARY_VALUE_OF_PRICE_POINT,
+    BUSINESS_DAYS_IN_YEAR,
+    NET_CURVE,
+    Frequency,
+    arg_not_supplied,
+)
+
+DEFAULT_COMBINATIONS_PER_BATCH = 64
+SWEEP_RESULT_COLUMNS = [
+    "ann_mean",
+    "ann_std",
+    "sharpe",
+    "turnover",
+    "worst_drawdown",
+]
+
+## set in each pool worker by _attach_shared_prices
+_worker_prices = None
+_worker_shared_memory = None
+_worker_vol_provider = None
+
+
+@dataclass(frozen=True)
+class CostAssumption:
+    commission_per_contract: float = 0.0
+    percentage_fee: float = 0.0
+    spread_in_points: float = 0.0
+
+
+@dataclass(frozen=True)
+class SweepCombination:
+    ticker: str
+    fast: int
+    slow: int
+    commission_per_contract: float = 0.0
+    percentage_fee: float = 0.0
+    spread_in_points: float = 0.0
+
+    @property
+    def cost_assumption(self) -> CostAssumption:
+        return CostAssumption(
+            commission_per_contract=self.commission_per_contract,
+            percentage_fee=self.percentage_fee,
+            spread_in_points=self.spread_in_points,
+        )
+
+
+def parameter_grid(
+    tickers: list,
+    speeds: list = DEFAULT_EWMAC_SPEEDS,
+    cost_assumptions: list = (CostAssumption(),),
+) -> list:
+    """
+    Every (ticker, speed, cost assumption) combination; a slow of None is
+    four times the fast, as for EWMACTradingRule
+
+    >>> len(parameter_grid(["ES", "NQ"], [(8, 32), (16, None)], [CostAssumption(), CostAssumption(spread_in_points=0.25)]))
+    8
+    """
+    return [
+        SweepCombination(
+            ticker=ticker,
+            fast=fast,
+            slow=4 * fast if slow is None else slow,
+            **asdict(cost_assumption),
+        )
+        for ticker, (fast, slow), cost_assumption in product(
+            tickers, speeds, cost_assumptions
+        )
+    ]
+
+
+def prices_for_tickers(
+    tickers: list, get_price: Callable[[str], pd.Series]
+) -> pd.DataFrame:
+    """
+    (time x ticker) prices, fetching each ticker once
+    """
+    return pd.concat({ticker: get_price(ticker) for ticker in tickers}, axis=1)
+
+
+def run_sweep(
+    prices: pd.DataFrame,
+    combinations: list,
+    max_workers: Optional[int] = None,
+    combinations_per_batch: int = DEFAULT_COMBINATIONS_PER_BATCH,
+    progress: Callable[[int, int], None] = arg_not_supplied,
+    results_path: Path = arg_not_supplied,
+) -> pd.DataFrame:
+    """
+    Results for every combination, one row each in the order given
+
+    :param max_workers: size of the process pool; None (or 1) runs here
+    :param progress: called with (combinations done, total) after each batch
+    :param results_path: CSV that each batch is appended to as it completes,
+        so a long sweep can be watched or picked over before it finishes
+    """
+    batch_results = []
+    for batch_result in iterate_sweep(
+        prices,
+        combinations,
+        max_workers=max_workers,
+        combinations_per_batch=combinations_per_batch,
+        progress=progress,
+    ):
+        if results_path is not arg_not_supplied:
+            batch_result.to_csv(
+                results_path,
+                mode="a" if batch_results else "w",
+                header=not batch_results,
+            )
+        batch_results.append(batch_result)
+
+    if len(batch_results) == 0:
+        return _results_table([], [])
+
+    return pd.concat(batch_results).sort_index()
+
+
+def iterate_sweep(
+    prices: pd.DataFrame,
+    combinations: list,
+    max_workers: Optional[int] = None,
+    combinations_per_batch: int = DEFAULT_COMBINATIONS_PER_BATCH,
+    progress: Callable[[int, int], None] = arg_not_supplied,
+) -> Iterator[pd.DataFrame]:
+    """
+    Results table for each batch of combinations, as batches complete; rows
+    are indexed by position in combinations
+    """
+    missing_tickers = {combination.ticker for combination in combinations} - set(
+        prices.columns
+    )
+    if missing_tickers:
+        raise Exception("No prices for tickers %s" % sorted(missing_tickers))
+
+    batches = _batches_by_ticker(combinations, combinations_per_batch)
+    combinations_done = 0
+
+    if max_workers is None or max_workers <= 1:
+        vol_provider = VolatilityProvider()
+        for batch in batches:
+            batch_result = _sweep_batch(prices, batch, vol_provider)
+            combinations_done += len(batch_result)
+            _report_progress(progress, combinations_done, len(combinations))
+            yield batch_result
+        return
+
+    prices = prices.astype(float)
+    shared_memory = SharedMemory(create=True, size=max(prices.values.nbytes, 1))
+    try:
+        _copy_to_shared_memory(prices.values, shared_memory)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_attach_shared_prices,
+            initargs=(
+                shared_memory.name,
+                prices.shape,
+                prices.index.as_unit("ns").asi8,
+                prices.index.tz,
+                list(prices.columns),
+            ),
+        ) as executor:
+            futures = [
+                executor.submit(_sweep_batch_in_worker, batch) for batch in batches
+            ]
+            for future in as_completed(futures):
+                batch_result = future.result()
+                combinations_done += len(batch_result)
+                _report_progress(progress, combinations_done, len(combinations))
+                yield batch_result
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+
+def sweep_combination_statistics(
+    price: pd.Series,
+    combination: SweepCombination,
+    vol_provider: VolatilityProvider,
+    notional_position: pd.Series = arg_not_supplied,
+) -> dict:
+    """
+    Curve statistics, turnover and worst drawdown of one combination; the
+    notional position can be passed in when it is shared across costs
+    """
+    if notional_position is arg_not_supplied:
+        notional_position = ewmac_notional_position(
+            price, combination.fast, combination.slow, vol_provider
+        )
+
+    pandl = ProfitAndLossWithTradeCosts(
+        price=price,
+        positions=notional_position,
+        fx=arg_not_supplied,
+        capital=ARBITRARY_FORECAST_CAPITAL,
+        value_per_point=ARBITRARY_VALUE_OF_PRICE_POINT,
+        roundpositions=False,
+        delayfill=False,
+        passed_diagnostic_df=arg_not_supplied,
+        commission_per_contract=combination.commission_per_contract,
+        percentage_fee=combination.percentage_fee,
+        spread_in_points=combination.spread_in_points,
+    )
+    ## drawdowns from the curve's own running peak, as everywhere else
+    account_curve = AccountCurve(
+        pandl, frequency=Frequency.BDAY, curve_type=NET_CURVE, is_percentage=True
+    )
+    curve_statistics = account_curve.curve_statistics()
+
+    return dict(
+        ann_mean=float(curve_statistics.ann_mean),
+        ann_std=float(curve_statistics.ann_std),
+        sharpe=float(curve_statistics.sharpe),
+        turnover=annual_turnover(notional_position),
+        worst_drawdown=float(account_curve.worst_drawdown()),
+    )
+
+
+def ewmac_notional_position(
+    price: pd.Series, fast: int, slow: int, vol_provider: VolatilityProvider
+) -> pd.Series:
+    """
+    Position for the EWMAC forecast, sized as scout momentum-strategy
+    """
+    ewmac_trading_rule = EWMACTradingRule(
+        price=price, fast=fast, slow=slow, vol_provider=vol_provider
+    )
+    ewmac_trading_rule.calculate_forecast()
+    ewmac_trading_rule.normalize_forecast()
+    average_notional_position = get_average_notional_position(
+        daily_returns_volatility=vol_provider.robust_daily_vol_given_price(price),
+        risk_target=ARBITRARY_FORECAST_ANNUAL_RISK_TARGET_PERCENTAGE,
+        value_per_point=ARBITRARY_VALUE_OF_PRICE_POINT,
+        capital=ARBITRARY_FORECAST_CAPITAL,
+    )
+
+    return get_notional_position_for_forecast(
+        normalised_forecast=ewmac_trading_rule.normalized_forecast,
+        average_notional_position=average_notional_position,
+    )
+
+
+def annual_turnover(positions: pd.Series) -> float:
+    """
+    Round trips a year: contracts traded a year over twice the average
+    absolute position, for business daily positions
+
+    >>> import datetime
+    >>> positions = pd.Series([1.0, -1.0, 1.0, -1.0], index=pd.bdate_range(datetime.datetime(2000, 1, 3), periods=4))
+    >>> round(annual_turnover(positions), 2)
+    224.0
+    """
+    positions = positions.dropna()
+    if len(positions) == 0:
+        return np.nan
+
+    average_abs_position = positions.abs().mean()
+    if average_abs_position == 0:
+        return 0.0
+
+    ## positions are business daily, as EWMACTradingRule resamples to 1B
+    years = len(positions) / BUSINESS_DAYS_IN_YEAR
+    contracts_traded_per_year = calculate_trades(positions).abs().sum() / years
+
+    return float(contracts_traded_per_year / (2.0 * average_abs_position))
+
+
+def _sweep_batch(
+    prices: pd.DataFrame, batch: list, vol_provider: VolatilityProvider
+) -> pd.DataFrame:
+    ## a batch is one ticker, sorted by speed, so positions are shared by costs
+    rows = []
+    positions_for_speed = {}
+    price = prices[batch[0][1].ticker].dropna()
+    for _, combination in batch:
+        speed = (combination.fast, combination.slow)
+        if speed not in positions_for_speed:
+            positions_for_speed[speed] = ewmac_notional_position(
+                price, combination.fast, combination.slow, vol_provider
+            )
+        rows.append(
+            sweep_combination_statistics(
+                price,
+                combination,
+                vol_provider,
+                notional_position=positions_for_speed[speed],
+            )
+        )
+
+    return _results_table(batch, rows)
+
+
+def _sweep_batch_in_worker(batch: list) -> pd.DataFrame:
+    return _sweep_batch(_worker_prices, batch, _worker_vol_provider)
+
+
+def _attach_shared_prices(
+    shared_memory_name: str,
+    shape: tuple,
+    timestamps: np.ndarray,
+    tz,
+    tickers: list,
+):
+    global _worker_prices, _worker_shared_memory, _worker_vol_provider
+    ## the parent owns the block and unlinks it when the sweep is done
+    _worker_shared_memory = SharedMemory(name=shared_memory_name)
+
+    index = pd.DatetimeIndex(timestamps.view("M8[ns]"))
+    if tz is not None:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    values = np.ndarray(shape, dtype=float, buffer=_worker_shared_memory.buf)
+    _worker_prices = pd.DataFrame(values, index=index, columns=tickers, copy=False)
+    ## one provider for the life of the worker, so a ticker whose
+    ## combinations span several batches still has its vol calculated once
+    _worker_vol_provider = VolatilityProvider()
+
+
+def _copy_to_shared_memory(values: np.ndarray, shared_memory: SharedMemory):
+    ## the view must be gone before the block can be closed
+    shared_values = np.ndarray(values.shape, dtype=float, buffer=shared_memory.buf)
+    shared_values[:] = values
+
+
+def _batches_by_ticker(combinations: list, combinations_per_batch: int) -> list:
+    ## (position, combination) pairs, grouped by ticker and sorted by speed
+    combinations_for_ticker = {}
+    for position, combination in enumerate(combinations):
+        combinations_for_ticker.setdefault(combination.ticker, []).append(
+            (position, combination)
+        )
+
+    batches = []
+    for ticker_combinations in combinations_for_ticker.values():
+        ticker_combinations.sort(
+            key=lambda indexed: (indexed[1].fast, indexed[1].slow, indexed[0])
+        )
+        for start in range(0, len(ticker_combinations), combinations_per_batch):
+            batches.append(ticker_combinations[start : start + combinations_per_batch])
+
+    return batches
+
+
+def _results_table(batch: list, rows: list) -> pd.DataFrame:
+    results = pd.DataFrame(
+        [asdict(combination) for _, combination in batch],
+        index=pd.Index([position for position, _ in batch], name="combination"),
+        columns=list(SweepCombination.__dataclass_fields__),
+    )
+    statistics = pd.DataFrame(rows, index=results.index, columns=SWEEP_RESULT_COLUMNS)
+    results = pd.concat([results, statistics.astype("float32")], axis=1)
+    results["ticker"] = results["ticker"].astype(str)
+
+    return results
+
+
+def _report_progress(progress, combinations_done: int, total: int):
+    if progress is not arg_not_supplied:
+        progress(combinations_done, total)
@@ -0,0 +1,271 @@
+"""
+Combining the forecasts of several trading rules into one per instrument.
+
+Forecasts are scaled, capped, weighted, multiplied by a forecast
+diversification multiplier (FDM) and capped again. For a universe the
+forecasts are one frame with (instrument, rule) columns, held internally as a
+(time x instrument x rule) array, so every step, including the correlation
+estimate behind each instrument's FDM, is an array operation over all
+instruments at once.
+
+An estimated FDM is expanding, as forecast scalars are: it is re-estimated
+every estimation period from the forecasts up to then, so no date's
+multiplier depends on later forecasts.
+"""
+
+from typing import Union
+import numpy as np
+import pandas as pd
+from src.utils.references import arg_not_supplied
+
+DEFAULT_FORECAST_CAP = 20.0
+MAX_FORECAST_DIVERSIFICATION_MULTIPLIER = 2.5
+DEFAULT_FDM_ESTIMATION_PERIOD = 256
+DEFAULT_FDM_MIN_PERIODS = 256
+
+
+def combine_forecasts(
+    forecasts: pd.DataFrame,
+    weights: Union[pd.Series, pd.DataFrame],
+    forecast_scalars: Union[pd.Series, float] = 1.0,
+    forecast_cap: float = DEFAULT_FORECAST_CAP,
+    forecast_diversification_multiplier: Union[pd.Series, float] = arg_not_supplied,
+) -> Union[pd.Series, pd.DataFrame]:
+    """
+    Combined forecast from (date x rule) forecasts, or a (date x instrument)
+    frame from forecasts with (instrument, rule) columns; divide by the target
+    absolute forecast for get_notional_position_for_forecast.
+
+    :param weights: by rule, or (instrument x rule); on dates where a rule has
+        no forecast the other rules' weights are scaled up
+    :param forecast_scalars: by rule, or one for all rules
+    :param forecast_diversification_multiplier: by instrument, or one for all;
+        if not supplied, an expanding estimate from the correlation of the
+        scaled forecasts (see expanding_forecast_diversification_multiplier),
+        which is nan without a year of forecasts
+
+    >>> forecasts = pd.DataFrame(dict(fast=[10.0, 30.0], slow=[10.0, np.nan]))
+    >>> combine_forecasts(forecasts, pd.Series(dict(fast=0.5, slow=0.5)),
+    ...     forecast_diversification_multiplier=1.0).tolist()
+    [10.0, 20.0]
+    """
+    is_single_instrument = not isinstance(forecasts.columns, pd.MultiIndex)
+    if is_single_instrument:
+        forecasts = pd.concat({None: forecasts}, axis=1)
+
+    instruments = forecasts.columns.unique(level=0)
+    rules = forecasts.columns.unique(level=1)
+    ## (time x instrument x rule)
+    forecast_values = (
+        forecasts.reindex(columns=pd.MultiIndex.from_product([instruments, rules]))
+        .to_numpy(dtype=float)
+        .reshape(len(forecasts), len(instruments), len(rules))
+    )
+
+    scaled_forecasts = scale_and_cap_forecasts(
+        forecast_values,
+        _by_rule(forecast_scalars, rules),
+        forecast_cap=forecast_cap,
+    )
+    weight_values = _weights_as_array(weights, instruments, rules)
+
+    if forecast_diversification_multiplier is arg_not_supplied:
+        ## (time x instrument)
+        fdm = expanding_forecast_diversification_multiplier(
+            scaled_forecasts, weight_values
+        )
+    elif isinstance(forecast_diversification_multiplier, pd.Series):
+        fdm = forecast_diversification_multiplier.reindex(instruments).to_numpy(
+            dtype=float
+        )
+    else:
+        fdm = np.full(len(instruments), float(forecast_diversification_multiplier))
+
+    combined = weighted_forecast(scaled_forecasts, weight_values) * fdm
+    combined = np.clip(combined, -forecast_cap, forecast_cap)
+
+    if is_single_instrument:
+        return pd.Series(combined[:, 0], index=forecasts.index)
+
+    return pd.DataFrame(combined, index=forecasts.index, columns=instruments)
+
+
+def scale_and_cap_forecasts(
+    forecast_values: np.ndarray,
+    forecast_scalars: Union[np.ndarray, float],
+    forecast_cap: float = DEFAULT_FORECAST_CAP,
+) -> np.ndarray:
+    """
+    forecast_scalars broadcast against the last (rule) axis
+
+    >>> scale_and_cap_forecasts(np.array([[1.0, 3.0]]), np.array([10.0, 10.0]))
+    array([[10., 20.]])
+    """
+    return np.clip(forecast_values * forecast_scalars, -forecast_cap, forecast_cap)
+
+
+def weighted_forecast(
+    scaled_forecasts: np.ndarray, weight_values: np.ndarray
+) -> np.ndarray:
+    """
+    Weighted average over the last (rule) axis, renormalising the weights over
+    the rules with a forecast; nan where no rule has one
+    """
+    available = ~np.isnan(scaled_forecasts)
+    available_weights = np.where(available, weight_values, 0.0)
+    total_weight = available_weights.sum(axis=-1)
+    weighted_sum = (np.where(available, scaled_forecasts, 0.0) * available_weights).sum(
+        axis=-1
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total_weight > 0, weighted_sum / total_weight, np.nan)
+
+
+def forecast_correlation(scaled_forecasts: np.ndarray) -> np.ndarray:
+    """
+    (instrument x rule x rule) correlations of (time x instrument x rule)
+    forecasts, each pair over the dates where both have a forecast, as
+    DataFrame.corr(); negative or undefined correlations are set to zero, as
+    is usual when estimating an FDM
+    """
+    return _correlation_from_pair_sums(*_pair_sums(scaled_forecasts))
+
+
+def forecast_diversification_multiplier(
+    weight_values: np.ndarray,
+    correlation: np.ndarray,
+    max_multiplier: float = MAX_FORECAST_DIVERSIFICATION_MULTIPLIER,
+) -> np.ndarray:
+    """
+    1 / sqrt(w' C w) for each instrument, with the weights summing to one;
+    correlation can have leading axes, eg one per estimate
+
+    >>> forecast_diversification_multiplier(np.array([[0.5, 0.5]]), np.array([[[1.0, 0.0], [0.0, 1.0]]]))
+    array([1.41421356])
+    """
+    weight_values = weight_values / weight_values.sum(axis=-1, keepdims=True)
+    portfolio_variance = np.einsum(
+        "ir,...irs,is->...i", weight_values, correlation, weight_values
+    )
+
+    return np.minimum(1.0 / np.sqrt(portfolio_variance), max_multiplier)
+
+
+def expanding_forecast_diversification_multiplier(
+    scaled_forecasts: np.ndarray,
+    weight_values: np.ndarray,
+    estimation_period: int = DEFAULT_FDM_ESTIMATION_PERIOD,
+    min_periods: int = DEFAULT_FDM_MIN_PERIODS,
+    max_multiplier: float = MAX_FORECAST_DIVERSIFICATION_MULTIPLIER,
+    backfill: bool = True,
+) -> np.ndarray:
+    """
+    (time x instrument) FDM, re-estimated every estimation_period dates from
+    the correlation of the forecasts before them; the pair sums behind the
+    correlation are found once per period and accumulated, rather than
+    recalculated over the whole history for each estimate
+
+    :param min_periods: dates with a forecast an instrument needs before it
+        has an estimate
+    :param backfill: use the first estimate for the dates before it, as
+        pooled_forecast_scalar does
+
+    >>> scaled_forecasts = np.array([[[1.0, 1.0]], [[-1.0, 1.0]], [[1.0, -1.0]], [[-1.0, -1.0]]])
+    >>> expanding_forecast_diversification_multiplier(scaled_forecasts,
+    ...     np.array([[0.5, 0.5]]), estimation_period=2, min_periods=1).ravel()
+    array([1.41421356, 1.41421356, 1.41421356, 1.41421356])
+    """
+    time_count, instrument_count = scaled_forecasts.shape[:2]
+    ## each estimate applies from its boundary to the next
+    boundaries = np.arange(estimation_period, time_count, estimation_period)
+    fdm = np.full((time_count, instrument_count), np.nan)
+
+    if len(boundaries):
+        block_starts = np.concatenate([[0], boundaries[:-1]])
+        block_sums = [
+            _pair_sums(scaled_forecasts[start:end])
+            for start, end in zip(block_starts, boundaries)
+        ]
+        ## (estimate x instrument x rule x rule) sums from the start of the data
+        expanding_sums = [
+            np.cumsum(np.stack(sums), axis=0) for sums in zip(*block_sums)
+        ]
+        estimates = forecast_diversification_multiplier(
+            weight_values,
+            _correlation_from_pair_sums(*expanding_sums),
+            max_multiplier=max_multiplier,
+        )
+
+        has_forecast = (~np.isnan(scaled_forecasts[: boundaries[-1]])).any(axis=-1)
+        forecast_count = np.add.reduceat(
+            has_forecast.astype(int), block_starts, axis=0
+        ).cumsum(axis=0)
+        estimates[forecast_count < max(min_periods, 1)] = np.nan
+
+        estimate_index = np.searchsorted(boundaries, np.arange(time_count), "right")
+        is_estimated = estimate_index > 0
+        fdm[is_estimated] = estimates[estimate_index[is_estimated] - 1]
+
+    if backfill:
+        fdm = pd.DataFrame(fdm).bfill().to_numpy()
+
+    return fdm
+
+
+def _pair_sums(scaled_forecasts: np.ndarray) -> tuple:
+    ## sums over the dates where both rules of each pair have a forecast
+    valid = (~np.isnan(scaled_forecasts)).astype(float)
+    values = np.where(valid > 0, scaled_forecasts, 0.0)
+
+    pair_count = np.einsum("tir,tis->irs", valid, valid)
+    sum_first = np.einsum("tir,tis->irs", values, valid)
+    sum_squares_first = np.einsum("tir,tis->irs", values * values, valid)
+    sum_products = np.einsum("tir,tis->irs", values, values)
+
+    return pair_count, sum_first, sum_squares_first, sum_products
+
+
+def _correlation_from_pair_sums(
+    pair_count: np.ndarray,
+    sum_first: np.ndarray,
+    sum_squares_first: np.ndarray,
+    sum_products: np.ndarray,
+) -> np.ndarray:
+    ## (... x rule x rule) sums, with any leading axes
+    sum_second = np.swapaxes(sum_first, -1, -2)
+    sum_squares_second = np.swapaxes(sum_squares_first, -1, -2)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = sum_products - sum_first * sum_second / pair_count
+        variance_first = sum_squares_first - sum_first**2 / pair_count
+        variance_second = sum_squares_second - sum_second**2 / pair_count
+        correlation = covariance / np.sqrt(variance_first * variance_second)
+
+    correlation = np.clip(np.nan_to_num(correlation, nan=0.0), 0.0, 1.0)
+    rule_count = correlation.shape[-1]
+    correlation[..., np.arange(rule_count), np.arange(rule_count)] = 1.0
+
+    return correlation
+
+
+def _by_rule(values: Union[pd.Series, float], rules: pd.Index) -> np.ndarray:
+    if isinstance(values, pd.Series):
+        return values.reindex(rules).to_numpy(dtype=float)
+
+    return np.full(len(rules), float(values))
+
+
+def _weights_as_array(
+    weights: Union[pd.Series, pd.DataFrame],
+    instruments: pd.Index,
+    rules: pd.Index,
+) -> np.ndarray:
+    ## (instrument x rule); rules without a weight get none
+    if isinstance(weights, pd.DataFrame):
+        weights = weights.reindex(index=instruments, columns=rules)
+        return weights.fillna(0.0).to_numpy(dtype=float)
+
+    rule_weights = weights.reindex(rules).fillna(0.0).to_numpy(dtype=float)
+
+    return np.tile(rule_weights, (len(instruments), 1))
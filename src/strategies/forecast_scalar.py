@@ -0,0 +1,180 @@
+"""
+Forecast scalars estimated from a universe rather than assumed.
+
+A rule's scalar is the target absolute forecast divided by the average
+absolute forecast, pooled over every instrument the rule trades: the frame of
+forecasts is reduced to per-date sums and counts of absolute values, and
+their running totals give the expanding average in a couple of array
+operations.
+
+The running totals are also all a scalar needs to carry on, so
+ForecastScalarStore keeps them in a small JSON file keyed by rule and
+parameters; a later run or live update only adds the dates it hasn't seen.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Union
+import numpy as np
+import pandas as pd
+from src.utils.result_cache import hash_for_cache
+
+DEFAULT_TARGET_ABS_FORECAST = 10.0
+DEFAULT_SCALAR_MIN_PERIODS = 500
+STORE_VERSION = 1
+
+
+def pooled_forecast_scalar(
+    forecasts: Union[pd.Series, pd.DataFrame],
+    target_abs_forecast: float = DEFAULT_TARGET_ABS_FORECAST,
+    min_periods: int = DEFAULT_SCALAR_MIN_PERIODS,
+    backfill: bool = True,
+) -> pd.Series:
+    """
+    Expanding forecast scalar for raw forecasts, one column per instrument
+
+    :param min_periods: forecasts needed, over all instruments, before there is
+        a scalar
+    :param backfill: use the first scalar for the dates before it
+
+    >>> forecasts = pd.DataFrame(dict(ES=[1.0, 3.0, np.nan], NQ=[-1.0, 5.0, 2.5]))
+    >>> pooled_forecast_scalar(forecasts, min_periods=2).tolist()
+    [10.0, 4.0, 4.0]
+    """
+    abs_forecasts = (
+        forecasts.abs().to_frame() if forecasts.ndim == 1 else forecasts.abs()
+    )
+    abs_values = abs_forecasts.to_numpy(dtype=float)
+    is_observation = ~np.isnan(abs_values)
+
+    ## pooled over instruments, then accumulated over time
+    cumulative_count = is_observation.sum(axis=1).cumsum()
+    cumulative_sum = np.where(is_observation, abs_values, 0.0).sum(axis=1).cumsum()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scalar = target_abs_forecast * cumulative_count / cumulative_sum
+    scalar[cumulative_count < max(min_periods, 1)] = np.nan
+
+    scalar = pd.Series(scalar, index=forecasts.index)
+    if backfill:
+        scalar = scalar.bfill()
+
+    return scalar
+
+
+def forecast_scalar_key(rule_name: str, **rule_parameters) -> str:
+    """
+    Store key for a rule and the parameters that shape its forecasts
+
+    >>> forecast_scalar_key("ewmac", fast=16, slow=64) == forecast_scalar_key("ewmac", slow=64, fast=16)
+    True
+    """
+    return hash_for_cache("forecast_scalar", rule_name, sorted(rule_parameters.items()))
+
+
+class ForecastScalarStore:
+    """
+    Running absolute forecast totals per rule, in one JSON file
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        target_abs_forecast: float = DEFAULT_TARGET_ABS_FORECAST,
+        min_periods: int = DEFAULT_SCALAR_MIN_PERIODS,
+    ):
+        self._path = Path(path)
+        self._target_abs_forecast = target_abs_forecast
+        self._min_periods = min_periods
+        self._entries = self._read()
+
+    def forecast_scalar(
+        self, key: str, forecasts: Union[pd.Series, pd.DataFrame]
+    ) -> float:
+        """
+        Current scalar for a rule, after adding any dates in forecasts later
+        than the last one stored; nan until there are min_periods forecasts
+        """
+        self.update(key, forecasts)
+
+        return self.stored_forecast_scalar(key)
+
+    def update(self, key: str, forecasts: Union[pd.Series, pd.DataFrame]):
+        entry = self._entries.get(
+            key, dict(sum_abs_forecast=0.0, count=0, last_timestamp=None)
+        )
+        if entry["last_timestamp"] is not None:
+            forecasts = forecasts[
+                forecasts.index > pd.Timestamp(entry["last_timestamp"])
+            ]
+        if len(forecasts) == 0:
+            return
+
+        abs_values = np.abs(forecasts.to_numpy(dtype=float))
+        is_observation = ~np.isnan(abs_values)
+        self._entries[key] = dict(
+            sum_abs_forecast=entry["sum_abs_forecast"]
+            + float(abs_values[is_observation].sum()),
+            count=entry["count"] + int(is_observation.sum()),
+            last_timestamp=forecasts.index[-1].isoformat(),
+        )
+        self._write()
+
+    def stored_forecast_scalar(self, key: str) -> float:
+        """
+        Scalar from the stored totals alone
+        """
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            return np.nan
+
+        if entry["count"] < max(self._min_periods, 1) or entry["sum_abs_forecast"] == 0:
+            return np.nan
+
+        return self._target_abs_forecast * entry["count"] / entry["sum_abs_forecast"]
+
+    def last_timestamp(self, key: str) -> pd.Timestamp:
+        try:
+            return pd.Timestamp(self._entries[key]["last_timestamp"])
+        except KeyError:
+            return pd.NaT
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path) as store_file:
+                stored = json.load(store_file)
+        except FileNotFoundError:
+            return {}
+
+        if stored.get("version") != STORE_VERSION:
+            raise Exception(
+                "Forecast scalar store version %s not supported, expected %d"
+                % (stored.get("version"), STORE_VERSION)
+            )
+
+        return stored["entries"]
+
+    def _write(self):
+        ## written to a temporary file and moved into place, as checkpoints
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self._path.with_name(
+            "%s.%d.tmp" % (self._path.name, os.getpid())
+        )
+        with open(temporary_path, "w") as temporary_file:
+            json.dump(
+                dict(version=STORE_VERSION, entries=self._entries), temporary_file
+            )
+        os.replace(temporary_path, self._path)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def target_abs_forecast(self) -> float:
+        return self._target_abs_forecast
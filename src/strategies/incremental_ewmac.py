@@ -0,0 +1,240 @@
+"""
+Streaming version of EWMACTradingRule.
+
+Bars are grouped into periods as resample(frequency).last() would group them.
+When a period is complete, its last price updates the fast and slow EWMAs and
+the vol estimator, each O(1) and matching the pandas calculations, so a live
+loop never recomputes the history. State can be saved to disk and loaded
+again after a restart.
+"""
+
+import json
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import BusinessDay, Tick
+from src.strategies.incremental_vol import IncrementalVolEstimator
+
+SNAPSHOT_VERSION = 1
+
+
+class IncrementalEWMA:
+    """
+    ewm(span=span).mean() one value at a time (adjust=True, ignore_na=False)
+    """
+
+    def __init__(self, span: float):
+        self._span = span
+        self._decay = 1.0 - 2.0 / (span + 1.0)
+        self._value = np.nan
+        self._old_weight = 1.0
+
+    def update(self, value: float) -> float:
+        is_observation = not np.isnan(value)
+        if not np.isnan(self._value):
+            self._old_weight *= self._decay
+            if is_observation:
+                if self._value != value:
+                    self._value = (self._old_weight * self._value + value) / (
+                        self._old_weight + 1.0
+                    )
+                self._old_weight += 1.0
+        elif is_observation:
+            self._value = value
+
+        return self._value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> dict:
+        return dict(
+            span=self._span, value=float(self._value), old_weight=self._old_weight
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "IncrementalEWMA":
+        ewma = cls(snapshot["span"])
+        ewma._value = snapshot["value"]
+        ewma._old_weight = snapshot["old_weight"]
+
+        return ewma
+
+
+class IncrementalEWMAC:
+    """
+    The EWMACTradingRule forecast, (fast EWMA - slow EWMA) / vol of the
+    resampled price, kept up to date one bar at a time
+    """
+
+    def __init__(
+        self, fast: int, slow: int = None, frequency: str = "1B", **vol_kwargs
+    ):
+        if slow is None:
+            slow = 4 * fast
+        self._fast = fast
+        self._slow = slow
+        self._frequency = frequency
+        self._offset = to_offset(frequency)
+        _check_offset_supported(self._offset)
+
+        self._fast_ewma = IncrementalEWMA(fast)
+        self._slow_ewma = IncrementalEWMA(slow)
+        self._vol_estimator = IncrementalVolEstimator(**vol_kwargs)
+        self._last_period_price = np.nan
+        self._forecast = np.nan
+
+        ## the period still taking bars, and its latest price
+        self._open_period = None
+        self._open_period_price = np.nan
+
+    @classmethod
+    def from_price(
+        cls, price: pd.Series, fast: int, slow: int = None, **kwargs
+    ) -> "IncrementalEWMAC":
+        """
+        State brought up to date with a price history; the last period is
+        left open, as more bars may still arrive for it
+        """
+        ewmac = cls(fast, slow=slow, **kwargs)
+        for timestamp, bar_price in zip(price.index, price.values):
+            ewmac.update_bar(timestamp, bar_price)
+
+        return ewmac
+
+    def update_bar(self, timestamp: pd.Timestamp, price: float) -> float:
+        """
+        Add a bar, returning the forecast for the last completed period
+        """
+        period = self._period_label(pd.Timestamp(timestamp))
+        if self._open_period is None:
+            self._open_period = period
+        elif period > self._open_period:
+            self.update(self._open_period_price)
+            ## periods without any bars are missing prices, as with resample
+            next_period = self._open_period + self._offset
+            while next_period < period:
+                self.update(np.nan)
+                next_period = next_period + self._offset
+            self._open_period = period
+            self._open_period_price = np.nan
+        elif period < self._open_period:
+            raise Exception(
+                "Bar at %s is before the open period %s"
+                % (timestamp, self._open_period)
+            )
+
+        if not np.isnan(price):
+            ## resample().last() takes the last valid price of the period
+            self._open_period_price = float(price)
+
+        return self._forecast
+
+    def update(self, period_price: float) -> float:
+        """
+        Add the price of the next complete period, returning its forecast
+        """
+        period_price = float(period_price)
+        fast_ewma = self._fast_ewma.update(period_price)
+        slow_ewma = self._slow_ewma.update(period_price)
+        vol = self._vol_estimator.update(period_price - self._last_period_price)
+        self._last_period_price = period_price
+        self._forecast = (fast_ewma - slow_ewma) / vol
+
+        return self._forecast
+
+    def _period_label(self, timestamp: pd.Timestamp) -> pd.Timestamp:
+        if isinstance(self._offset, Tick):
+            return timestamp.floor(self._offset)
+
+        ## business days; weekend bars belong to the previous business day
+        return self._offset.rollback(timestamp.normalize())
+
+    @property
+    def forecast(self) -> float:
+        return self._forecast
+
+    @property
+    def fast(self) -> int:
+        return self._fast
+
+    @property
+    def slow(self) -> int:
+        return self._slow
+
+    @property
+    def frequency(self) -> str:
+        return self._frequency
+
+    def snapshot(self) -> dict:
+        return dict(
+            version=SNAPSHOT_VERSION,
+            fast=self._fast,
+            slow=self._slow,
+            frequency=self._frequency,
+            fast_ewma=self._fast_ewma.snapshot(),
+            slow_ewma=self._slow_ewma.snapshot(),
+            vol_estimator=self._vol_estimator.snapshot(),
+            last_period_price=float(self._last_period_price),
+            forecast=float(self._forecast),
+            open_period=(
+                None if self._open_period is None else self._open_period.isoformat()
+            ),
+            open_period_price=float(self._open_period_price),
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "IncrementalEWMAC":
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise Exception(
+                "EWMAC snapshot version %s not supported, expected %d"
+                % (snapshot.get("version"), SNAPSHOT_VERSION)
+            )
+
+        ewmac = cls(
+            snapshot["fast"], slow=snapshot["slow"], frequency=snapshot["frequency"]
+        )
+        ewmac._fast_ewma = IncrementalEWMA.from_snapshot(snapshot["fast_ewma"])
+        ewmac._slow_ewma = IncrementalEWMA.from_snapshot(snapshot["slow_ewma"])
+        ewmac._vol_estimator = IncrementalVolEstimator.from_snapshot(
+            snapshot["vol_estimator"]
+        )
+        ewmac._last_period_price = snapshot["last_period_price"]
+        ewmac._forecast = snapshot["forecast"]
+        if snapshot["open_period"] is not None:
+            ewmac._open_period = pd.Timestamp(snapshot["open_period"])
+        ewmac._open_period_price = snapshot["open_period_price"]
+
+        return ewmac
+
+    def save(self, path: Path):
+        """
+        Checkpoint the state; written to a temporary file and moved into
+        place, so a crash mid write leaves the previous checkpoint intact
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+        with open(temporary_path, "w") as temporary_file:
+            json.dump(self.snapshot(), temporary_file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IncrementalEWMAC":
+        with open(path) as checkpoint_file:
+            return cls.from_snapshot(json.load(checkpoint_file))
+
+
+def _check_offset_supported(offset):
+    if isinstance(offset, Tick):
+        return
+    if isinstance(offset, BusinessDay) and offset.n == 1:
+        return
+
+    raise Exception(
+        "Frequency %s not supported; use business days or a fixed frequency"
+        % offset.freqstr
+    )
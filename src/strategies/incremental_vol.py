@@ -0,0 +1,228 @@
+"""
+Streaming version of robust_vol_calc.
+
+The exponentially weighted variance is carried as the same running weights,
+mean and covariance that pandas' ewm().std() keeps internally, so each new
+return is O(1) and the output matches the batch calculation. The vol floor
+keeps the vols of the last floor_days periods in sorted order, so the rolling
+quantile is a lookup after one insertion and one removal.
+"""
+
+from bisect import bisect_left, insort
+from collections import deque
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+
+
+class IncrementalVolEstimator:
+    """
+    robust_vol_calc one daily return at a time; backfill isn't available as
+    it needs vols from later periods
+    """
+
+    def __init__(
+        self,
+        days: int = 35,
+        min_periods: int = 10,
+        vol_abs_min: float = 0.0000000001,
+        vol_floor: bool = True,
+        floor_min_quant: float = 0.05,
+        floor_min_periods: int = 100,
+        floor_days: int = 500,
+    ):
+        self._days = days
+        self._min_periods = min_periods
+        self._vol_abs_min = vol_abs_min
+        self._vol_floor = vol_floor
+        self._floor_min_quant = floor_min_quant
+        self._floor_min_periods = floor_min_periods
+        self._floor_days = floor_days
+
+        ## as pandas ewmcov, with adjust=True and ignore_na=False
+        self._decay = 1.0 - 2.0 / (days + 1.0)
+        self._ew_mean = np.nan
+        self._ew_variance = 0.0
+        self._sum_weights = 1.0
+        self._sum_squared_weights = 1.0
+        self._old_weight = 1.0
+        self._count = 0
+        self._started = False
+
+        ## vols in the floor window, in arrival order and sorted (nans left out)
+        self._floor_window = deque()
+        self._sorted_floor_window = []
+        self._current_floor = 0.0
+        self._vol = np.nan
+
+    @classmethod
+    def from_returns(
+        cls, daily_returns: pd.Series, **kwargs
+    ) -> "IncrementalVolEstimator":
+        """
+        Estimator brought up to date with a history of returns
+        """
+        estimator = cls(**kwargs)
+        for daily_return in daily_returns.values:
+            estimator.update(daily_return)
+
+        return estimator
+
+    def update(self, daily_return: float) -> float:
+        """
+        Add the next daily return, returning the vol for that period
+        """
+        daily_return = float(daily_return)
+        vol = self._update_ew_vol(daily_return)
+        if vol < self._vol_abs_min:
+            vol = self._vol_abs_min
+
+        if self._vol_floor:
+            self._update_floor(vol)
+            vol = np.maximum(vol, self._current_floor)
+
+        self._vol = vol
+
+        return vol
+
+    def _update_ew_vol(self, daily_return: float) -> float:
+        is_observation = not np.isnan(daily_return)
+        self._count += is_observation
+
+        if not self._started:
+            ## the first period only sets the mean
+            self._started = True
+            if is_observation:
+                self._ew_mean = daily_return
+        elif not np.isnan(self._ew_mean):
+            self._sum_weights *= self._decay
+            self._sum_squared_weights *= self._decay * self._decay
+            self._old_weight *= self._decay
+            if is_observation:
+                old_mean = self._ew_mean
+                total_weight = self._old_weight + 1.0
+                if old_mean != daily_return:
+                    self._ew_mean = (
+                        self._old_weight * old_mean + daily_return
+                    ) / total_weight
+                self._ew_variance = (
+                    self._old_weight
+                    * (self._ew_variance + (old_mean - self._ew_mean) ** 2)
+                    + (daily_return - self._ew_mean) ** 2
+                ) / total_weight
+                self._sum_weights += 1.0
+                self._sum_squared_weights += 1.0
+                self._old_weight += 1.0
+        elif is_observation:
+            self._ew_mean = daily_return
+
+        if self._count < max(self._min_periods, 1):
+            return np.nan
+
+        ## bias correction, as ewm().std()
+        numerator = self._sum_weights * self._sum_weights
+        denominator = numerator - self._sum_squared_weights
+        if denominator <= 0:
+            return np.nan
+
+        return np.sqrt(max(numerator / denominator * self._ew_variance, 0.0))
+
+    def _update_floor(self, vol: float):
+        is_first_period = len(self._floor_window) == 0
+
+        self._floor_window.append(vol)
+        if not np.isnan(vol):
+            insort(self._sorted_floor_window, vol)
+        if len(self._floor_window) > self._floor_days:
+            dropped_vol = self._floor_window.popleft()
+            if not np.isnan(dropped_vol):
+                del self._sorted_floor_window[
+                    bisect_left(self._sorted_floor_window, dropped_vol)
+                ]
+
+        if is_first_period:
+            ## as apply_vol_floor, which sets the first floor to zero
+            self._current_floor = 0.0
+            return
+
+        floor = self._floor_quantile()
+        if not np.isnan(floor):
+            ## otherwise the last floor carries forward
+            self._current_floor = floor
+
+    def _floor_quantile(self) -> float:
+        ## linear interpolation, as pandas rolling().quantile()
+        sorted_vols = self._sorted_floor_window
+        vol_count = len(sorted_vols)
+        if vol_count < max(self._floor_min_periods, 1):
+            return np.nan
+
+        position = self._floor_min_quant * (vol_count - 1)
+        lower = int(position)
+        if lower == position:
+            return sorted_vols[lower]
+
+        return sorted_vols[lower] + (sorted_vols[lower + 1] - sorted_vols[lower]) * (
+            position - lower
+        )
+
+    @property
+    def vol(self) -> float:
+        return self._vol
+
+    @property
+    def current_floor(self) -> float:
+        return self._current_floor
+
+    def snapshot(self) -> dict:
+        """
+        Everything needed to carry on later, as plain python values
+        """
+        return dict(
+            version=SNAPSHOT_VERSION,
+            parameters=dict(
+                days=self._days,
+                min_periods=self._min_periods,
+                vol_abs_min=self._vol_abs_min,
+                vol_floor=self._vol_floor,
+                floor_min_quant=self._floor_min_quant,
+                floor_min_periods=self._floor_min_periods,
+                floor_days=self._floor_days,
+            ),
+            ew_mean=float(self._ew_mean),
+            ew_variance=self._ew_variance,
+            sum_weights=self._sum_weights,
+            sum_squared_weights=self._sum_squared_weights,
+            old_weight=self._old_weight,
+            count=self._count,
+            started=self._started,
+            floor_window=[float(vol) for vol in self._floor_window],
+            current_floor=float(self._current_floor),
+            vol=float(self._vol),
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "IncrementalVolEstimator":
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise Exception(
+                "Vol snapshot version %s not supported, expected %d"
+                % (snapshot.get("version"), SNAPSHOT_VERSION)
+            )
+
+        estimator = cls(**snapshot["parameters"])
+        estimator._ew_mean = snapshot["ew_mean"]
+        estimator._ew_variance = snapshot["ew_variance"]
+        estimator._sum_weights = snapshot["sum_weights"]
+        estimator._sum_squared_weights = snapshot["sum_squared_weights"]
+        estimator._old_weight = snapshot["old_weight"]
+        estimator._count = snapshot["count"]
+        estimator._started = snapshot["started"]
+        estimator._floor_window = deque(snapshot["floor_window"])
+        estimator._sorted_floor_window = sorted(
+            vol for vol in snapshot["floor_window"] if not np.isnan(vol)
+        )
+        estimator._current_floor = snapshot["current_floor"]
+        estimator._vol = snapshot["vol"]
+
+        return estimator
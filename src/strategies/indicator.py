@@ -5,13 +5,24 @@ of the market and the strength of the trend.
 
 from abc import ABC, abstractmethod
 import logging
+from pathlib import Path
+from typing import Optional, Union
 import pandas as pd
 import numpy as np
+import yaml
 
 from src.utils.references import MKT_SCOUT_CLI
+from src.utils.rolling import ewma, rolling_count, rolling_max, rolling_mean
 
 indicator_logger = logging.getLogger(MKT_SCOUT_CLI)
 
+MOMENTUM_CONFIG_PATH = (
+    Path(__file__).resolve().parents[1] / "indicator_config" / "momentum.yaml"
+)
+CCI_CONSTANT = 0.015
+## rows of the (time x ticker x window) array used for mean deviation at once
+MEAN_DEVIATION_ROWS_PER_CHUNK = 256
+
 
 class Indicator(ABC):
     """
@@ -144,3 +155,480 @@ class MovingAverage(Momentum):
         - The moving average.
         """
         return self._moving_average
+
+
+class ArrayMomentum(Momentum):
+    """
+    Base class for momentum indicators calculated on arrays.
+
+    Prices may be a series for one ticker or a (time x ticker) frame for a
+    universe; every ticker is calculated in the same array operations, and
+    each output comes back in the same shape as the prices.
+    """
+
+    def __init__(self, prices: Union[pd.Series, pd.DataFrame], min_length: int):
+        """
+        Initialize the ArrayMomentum object.
+
+        Parameters:
+        - prices: Close prices, one column per ticker.
+        - min_length: The fewest prices the indicator can be calculated on.
+        """
+        super().__init__(prices)
+        self._min_length = min_length
+        self._outputs = None
+        indicator_logger.debug(
+            "%s initialized for %d prices of %d tickers",
+            self.__class__.__name__,
+            len(prices),
+            1 if prices.ndim == 1 else prices.shape[1],
+        )
+
+    def calculate(self) -> dict:
+        """
+        Calculate the indicator.
+
+        Returns:
+        - Each output of the indicator by name.
+        """
+        if len(self._prices) < self._min_length:
+            indicator_logger.error(
+                "Insufficient prices length for %s calculation",
+                self.__class__.__name__,
+            )
+            raise ValueError(
+                "Insufficient prices length for %s calculation"
+                % self.__class__.__name__
+            )
+
+        self._outputs = {
+            name: self._like_prices(values)
+            for name, values in self._calculate_arrays().items()
+        }
+
+        return self._outputs
+
+    @abstractmethod
+    def _calculate_arrays(self) -> dict:
+        """
+        Each output of the indicator, as an array shaped like the prices.
+        """
+
+    def _as_array(self, prices: Union[pd.Series, pd.DataFrame]) -> np.ndarray:
+        return prices.to_numpy(dtype=float)
+
+    def _like_prices(self, values: np.ndarray) -> Union[pd.Series, pd.DataFrame]:
+        if self._prices.ndim == 1:
+            return pd.Series(values, index=self._prices.index, name=self._prices.name)
+
+        return pd.DataFrame(
+            values, index=self._prices.index, columns=self._prices.columns
+        )
+
+    def _output(self, name: str) -> Union[pd.Series, pd.DataFrame]:
+        if self._outputs is None:
+            return None
+
+        return self._outputs[name]
+
+    @property
+    def outputs(self) -> dict:
+        """
+        Returns each output of the indicator by name, once calculated.
+        """
+        return self._outputs
+
+
+class RelativeStrengthIndex(ArrayMomentum):
+    """
+    Relative Strength Index: the share of recent price moves that were up,
+    from 0 to 100, with gains and losses averaged by Wilder's smoothing.
+    """
+
+    def __init__(self, prices: Union[pd.Series, pd.DataFrame], period: int = 14):
+        """
+        Initialize the RelativeStrengthIndex object.
+
+        Parameters:
+        - prices: Close prices, one column per ticker.
+        - period: The smoothing period of gains and losses.
+        """
+        super().__init__(prices, min_length=period + 1)
+        self._period = period
+
+    def _calculate_arrays(self) -> dict:
+        prices = self._as_array(self._prices)
+        price_changes = np.full(prices.shape, np.nan)
+        price_changes[1:] = prices[1:] - prices[:-1]
+
+        ## nan changes stay nan, so they're skipped by the smoothing
+        smoothing = dict(alpha=1.0 / self.period, adjust=False, min_periods=self.period)
+        average_gain = ewma(
+            np.where(price_changes < 0, 0.0, price_changes), **smoothing
+        )
+        average_loss = ewma(
+            np.where(price_changes > 0, 0.0, -price_changes), **smoothing
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100.0 * average_gain / (average_gain + average_loss)
+
+        return dict(rsi=rsi)
+
+    @property
+    def period(self) -> int:
+        """
+        Returns the smoothing period.
+        """
+        return self._period
+
+    @property
+    def rsi(self):
+        """
+        Returns the RSI.
+        """
+        return self._output("rsi")
+
+
+class MovingAverageConvergenceDivergence(ArrayMomentum):
+    """
+    MACD: the short EWMA less the long EWMA of the price, with a signal line
+    that is an EWMA of the MACD itself.
+    """
+
+    def __init__(
+        self,
+        prices: Union[pd.Series, pd.DataFrame],
+        short_period: int = 12,
+        long_period: int = 26,
+        signal_period: int = 9,
+    ):
+        """
+        Initialize the MovingAverageConvergenceDivergence object.
+
+        Parameters:
+        - prices: Close prices, one column per ticker.
+        - short_period: The span of the short EWMA.
+        - long_period: The span of the long EWMA.
+        - signal_period: The span of the signal line EWMA.
+        """
+        super().__init__(prices, min_length=1)
+        self._short_period = short_period
+        self._long_period = long_period
+        self._signal_period = signal_period
+
+    def _calculate_arrays(self) -> dict:
+        prices = self._as_array(self._prices)
+        ## EWMAs as pandas ewm(span).mean(), the same as EWMACTradingRule
+        macd = ewma(prices, span=self.short_period) - ewma(
+            prices, span=self.long_period
+        )
+        signal = ewma(macd, span=self.signal_period)
+
+        return dict(macd=macd, macd_signal=signal, macd_histogram=macd - signal)
+
+    @property
+    def short_period(self) -> int:
+        """
+        Returns the span of the short EWMA.
+        """
+        return self._short_period
+
+    @property
+    def long_period(self) -> int:
+        """
+        Returns the span of the long EWMA.
+        """
+        return self._long_period
+
+    @property
+    def signal_period(self) -> int:
+        """
+        Returns the span of the signal line EWMA.
+        """
+        return self._signal_period
+
+    @property
+    def macd(self):
+        """
+        Returns the MACD line.
+        """
+        return self._output("macd")
+
+    @property
+    def signal(self):
+        """
+        Returns the signal line.
+        """
+        return self._output("macd_signal")
+
+    @property
+    def histogram(self):
+        """
+        Returns the MACD less the signal line.
+        """
+        return self._output("macd_histogram")
+
+
+class StochasticOscillator(ArrayMomentum):
+    """
+    Stochastic Oscillator: where the close sits in the recent high to low
+    range, from 0 to 100 (%K), and its moving average (%D).
+    """
+
+    def __init__(
+        self,
+        prices: Union[pd.Series, pd.DataFrame],
+        k_period: int = 14,
+        d_period: int = 3,
+        high: Optional[Union[pd.Series, pd.DataFrame]] = None,
+        low: Optional[Union[pd.Series, pd.DataFrame]] = None,
+    ):
+        """
+        Initialize the StochasticOscillator object.
+
+        Parameters:
+        - prices: Close prices, one column per ticker.
+        - k_period: The lookback of the high to low range.
+        - d_period: The length of the moving average of %K.
+        - high, low: Bar highs and lows shaped like prices; the close is
+          used when they aren't given.
+        """
+        super().__init__(prices, min_length=k_period)
+        self._k_period = k_period
+        self._d_period = d_period
+        self._high = prices if high is None else high
+        self._low = prices if low is None else low
+
+    def _calculate_arrays(self) -> dict:
+        prices = self._as_array(self._prices)
+        highest = full_window_rolling_max(self._as_array(self._high), self.k_period)
+        lowest = -full_window_rolling_max(-self._as_array(self._low), self.k_period)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            stochastic_k = 100.0 * (prices - lowest) / (highest - lowest)
+        stochastic_d = rolling_mean(stochastic_k, self.d_period)
+
+        return dict(stochastic_k=stochastic_k, stochastic_d=stochastic_d)
+
+    @property
+    def k_period(self) -> int:
+        """
+        Returns the lookback of the high to low range.
+        """
+        return self._k_period
+
+    @property
+    def d_period(self) -> int:
+        """
+        Returns the length of the moving average of %K.
+        """
+        return self._d_period
+
+    @property
+    def k(self):
+        """
+        Returns %K.
+        """
+        return self._output("stochastic_k")
+
+    @property
+    def d(self):
+        """
+        Returns %D.
+        """
+        return self._output("stochastic_d")
+
+
+class CommodityChannelIndex(ArrayMomentum):
+    """
+    Commodity Channel Index: how far the typical price is from its moving
+    average, in units of 0.015 mean absolute deviations.
+    """
+
+    def __init__(
+        self,
+        prices: Union[pd.Series, pd.DataFrame],
+        period: int = 20,
+        high: Optional[Union[pd.Series, pd.DataFrame]] = None,
+        low: Optional[Union[pd.Series, pd.DataFrame]] = None,
+    ):
+        """
+        Initialize the CommodityChannelIndex object.
+
+        Parameters:
+        - prices: Close prices, one column per ticker.
+        - period: The length of the moving average and mean deviation.
+        - high, low: Bar highs and lows shaped like prices; the typical
+          price is the close when they aren't given.
+        """
+        super().__init__(prices, min_length=period)
+        self._period = period
+        self._high = prices if high is None else high
+        self._low = prices if low is None else low
+
+    def _calculate_arrays(self) -> dict:
+        typical_price = (
+            self._as_array(self._high)
+            + self._as_array(self._low)
+            + self._as_array(self._prices)
+        ) / 3.0
+        moving_average = rolling_mean(typical_price, self.period)
+        deviation = mean_absolute_deviation(typical_price, moving_average, self.period)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cci = (typical_price - moving_average) / (CCI_CONSTANT * deviation)
+
+        return dict(cci=cci)
+
+    @property
+    def period(self) -> int:
+        """
+        Returns the length of the moving average and mean deviation.
+        """
+        return self._period
+
+    @property
+    def cci(self):
+        """
+        Returns the CCI.
+        """
+        return self._output("cci")
+
+
+def full_window_rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Rolling max, nan unless the window has window valid values, as
+    rolling(window).max(); each column warms up from its own first price
+
+    >>> full_window_rolling_max(np.array([np.nan, 1.0, 3.0, 2.0]), 2)
+    array([nan, nan,  3.,  3.])
+    """
+    maximum = rolling_max(values, window)
+    maximum[rolling_count(values, window) < window] = np.nan
+
+    return maximum
+
+
+def mean_absolute_deviation(
+    values: np.ndarray, window_mean: np.ndarray, window: int
+) -> np.ndarray:
+    """
+    Mean absolute deviation of each trailing window from that window's mean,
+    nan unless the window is full. Unlike a mean it has no running form, so
+    windows are taken as strided views a chunk of rows at a time.
+
+    >>> mean_absolute_deviation(np.array([1.0, 2.0, 6.0]), np.array([np.nan, 1.5, 4.0]), 2)
+    array([nan, 0.5, 2. ])
+    """
+    deviation = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return deviation
+
+    ## windows[i] is the window ending at row i + window - 1
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+    for start in range(0, len(windows), MEAN_DEVIATION_ROWS_PER_CHUNK):
+        end = min(start + MEAN_DEVIATION_ROWS_PER_CHUNK, len(windows))
+        means = window_mean[start + window - 1 : end + window - 1]
+        deviation[start + window - 1 : end + window - 1] = np.abs(
+            windows[start:end] - means[..., np.newaxis]
+        ).mean(axis=-1)
+
+    return deviation
+
+
+## indicators by their name in the momentum config
+MOMENTUM_INDICATORS = {
+    "RelativeStrengthIndex": RelativeStrengthIndex,
+    "MovingAverageConvergenceDivergence": MovingAverageConvergenceDivergence,
+    "StochasticOscillator": StochasticOscillator,
+    "CommodityChannelIndex": CommodityChannelIndex,
+}
+## indicators that use bar highs and lows when they're given
+HIGH_LOW_INDICATORS = (StochasticOscillator, CommodityChannelIndex)
+
+
+def load_momentum_config(config_path: Path = MOMENTUM_CONFIG_PATH) -> dict:
+    """
+    Indicator name -> parameters, as in src/indicator_config/momentum.yaml
+    """
+    with open(config_path) as config_file:
+        config = yaml.safe_load(config_file)
+
+    unknown_indicators = set(config) - set(MOMENTUM_INDICATORS)
+    if unknown_indicators:
+        raise Exception(
+            "Unknown momentum indicators %s in %s"
+            % (sorted(unknown_indicators), config_path)
+        )
+
+    return config
+
+
+def momentum_indicators_from_config(
+    prices: Union[pd.Series, pd.DataFrame],
+    config: dict = None,
+    high: Optional[Union[pd.Series, pd.DataFrame]] = None,
+    low: Optional[Union[pd.Series, pd.DataFrame]] = None,
+) -> list:
+    """
+    The configured indicators, ready to calculate.
+
+    Parameters:
+    - prices: Close prices, one column per ticker.
+    - config: Indicator name -> parameters; the momentum config if not given.
+    - high, low: Bar highs and lows, for the indicators that use them.
+    """
+    if config is None:
+        config = load_momentum_config()
+
+    indicators = []
+    for indicator_name, parameters in config.items():
+        indicator_class = MOMENTUM_INDICATORS[indicator_name]
+        parameters = dict(parameters or {})
+        if issubclass(indicator_class, HIGH_LOW_INDICATORS):
+            parameters.update(high=high, low=low)
+        indicators.append(indicator_class(prices, **parameters))
+
+    return indicators
+
+
+def calculate_momentum_indicators(
+    prices: pd.DataFrame,
+    config: dict = None,
+    high: Optional[pd.DataFrame] = None,
+    low: Optional[pd.DataFrame] = None,
+) -> dict:
+    """
+    Every configured indicator for a universe, each calculated once across
+    all tickers.
+
+    Parameters:
+    - prices: (time x ticker) close prices.
+    - config: Indicator name -> parameters; the momentum config if not given.
+    - high, low: Bar highs and lows, for the indicators that use them.
+
+    Returns:
+    - Output name (eg rsi, macd_signal) -> (time x ticker) frame.
+    """
+    outputs = {}
+    for indicator in momentum_indicators_from_config(
+        prices, config=config, high=high, low=low
+    ):
+        outputs.update(indicator.calculate())
+
+    return outputs
+
+
+def latest_momentum_indicators(
+    prices: pd.DataFrame,
+    config: dict = None,
+    high: Optional[pd.DataFrame] = None,
+    low: Optional[pd.DataFrame] = None,
+) -> pd.DataFrame:
+    """
+    Screen of the latest value of every configured indicator output, one row
+    per ticker.
+    """
+    outputs = calculate_momentum_indicators(prices, config=config, high=high, low=low)
+
+    return pd.DataFrame({name: output.iloc[-1] for name, output in outputs.items()})
@@ -2,6 +2,10 @@ from pathlib import Path
 from abc import ABC, abstractmethod
 import pandas as pd
 from src.strategies.vol import robust_vol_calc
+from src.strategies.vol_provider import VolatilityProvider
+from src.utils.references import arg_not_supplied
+
+DEFAULT_EWMAC_SPEEDS = [(8, 32), (16, 64), (32, 128), (64, 256)]
 
 
 class TradingRule(ABC):
@@ -61,12 +65,20 @@ class EWMACTradingRule(TradingRule):
     Exponentially weighted moving average crossover.
     """
 
-    def __init__(self, price: pd.Series, fast: int, slow: int, frequency: str = "1B"):
+    def __init__(
+        self,
+        price: pd.Series,
+        fast: int,
+        slow: int,
+        frequency: str = "1B",
+        vol_provider: VolatilityProvider = arg_not_supplied,
+    ):
         super().__init__(price)
         self._original_price = price
         self._fast = fast
         self._slow = slow
         self._frequency = frequency
+        self._vol_provider = vol_provider
         self._forecast = None
 
     def calculate_forecast(self) -> None:
@@ -81,17 +93,33 @@ class EWMACTradingRule(TradingRule):
         fast_ewma = resampled_price.ewm(span=self.fast).mean()
         slow_ewma = resampled_price.ewm(span=self.slow).mean()
         raw_ewmac = fast_ewma - slow_ewma
-        vol = robust_vol_calc(resampled_price.diff())
+        if self.vol_provider is arg_not_supplied:
+            vol = robust_vol_calc(resampled_price.diff())
+        else:
+            ## keyed on the original prices, so position sizing can share it
+            vol = self.vol_provider.robust_vol_given_price(
+                self._original_price, frequency=self.frequency
+            )
         self._forecast = raw_ewmac / vol
         self._price = resampled_price
 
-    def normalize_forecast(self, target_abs_forecast: float = 10.0) -> None:
+    def normalize_forecast(
+        self, target_abs_forecast: float = 10.0, forecast_scalar=1.0
+    ) -> None:
         """
         Normalize the forecast.
         :params target_abs_forecast: target absolute forecast
+        :params forecast_scalar: scalar, or series of scalars over time, as
+            estimated by forecast_scalar.pooled_forecast_scalar
         :returns: normalized forecast
         """
-        self._normalized_forecast = self._forecast / target_abs_forecast
+        if isinstance(forecast_scalar, pd.Series):
+            forecast_scalar = forecast_scalar.reindex(
+                self._forecast.index, method="ffill"
+            )
+        self._normalized_forecast = (
+            self._forecast * forecast_scalar / target_abs_forecast
+        )
 
     @property
     def fast(self):
@@ -114,6 +142,113 @@ class EWMACTradingRule(TradingRule):
         """
         return self._frequency
 
+    @property
+    def vol_provider(self) -> VolatilityProvider:
+        """
+        Return the shared volatility provider, if any.
+        """
+        return self._vol_provider
+
+    @property
+    def original_price(self):
+        """
+        Return the original price series.
+        """
+        return self._original_price
+
+
+class MultiSpeedEWMACTradingRule(TradingRule):
+    """
+    EWMAC at several (fast, slow) speeds, sharing one resample, one EWMA per
+    distinct span and one vol calculation. The forecast is a (date x speed)
+    frame, with each column as EWMACTradingRule would give for that speed.
+    """
+
+    def __init__(
+        self,
+        price: pd.Series,
+        speeds: list = DEFAULT_EWMAC_SPEEDS,
+        frequency: str = "1B",
+        vol_provider: VolatilityProvider = arg_not_supplied,
+    ):
+        super().__init__(price)
+        self._original_price = price
+        ## a slow of None is four times the fast, as for EWMACTradingRule
+        self._speeds = [
+            (fast, 4 * fast if slow is None else slow) for fast, slow in speeds
+        ]
+        self._frequency = frequency
+        self._vol_provider = vol_provider
+
+    def calculate_forecast(self) -> None:
+        """
+        Calculate the forecast for every speed.
+        """
+        resampled_price = self._original_price.resample(self.frequency).last()
+
+        spans = sorted({span for speed in self.speeds for span in speed})
+        ewma_for_span = {
+            span: resampled_price.ewm(span=span).mean().to_numpy() for span in spans
+        }
+        if self.vol_provider is arg_not_supplied:
+            vol = robust_vol_calc(resampled_price.diff())
+        else:
+            vol = self.vol_provider.robust_vol_given_price(
+                self._original_price, frequency=self.frequency
+            )
+        vol = vol.reindex(resampled_price.index).to_numpy()
+
+        self._forecast = pd.DataFrame(
+            {
+                self.speed_name(fast, slow): (ewma_for_span[fast] - ewma_for_span[slow])
+                / vol
+                for fast, slow in self.speeds
+            },
+            index=resampled_price.index,
+        )
+        self._price = resampled_price
+
+    def normalize_forecast(
+        self, target_abs_forecast: float = 10.0, forecast_scalars=1.0
+    ) -> None:
+        """
+        Normalize the forecast.
+        :params target_abs_forecast: target absolute forecast
+        :params forecast_scalars: scalar for every speed, or series of scalars
+            indexed by speed name
+        """
+        self._normalized_forecast = (
+            self._forecast * forecast_scalars / target_abs_forecast
+        )
+
+    @staticmethod
+    def speed_name(fast: int, slow: int) -> str:
+        """
+        Return the forecast column name for a speed.
+        """
+        return "ewmac%d_%d" % (fast, slow)
+
+    @property
+    def speeds(self) -> list:
+        """
+        Return the (fast, slow) pairs.
+        """
+        return self._speeds
+
+    @property
+    def frequency(self):
+        """
+        Return the frequency.
+        """
+        return self._frequency
+
+    @property
+    def vol_provider(self) -> VolatilityProvider:
+        """
+        Return the shared volatility provider, if any.
+        """
+        return self._vol_provider
+
     @property
     def original_price(self):
         """
@@ -3,6 +3,7 @@ import pandas as pd
 
 from src.utils.references import BUSINESS_DAYS_IN_YEAR
 from src.utils.references import resample_prices_to_business_day_index
+from src.accounts.pandl_kernel import ffill_values
 
 
 def robust_daily_vol_given_price(price: pd.Series, **kwargs):
@@ -197,3 +198,123 @@ def simple_vol_calc(
     vol = daily_returns.rolling(days, min_periods=min_periods).std()
 
     return vol
+
+
+## Panel versions: each column of a (date x instrument) frame gets the same
+## result as the single series function, from one set of column-wise
+## operations rather than one call per instrument
+
+
+def robust_daily_vol_given_price_panel(prices: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    prices = resample_prices_to_business_day_index(prices)
+    daily_returns = prices.diff()
+
+    return robust_vol_calc_panel(daily_returns, **kwargs)
+
+
+def robust_vol_calc_panel(
+    daily_returns: pd.DataFrame,
+    days: int = 35,
+    min_periods: int = 10,
+    vol_abs_min: float = 0.0000000001,
+    vol_floor: bool = True,
+    floor_min_quant: float = 0.05,
+    floor_min_periods: int = 100,
+    floor_days: int = 500,
+    backfill: bool = False,
+    **ignored_kwargs,
+) -> pd.DataFrame:
+    """
+    robust_vol_calc for every column of daily_returns; see there for the
+    parameters
+    """
+    vol = simple_ewvol_calc(daily_returns, days=days, min_periods=min_periods)
+    vol_values = apply_min_vol_to_array(vol.to_numpy(), vol_abs_min=vol_abs_min)
+
+    if vol_floor:
+        vol_values = apply_vol_floor_to_array(
+            vol_values,
+            floor_min_quant=floor_min_quant,
+            floor_min_periods=floor_min_periods,
+            floor_days=floor_days,
+        )
+
+    vol = pd.DataFrame(vol_values, index=vol.index, columns=vol.columns)
+    if backfill:
+        vol = backfill_vol(vol)
+
+    return vol
+
+
+def mixed_vol_calc_panel(
+    daily_returns: pd.DataFrame,
+    days: int = 35,
+    min_periods: int = 10,
+    slow_vol_years: int = 20,
+    proportion_of_slow_vol: float = 0.3,
+    vol_abs_min: float = 0.0000000001,
+    backfill: bool = False,
+    **ignored_kwargs,
+) -> pd.DataFrame:
+    """
+    mixed_vol_calc for every column of daily_returns
+    """
+    vol = simple_ewvol_calc(daily_returns, days=days, min_periods=min_periods)
+
+    slow_vol_days = slow_vol_years * BUSINESS_DAYS_IN_YEAR
+    long_vol = vol.ewm(span=slow_vol_days).mean()
+
+    vol_values = long_vol.to_numpy() * proportion_of_slow_vol + vol.to_numpy() * (
+        1 - proportion_of_slow_vol
+    )
+    vol_values = apply_min_vol_to_array(vol_values, vol_abs_min=vol_abs_min)
+
+    vol = pd.DataFrame(vol_values, index=vol.index, columns=vol.columns)
+    if backfill:
+        vol = backfill_vol(vol)
+
+    return vol
+
+
+def apply_vol_floor_panel(
+    vol: pd.DataFrame,
+    floor_min_quant: float = 0.05,
+    floor_min_periods: int = 100,
+    floor_days: int = 500,
+) -> pd.DataFrame:
+    vol_floored = apply_vol_floor_to_array(
+        vol.to_numpy(dtype=float),
+        floor_min_quant=floor_min_quant,
+        floor_min_periods=floor_min_periods,
+        floor_days=floor_days,
+    )
+
+    return pd.DataFrame(vol_floored, index=vol.index, columns=vol.columns)
+
+
+def apply_min_vol_to_array(
+    vol: np.ndarray, vol_abs_min: float = 0.0000000001
+) -> np.ndarray:
+    ## nans compare false, so stay nan as with apply_min_vol
+    return np.where(vol < vol_abs_min, vol_abs_min, vol)
+
+
+def apply_vol_floor_to_array(
+    vol: np.ndarray,
+    floor_min_quant: float = 0.05,
+    floor_min_periods: int = 100,
+    floor_days: int = 500,
+) -> np.ndarray:
+    ## the rolling quantile runs column by column in pandas' skiplist kernel,
+    ## but in a single call for the whole panel
+    vol_min = (
+        pd.DataFrame(vol)
+        .rolling(min_periods=floor_min_periods, window=floor_days)
+        .quantile(q=floor_min_quant)
+        .to_numpy()
+    )
+    if len(vol_min):
+        vol_min[0] = 0.0
+    vol_min = ffill_values(vol_min)
+
+    return np.maximum(vol, vol_min)
@@ -0,0 +1,115 @@
+"""
+One place to get volatility from during a run.
+
+Trading rules, position sizing and cost models all need the vol of the same
+prices; asking a shared VolatilityProvider means each vol series is calculated
+once. Results are keyed by a fingerprint of the price content and the vol
+parameters, with the fingerprint itself remembered per price object so the
+same series isn't hashed twice (prices shouldn't be changed in place once
+passed in).
+"""
+
+import weakref
+from typing import Union
+import pandas as pd
+from src.strategies.vol import robust_vol_calc, robust_daily_vol_given_price_panel
+from src.utils.result_cache import ResultCache, hash_for_cache
+from src.utils.references import arg_not_supplied
+
+BUSINESS_DAY_RESAMPLE_FREQUENCY = "1B"
+
+
+class VolatilityProvider:
+    def __init__(self, result_cache: ResultCache = arg_not_supplied):
+        """
+        :param result_cache: also keep single instrument vols on disk, so
+            they carry over between runs
+        """
+        self._result_cache = result_cache
+        self._vols = {}
+        ## id of each live price object seen -> fingerprint; an entry goes
+        ## when its price is collected, so prices aren't kept alive and an id
+        ## can't be reused while still in here
+        self._fingerprints = {}
+
+    def robust_daily_vol_given_price(self, price: pd.Series, **kwargs) -> pd.Series:
+        """
+        As vol.robust_daily_vol_given_price
+        """
+        return self.robust_vol_given_price(
+            price, frequency=BUSINESS_DAY_RESAMPLE_FREQUENCY, **kwargs
+        )
+
+    def robust_vol_given_price(
+        self,
+        price: pd.Series,
+        frequency: str = BUSINESS_DAY_RESAMPLE_FREQUENCY,
+        **kwargs,
+    ) -> pd.Series:
+        """
+        robust_vol_calc of the returns of price resampled to frequency, as
+        used by EWMACTradingRule
+        """
+        cache_key = hash_for_cache(
+            "robust_vol_given_price",
+            self.price_fingerprint(price),
+            frequency,
+            sorted(kwargs.items()),
+        )
+
+        return self._cached_vol(
+            cache_key,
+            lambda: robust_vol_calc(price.resample(frequency).last().diff(), **kwargs),
+        )
+
+    def robust_daily_vol_given_price_panel(
+        self, prices: pd.DataFrame, **kwargs
+    ) -> pd.DataFrame:
+        cache_key = hash_for_cache(
+            "robust_daily_vol_given_price_panel",
+            self.price_fingerprint(prices),
+            sorted(kwargs.items()),
+        )
+
+        ## the result cache only stores series, so frames are kept in memory
+        return self._cached_vol(
+            cache_key,
+            lambda: robust_daily_vol_given_price_panel(prices, **kwargs),
+            use_result_cache=False,
+        )
+
+    def price_fingerprint(self, price: Union[pd.Series, pd.DataFrame]) -> str:
+        price_id = id(price)
+        try:
+            return self._fingerprints[price_id]
+        except KeyError:
+            pass
+
+        fingerprint = hash_for_cache(price)
+        self._fingerprints[price_id] = fingerprint
+        weakref.finalize(price, self._fingerprints.pop, price_id, None)
+
+        return fingerprint
+
+    def _cached_vol(
+        self, cache_key: str, calculation, use_result_cache: bool = True
+    ) -> Union[pd.Series, pd.DataFrame]:
+        try:
+            vol = self._vols[cache_key]
+        except KeyError:
+            if use_result_cache and self.result_cache is not arg_not_supplied:
+                vol = self.result_cache.get_or_calculate(cache_key, calculation)
+            else:
+                vol = calculation()
+            self._vols[cache_key] = vol
+
+        ## a copy, as some callers change vol in place
+        return vol.copy()
+
+    def clear(self):
+        self._vols = {}
+        self._fingerprints = {}
+
+    @property
+    def result_cache(self) -> ResultCache:
+        return self._result_cache
@@ -90,6 +90,7 @@ def from_config_frequency_pandas_resample(freq: Frequency) -> str:
         Frequency.DAY: "D",
         Frequency.MINUTES_15: "15T",
         Frequency.MINUTES_5: "5T",
+        Frequency.MINUTE: "T",
         Frequency.SECONDS_10: "10S",
         Frequency.SECOND: "S",
     }
@@ -119,6 +120,7 @@ def from_frequency_to_times_per_year(freq: Frequency) -> float:
         Frequency.DAY: CALENDAR_DAYS_IN_YEAR,
         Frequency.MINUTES_15: (MINUTES_PER_YEAR / 15),
         Frequency.MINUTES_5: (MINUTES_PER_YEAR / 5),
+        Frequency.MINUTE: MINUTES_PER_YEAR,
         Frequency.SECONDS_10: SECONDS_IN_YEAR / 10,
         Frequency.SECOND: SECONDS_IN_YEAR,
     }
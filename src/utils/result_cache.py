@@ -0,0 +1,187 @@
+"""
+Content addressed on-disk cache for calculated series.
+
+Results are keyed by a hash of the inputs and parameters that produced them,
+so a cached series is only ever reused when nothing has changed. Each series
+is stored as a small uncompressed .npz file of columns (timestamps, values),
+and the least recently used files are evicted once the cache grows beyond
+its size limit.
+"""
+
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+
+RESULT_CACHE_DIR_NAME = "result_cache"
+DEFAULT_MAX_CACHE_SIZE_IN_BYTES = 256 * 1024 * 1024
+
+_CACHE_FILE_SUFFIX = ".npz"
+
+
+def hash_for_cache(*items) -> str:
+    """
+    Hex digest identifying a set of inputs: series, frames and arrays are
+    hashed by content, anything else by its repr
+
+    >>> hash_for_cache("ewmac", 16, 64) == hash_for_cache("ewmac", 16, 64)
+    True
+    >>> hash_for_cache("ewmac", 16, 64) == hash_for_cache("ewmac", 16, 32)
+    False
+    """
+    digest = hashlib.sha256()
+    for item in items:
+        _update_digest(digest, item)
+
+    return digest.hexdigest()
+
+
+def _update_digest(digest, item):
+    if isinstance(item, (tuple, list)):
+        digest.update(b"sequence%d;" % len(item))
+        for each_item in item:
+            _update_digest(digest, each_item)
+        return
+
+    if isinstance(item, pd.DataFrame):
+        digest.update(b"frame;" + repr(list(item.columns)).encode())
+        item_bytes = pd.util.hash_pandas_object(item, index=True).values.tobytes()
+    elif isinstance(item, pd.Series):
+        digest.update(b"series;" + repr(item.name).encode())
+        item_bytes = pd.util.hash_pandas_object(item, index=True).values.tobytes()
+    elif isinstance(item, np.ndarray):
+        digest.update(b"array;" + repr((item.dtype.str, item.shape)).encode())
+        item_bytes = np.ascontiguousarray(item).tobytes()
+    else:
+        item_bytes = ("%s:%r" % (type(item).__name__, item)).encode()
+
+    ## length prefix so adjacent items can't run into each other
+    digest.update(b"%d;" % len(item_bytes))
+    digest.update(item_bytes)
+
+
+class ResultCache:
+    """
+    Size bounded, least recently used store of datetime indexed series
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_in_bytes: int = DEFAULT_MAX_CACHE_SIZE_IN_BYTES,
+    ):
+        self._cache_dir = Path(cache_dir)
+        self._max_size_in_bytes = max_size_in_bytes
+
+    def get_or_calculate(self, key: str, calculation: Callable) -> pd.Series:
+        series = self.get(key)
+        if series is None:
+            series = calculation()
+            self.put(key, series)
+
+        return series
+
+    def get(self, key: str) -> Optional[pd.Series]:
+        path = self._path_for_key(key)
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                series = _series_from_arrays(stored)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            ## missing, or partly written by a process that was killed
+            return None
+
+        ## the modification time records when a file was last used
+        os.utime(path)
+
+        return series
+
+    def put(self, key: str, series: pd.Series):
+        if not isinstance(series.index, pd.DatetimeIndex):
+            ## only datetime indexed series are stored
+            return
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path_for_key(key)
+        temporary_path = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+        with open(temporary_path, "wb") as temporary_file:
+            np.savez(temporary_file, **_arrays_from_series(series))
+        os.replace(temporary_path, path)
+
+        self._evict_least_recently_used()
+
+    def clear(self):
+        for path in self._cached_files():
+            path.unlink(missing_ok=True)
+
+    def size_in_bytes(self) -> int:
+        return sum(size for _, size, _ in self._cached_files_with_stats())
+
+    def _evict_least_recently_used(self):
+        files_with_stats = self._cached_files_with_stats()
+        total_size = sum(size for _, size, _ in files_with_stats)
+        if total_size <= self.max_size_in_bytes:
+            return
+
+        for path, size, _ in sorted(files_with_stats, key=lambda stats: stats[2]):
+            path.unlink(missing_ok=True)
+            total_size -= size
+            if total_size <= self.max_size_in_bytes:
+                break
+
+    def _cached_files_with_stats(self) -> list:
+        files_with_stats = []
+        for path in self._cached_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files_with_stats.append((path, stat.st_size, stat.st_mtime_ns))
+
+        return files_with_stats
+
+    def _cached_files(self) -> list:
+        if not self.cache_dir.is_dir():
+            return []
+
+        return list(self.cache_dir.glob("*" + _CACHE_FILE_SUFFIX))
+
+    def _path_for_key(self, key: str) -> Path:
+        return self.cache_dir / (key + _CACHE_FILE_SUFFIX)
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir
+
+    @property
+    def max_size_in_bytes(self) -> int:
+        return self._max_size_in_bytes
+
+
+def _arrays_from_series(series: pd.Series) -> dict:
+    index = series.index
+    arrays = dict(
+        timestamps=index.as_unit("ns").asi8,
+        values=series.to_numpy(dtype=float, na_value=np.nan),
+        tz=np.array("" if index.tz is None else str(index.tz)),
+        freq=np.array("" if index.freq is None else index.freqstr),
+    )
+    if series.name is not None:
+        arrays["name"] = np.array(str(series.name))
+
+    return arrays
+
+
+def _series_from_arrays(stored) -> pd.Series:
+    index = pd.DatetimeIndex(stored["timestamps"].view("M8[ns]"))
+    tz = str(stored["tz"])
+    if tz:
+        index = index.tz_localize("UTC").tz_convert(tz)
+    freq = str(stored["freq"])
+    if freq:
+        index.freq = freq
+    name = str(stored["name"]) if "name" in stored.files else None
+
+    return pd.Series(stored["values"], index=index, name=name)
@@ -0,0 +1,147 @@
+"""
+O(n) rolling window primitives for NumPy arrays.
+
+Windows are trailing and run down axis 0, so 2-D (time x column) arrays are
+handled column by column. A window of None means an expanding window. Sums
+come from differences of cumulative sums, and maxima and minima from the van
+Herk / Gil-Werman block algorithm, so the cost doesn't depend on the window
+length. Exponentially weighted means can't be written as window differences,
+so they come from pandas' ewm, which runs over every column of one frame.
+"""
+
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+
+def rolling_sum(values: np.ndarray, window: Optional[int]) -> np.ndarray:
+    """
+    Sum over each trailing window, with nans counted as zero; partial windows
+    at the start are summed as they are
+
+    >>> rolling_sum(np.array([1.0, 2.0, np.nan, 4.0]), 2)
+    array([1., 3., 2., 4.])
+    """
+    cumulated = np.cumsum(np.nan_to_num(values), axis=0)
+    if window is None or window >= len(values):
+        return cumulated
+
+    summed = cumulated.copy()
+    summed[window:] -= cumulated[:-window]
+
+    return summed
+
+
+def rolling_count(values: np.ndarray, window: Optional[int]) -> np.ndarray:
+    """
+    Number of non nan values in each trailing window
+
+    >>> rolling_count(np.array([1.0, 2.0, np.nan, 4.0]), 2)
+    array([1, 2, 1, 1])
+    """
+    return rolling_sum((~np.isnan(values)).astype(int), window)
+
+
+def rolling_window_length(length: int, window: Optional[int]) -> np.ndarray:
+    """
+    Periods in each trailing window, nan or not
+
+    >>> rolling_window_length(4, 2)
+    array([1, 2, 2, 2])
+    """
+    periods = np.arange(1, length + 1)
+    if window is None:
+        return periods
+
+    return np.minimum(periods, window)
+
+
+def rolling_max(values: np.ndarray, window: Optional[int]) -> np.ndarray:
+    """
+    Max of each trailing window, ignoring nans (nan if all are nan)
+
+    >>> rolling_max(np.array([3.0, 1.0, np.nan, 2.0, 0.0, 5.0]), 3)
+    array([3., 3., 3., 2., 2., 5.])
+    """
+    if window is None or window >= len(values):
+        return np.fmax.accumulate(values, axis=0) if len(values) else values
+
+    ## within blocks of `window` rows, the max from the start of the block
+    ## up to each row, and from each row to the end of the block; every
+    ## trailing window is the tail of one block plus the head of the next
+    length = len(values)
+    padding = np.full(((-length) % window,) + values.shape[1:], np.nan)
+    blocks = np.concatenate([values, padding]).reshape((-1, window) + values.shape[1:])
+    from_block_start = np.fmax.accumulate(blocks, axis=1).reshape(
+        (-1,) + values.shape[1:]
+    )
+    to_block_end = np.fmax.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(
+        (-1,) + values.shape[1:]
+    )
+
+    maximum = np.empty(values.shape, dtype=float)
+    maximum[: window - 1] = np.fmax.accumulate(values[: window - 1], axis=0)
+    maximum[window - 1 :] = np.fmax(
+        to_block_end[: length - window + 1], from_block_start[window - 1 : length]
+    )
+
+    return maximum
+
+
+def rolling_min(values: np.ndarray, window: Optional[int]) -> np.ndarray:
+    """
+    >>> rolling_min(np.array([3.0, 1.0, np.nan, 2.0, 0.0, 5.0]), 3)
+    array([3., 1., 1., 1., 0., 0.])
+    """
+    return -rolling_max(-values, window)
+
+
+def rolling_mean(
+    values: np.ndarray, window: Optional[int], min_periods: Optional[int] = None
+) -> np.ndarray:
+    """
+    Mean of the non nan values in each trailing window, nan where there are
+    fewer than min_periods of them (by default a full window), as
+    rolling(window, min_periods).mean()
+
+    >>> rolling_mean(np.array([1.0, 2.0, np.nan, 4.0, 6.0]), 2, min_periods=1)
+    array([1. , 1.5, 2. , 4. , 5. ])
+    """
+    if min_periods is None:
+        min_periods = 1 if window is None else window
+    count = rolling_count(values, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = rolling_sum(values, window) / count
+
+    return np.where(count >= max(min_periods, 1), mean, np.nan)
+
+
+def ewma(
+    values: np.ndarray,
+    span: Optional[float] = None,
+    alpha: Optional[float] = None,
+    adjust: bool = True,
+    min_periods: int = 0,
+) -> np.ndarray:
+    """
+    Exponentially weighted mean down axis 0, as ewm(span=span, alpha=alpha,
+    adjust=adjust, min_periods=min_periods).mean() with ignore_na=False
+
+    >>> ewma(np.array([1.0, np.nan, 3.0]), alpha=0.5, adjust=False)
+    array([1.        , 1.        , 2.33333333])
+    """
+    if alpha is None:
+        if span is None:
+            raise Exception("Need one of span or alpha for an exponential mean")
+        alpha = 2.0 / (span + 1.0)
+
+    values = np.asarray(values, dtype=float)
+    ## pandas' compiled recurrence runs over all the columns in one call
+    averaged = (
+        pd.DataFrame(values.reshape(values.shape[0], int(np.prod(values.shape[1:]))))
+        .ewm(alpha=alpha, adjust=adjust, min_periods=min_periods)
+        .mean()
+        .to_numpy()
+    )
+
+    return averaged.reshape(values.shape)
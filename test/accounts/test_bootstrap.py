@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+from src.accounts.bootstrap import (
+    BOOTSTRAP_STATISTICS,
+    bootstrap_curve_statistics,
+    batch_statistics,
+    resample_indices,
+)
+from src.accounts.curve_stats import calculate_curve_statistics
+
+
+class TestBootstrap(unittest.TestCase):
+    """
+    Test bootstrap distributions of curve statistics
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.values = rng.normal(0.05, 1.0, 1000)
+        self.values[:5] = np.nan
+
+    def test_batch_statistics_match_curve_statistics(self):
+        """
+        Column-wise statistics match the single curve engine
+        """
+        returns = np.stack([self.values, self.values[::-1] * 2.0], axis=1)
+        statistics = batch_statistics(returns, times_per_year=256.0)
+        for column in range(2):
+            curve_statistics = calculate_curve_statistics(
+                returns[:, column], times_per_year=256.0
+            )
+            for stat_name in BOOTSTRAP_STATISTICS:
+                self.assertAlmostEqual(
+                    statistics[stat_name][column], getattr(curve_statistics, stat_name)
+                )
+
+        curve = np.nancumsum(returns, axis=0)[5:]
+        np.testing.assert_allclose(
+            statistics["worst_drawdown"],
+            (curve - np.maximum.accumulate(curve, axis=0)).min(axis=0),
+        )
+
+    def test_sortino_of_large_losses(self):
+        """
+        The loss std is found from demeaned losses, so isn't lost to rounding
+        when losses are large next to their spread
+        """
+        rng = np.random.default_rng(3)
+        returns = np.where(
+            rng.random(500) < 0.5,
+            -1e6 + rng.normal(0.0, 1e-3, 500),
+            1e6 + 1.0,
+        )
+        sortino = batch_statistics(returns[:, np.newaxis], times_per_year=256.0)[
+            "sortino"
+        ][0]
+        ann_mean = returns.sum() / (len(returns) / 256.0)
+        expected = ann_mean / (np.std(returns[returns < 0]) * 16.0)
+        self.assertAlmostEqual(sortino / expected, 1.0, places=6)
+
+    def test_seeded_and_independent_of_pool(self):
+        """
+        The same seed gives the same resamples, with or without a process pool
+        """
+        in_process = bootstrap_curve_statistics(
+            self.values,
+            256.0,
+            n_resamples=300,
+            block_length=10,
+            seed=7,
+            resamples_per_batch=100,
+        )
+        pooled = bootstrap_curve_statistics(
+            self.values,
+            256.0,
+            n_resamples=300,
+            block_length=10,
+            seed=7,
+            max_workers=2,
+            resamples_per_batch=100,
+        )
+        self.assertEqual(in_process.n_resamples, 300)
+        for statistic in BOOTSTRAP_STATISTICS:
+            np.testing.assert_array_equal(
+                in_process.resampled[statistic], pooled.resampled[statistic]
+            )
+
+        interval = in_process.as_frame()
+        self.assertTrue((interval.lower <= interval.upper).all())
+        self.assertLess(
+            interval.loc["sharpe", "lower"], interval.loc["sharpe", "estimate"]
+        )
+
+    def test_block_indices_are_contiguous(self):
+        """
+        Block resamples run through consecutive periods, wrapping at the end
+        """
+        indices = resample_indices(103, 50, 10, np.random.default_rng(0))
+        self.assertEqual(indices.shape, (103, 50))
+        steps = np.diff(indices[:100].reshape(10, 10, 50), axis=1) % 103
+        self.assertTrue((steps == 1).all())
@@ -0,0 +1,87 @@
+import unittest
+import pandas as pd
+import numpy as np
+from src.accounts.chunked_pandl import ChunkedProfitAndLoss, SeriesChunks
+from src.accounts.profit_and_loss import ProfitAndLossWithTradeCosts
+from src.utils.references import arg_not_supplied, curve_types, Frequency
+
+
+class TestChunkedProfitAndLoss(unittest.TestCase):
+    """
+    Test chunked P&L against the full calculator
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(
+            start="2024-01-02 09:30", periods=5000, freq="37s", tz="US/Eastern"
+        )
+        self.price = pd.Series(100 + np.cumsum(rng.normal(0, 0.01, 5000)), index)
+        self.price[rng.random(5000) < 0.01] = np.nan
+        self.positions = pd.Series(rng.normal(0, 3, 5000), index).iloc[::5]
+        self.positions.iloc[:10] = np.nan
+        fx_index = pd.date_range(
+            start="2024-01-01", periods=5, freq="D", tz="US/Eastern"
+        )
+        self.fx = pd.Series(rng.uniform(0.9, 1.1, 5), index=fx_index)
+        self.calculator_kwargs = dict(
+            value_per_point=5.0,
+            roundpositions=True,
+            delayfill=True,
+            commission_per_contract=1.0,
+            percentage_fee=0.0001,
+            spread_in_points=0.02,
+        )
+        self.pandl_calculator = ProfitAndLossWithTradeCosts(
+            self.price,
+            self.positions,
+            fx=self.fx,
+            capital=100000,
+            passed_diagnostic_df=arg_not_supplied,
+            **self.calculator_kwargs,
+        )
+
+    def test_matches_full_calculator(self):
+        """
+        Every curve type matches, whatever the chunk size
+        """
+        for rows_per_chunk in [333, 5000]:
+            chunked_pandl = ChunkedProfitAndLoss(
+                SeriesChunks(self.price, self.positions, rows_per_chunk),
+                fx=self.fx,
+                capital=100000,
+                **self.calculator_kwargs,
+            )
+            for curve_type in curve_types:
+                for percent in [False, True]:
+                    pd.testing.assert_series_equal(
+                        chunked_pandl.as_pd_series_for_frequency(
+                            frequency=Frequency.HOUR,
+                            percent=percent,
+                            curve_type=curve_type,
+                        ),
+                        self.pandl_calculator.as_pd_series_for_frequency(
+                            frequency=Frequency.HOUR,
+                            percent=percent,
+                            curve_type=curve_type,
+                        ),
+                        check_freq=False,
+                    )
+
+    def test_periods_emitted_once_complete(self):
+        """
+        Each chunk yields only whole periods, with the last held back
+        """
+        chunked_pandl = ChunkedProfitAndLoss(
+            SeriesChunks(self.price, self.positions, 200),
+            fx=self.fx,
+            capital=100000,
+            **self.calculator_kwargs,
+        )
+        resampled_pieces = list(
+            chunked_pandl.iter_pd_series_for_frequency(frequency=Frequency.HOUR)
+        )
+        self.assertEqual(len(resampled_pieces), 26)
+        labels = pd.concat(resampled_pieces).index
+        self.assertTrue(labels.is_unique)
+        self.assertTrue(labels.is_monotonic_increasing)
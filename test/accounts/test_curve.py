@@ -0,0 +1,403 @@
+import unittest
+from unittest.mock import patch
+import pandas as pd
+import numpy as np
+from src.accounts.curve import (
+    AccountCurve,
+    LazyAccountCurve,
+    demeaned_remove_zeros,
+    quant_ratio_lower_curve,
+)
+from src.accounts.curve_stats import (
+    calculate_curve_statistics,
+    calculate_tail_statistics,
+)
+from src.accounts.drawdown import drawdown_episodes
+from src.accounts.rolling import RollingCurveStatistics
+from src.accounts.profit_and_loss import (
+    ProfitAndLossWithSharpeRatioCosts,
+    get_average_notional_position,
+)
+from src.strategies.vol import robust_daily_vol_given_price
+from src.utils.references import arg_not_supplied, Frequency, NET_CURVE, GROSS_CURVE
+
+
+def build_pandl_calculator(n_days: int = 600, seed: int = 42):
+    """
+    Synthetic price and position history wrapped in a P&L calculator
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start="2020-01-01", periods=n_days, freq="B")
+    price = pd.Series(np.cumsum(rng.normal(0, 1, n_days)) + 100, index=dates)
+    daily_returns_volatility = robust_daily_vol_given_price(price)
+    average_position = get_average_notional_position(daily_returns_volatility)
+    positions = average_position * rng.normal(0, 1, n_days)
+
+    return ProfitAndLossWithSharpeRatioCosts(
+        price=price,
+        positions=positions,
+        fx=arg_not_supplied,
+        capital=100000,
+        value_per_point=1.0,
+        roundpositions=False,
+        delayfill=True,
+        passed_diagnostic_df=arg_not_supplied,
+        SR_cost=0.01,
+        average_position=average_position,
+        daily_returns_volatility=daily_returns_volatility,
+    )
+
+
+class TestCurveStatistics(unittest.TestCase):
+    """
+    Test the single pass statistics engine against the per metric methods
+    """
+
+    def setUp(self):
+        self.account_curve = AccountCurve(build_pandl_calculator())
+
+    def test_stats_match_individual_methods(self):
+        """
+        Every statistic should match the value from the matching method
+        """
+        curve_statistics = self.account_curve.curve_statistics()
+        for stat_name, _ in curve_statistics.as_list():
+            expected = getattr(self.account_curve, stat_name)()
+            self.assertTrue(
+                np.isclose(getattr(curve_statistics, stat_name), expected),
+                stat_name,
+            )
+
+    def test_drawdown_episodes_found_once(self):
+        """
+        The drawdown methods and stats() share one set of episodes
+        """
+        with patch(
+            "src.accounts.curve.drawdown_episodes", wraps=drawdown_episodes
+        ) as mock_drawdown_episodes:
+            account_curve = AccountCurve(build_pandl_calculator())
+            account_curve.stats()
+            account_curve.avg_drawdown()
+            account_curve.worst_drawdown()
+            account_curve.time_in_drawdown()
+            account_curve.calmar()
+            account_curve.avg_return_to_drawdown()
+            self.assertEqual(mock_drawdown_episodes.call_count, 1)
+
+        curve_statistics = account_curve.curve_statistics()
+        self.assertAlmostEqual(
+            curve_statistics.avg_drawdown, account_curve.avg_drawdown()
+        )
+        self.assertAlmostEqual(curve_statistics.calmar, account_curve.calmar())
+
+    def test_cache_follows_changes_in_place(self):
+        """
+        Changing the curve in place isn't hidden by cached statistics
+        """
+        account_curve = AccountCurve(build_pandl_calculator())
+        account_curve.stats()
+        account_curve.worst_drawdown()
+        account_curve.iloc[10] = -1e7
+
+        curve_statistics = account_curve.curve_statistics()
+        self.assertAlmostEqual(curve_statistics.sharpe, account_curve.sharpe())
+        self.assertLess(account_curve.worst_drawdown(), -1e7 + 1)
+        self.assertAlmostEqual(
+            curve_statistics.avg_drawdown,
+            np.nanmean(account_curve.drawdown().values),
+        )
+
+    def test_stats_output_format(self):
+        """
+        stats() keeps its list of formatted (name, value) pairs
+        """
+        build_stats, comment = self.account_curve.stats()
+        self.assertEqual(len(build_stats), 21)
+        self.assertEqual(build_stats[8][0], "sharpe")
+        self.assertEqual(
+            build_stats[8][1], "{0:.4g}".format(self.account_curve.sharpe())
+        )
+        self.assertEqual(comment[0], "You can also plot / print:")
+
+    def test_tail_statistics(self):
+        """
+        Quant ratios match quantiles of the demeaned non zero returns, and
+        the curve's zeros are left in place
+        """
+        returns = self.account_curve.as_ts.copy()
+        returns.iloc[::10] = 0.0
+        zero_count = (returns == 0).sum()
+        demeaned = demeaned_remove_zeros(returns)
+        self.assertEqual((returns == 0).sum(), zero_count)
+
+        tail_statistics = calculate_tail_statistics(returns.values)
+        for percentile, quantile in tail_statistics.quantiles.items():
+            self.assertAlmostEqual(quantile, demeaned.quantile(percentile))
+        self.assertAlmostEqual(
+            quant_ratio_lower_curve(returns), tail_statistics.quant_ratio_lower
+        )
+        self.assertAlmostEqual(
+            self.account_curve.average_quant_ratio(),
+            np.mean(
+                [
+                    self.account_curve.quant_ratio_lower(),
+                    self.account_curve.quant_ratio_upper(),
+                ]
+            ),
+        )
+
+    def test_columns_match_single_curves(self):
+        """
+        A 2-D input gives the same answer as each column on its own
+        """
+        rng = np.random.default_rng(0)
+        values = rng.normal(0, 1, (300, 3))
+        values[:5, 1] = np.nan
+        values[100:110, 2] = np.nan
+        by_column = calculate_curve_statistics(values, times_per_year=256.0)
+        for column in range(values.shape[1]):
+            single = calculate_curve_statistics(values[:, column], 256.0)
+            np.testing.assert_allclose(by_column.sharpe[column], single.sharpe)
+            np.testing.assert_allclose(
+                by_column.avg_drawdown[column], single.avg_drawdown
+            )
+            np.testing.assert_allclose(by_column.median[column], single.median)
+
+
+class TestDerivedCurves(unittest.TestCase):
+    """
+    Test that derived account curves share the calculator's cached series
+    """
+
+    def setUp(self):
+        self.pandl_calculator = build_pandl_calculator()
+        self.account_curve = AccountCurve(self.pandl_calculator)
+
+    def test_derived_curves_reuse_pandl(self):
+        """
+        Changing frequency or curve type does not rerun the P&L chain
+        """
+        with patch.object(
+            self.pandl_calculator,
+            "pandl_in_points",
+            wraps=self.pandl_calculator.pandl_in_points,
+        ) as mock_pandl_in_points:
+            self.account_curve.weekly
+            self.account_curve.monthly.gross
+            self.account_curve.to_ncg_frame()
+            mock_pandl_in_points.assert_not_called()
+
+    def test_net_is_gross_plus_costs(self):
+        """
+        The net curve built from cached parts matches the direct calculation
+        """
+        ncg_frame = self.account_curve.to_ncg_frame()
+        expected_net = (
+            self.pandl_calculator.net_pandl_in_base_currency().resample("B").sum()
+        )
+        pd.testing.assert_series_equal(
+            ncg_frame[NET_CURVE], expected_net, check_names=False, check_freq=False
+        )
+
+    def test_cached_series_are_not_shared(self):
+        """
+        Modifying one curve leaves the cached series untouched
+        """
+        weekly = self.account_curve.weekly
+        weekly.iloc[:] = 0.0
+        self.assertNotEqual(self.account_curve.weekly.abs().sum(), 0.0)
+        self.assertEqual(
+            self.pandl_calculator.as_pd_series_for_frequency(
+                frequency=Frequency.WEEK, percent=False, curve_type=NET_CURVE
+            )
+            .abs()
+            .sum(),
+            self.account_curve.weekly.abs().sum(),
+        )
+
+
+class TestLazyAccountCurve(unittest.TestCase):
+    """
+    Test that lazy curves defer the P&L series until values are used
+    """
+
+    def setUp(self):
+        self.pandl_calculator = build_pandl_calculator()
+
+    def test_series_deferred_until_values_used(self):
+        """
+        Metadata and derived curves don't compute the series
+        """
+        with patch.object(
+            self.pandl_calculator,
+            "as_pd_series_for_frequency",
+            wraps=self.pandl_calculator.as_pd_series_for_frequency,
+        ) as mock_as_pd_series:
+            lazy_curve = LazyAccountCurve(self.pandl_calculator)
+            lazy_curve.length_in_months
+            lazy_curve.capital
+            weekly_gross = lazy_curve.weekly.gross
+            mock_as_pd_series.assert_not_called()
+            self.assertFalse(lazy_curve.is_evaluated)
+
+            lazy_curve.sharpe()
+            lazy_curve.stats()
+            self.assertEqual(mock_as_pd_series.call_count, 1)
+            self.assertTrue(lazy_curve.is_evaluated)
+
+        expected = AccountCurve(
+            self.pandl_calculator, frequency=Frequency.WEEK, curve_type=GROSS_CURVE
+        )
+        np.testing.assert_array_equal(np.asarray(weekly_gross), expected.values)
+        self.assertEqual(len(weekly_gross), len(expected))
+        self.assertAlmostEqual(weekly_gross.sharpe(), expected.sharpe())
+
+    def test_behaves_as_series(self):
+        """
+        Operators, numpy and pd.concat see the same values as an AccountCurve
+        """
+        expected = AccountCurve(self.pandl_calculator)
+        lazy_curve = LazyAccountCurve(self.pandl_calculator)
+        self.assertIsInstance(lazy_curve, pd.Series)
+        self.assertIsInstance(lazy_curve, AccountCurve)
+
+        pd.testing.assert_series_equal(lazy_curve * 2, expected * 2)
+        pd.testing.assert_series_equal(lazy_curve > 0, expected > 0)
+        self.assertTrue(lazy_curve.is_evaluated)
+        self.assertEqual(np.sum(lazy_curve), np.sum(expected))
+
+        ## each side of an operation or concat evaluated when used
+        pd.testing.assert_series_equal(
+            expected + LazyAccountCurve(self.pandl_calculator), expected * 2
+        )
+        pd.testing.assert_frame_equal(
+            pd.concat([LazyAccountCurve(self.pandl_calculator), expected], axis=1),
+            pd.concat([expected, expected], axis=1),
+        )
+        self.assertEqual(
+            list(LazyAccountCurve(self.pandl_calculator).gross.index),
+            list(expected.index),
+        )
+
+
+class TestDrawdownEpisodes(unittest.TestCase):
+    """
+    Test the drawdown episode index against the underwater series
+    """
+
+    def setUp(self):
+        self.account_curve = AccountCurve(build_pandl_calculator())
+
+    def test_metrics_match_underwater_series(self):
+        """
+        Drawdown metrics from the episodes match the drawdown() series
+        """
+        underwater = self.account_curve.drawdown()
+        self.assertAlmostEqual(
+            self.account_curve.avg_drawdown(), np.nanmean(underwater.values)
+        )
+        self.assertAlmostEqual(
+            self.account_curve.worst_drawdown(), np.nanmin(underwater.values)
+        )
+        underwater = underwater.dropna()
+        self.assertAlmostEqual(
+            self.account_curve.time_in_drawdown(),
+            (underwater < 0).sum() / len(underwater),
+        )
+
+    def test_episodes(self):
+        """
+        Episodes cover every period under water, each with its trough
+        """
+        underwater = self.account_curve.drawdown().values
+        episodes = self.account_curve.drawdown_episodes()
+        self.assertEqual(episodes.duration.sum(), (underwater < 0).sum())
+        np.testing.assert_allclose(episodes.depth, underwater[episodes.trough])
+        for start, recovery in zip(episodes.start, episodes.recovery):
+            self.assertLess(underwater[start], 0.0)
+            self.assertEqual(underwater[start - 1], 0.0)
+            if recovery != -1:
+                self.assertEqual(underwater[recovery], 0.0)
+
+        episodes_frame = episodes.as_frame()
+        self.assertEqual(len(episodes_frame), len(episodes))
+        self.assertEqual(
+            episodes_frame.trough.iloc[0],
+            self.account_curve.index[episodes.trough[0]],
+        )
+
+
+class TestRollingStatistics(unittest.TestCase):
+    """
+    Test rolling and expanding statistics against the whole curve versions
+    """
+
+    def setUp(self):
+        self.account_curve = AccountCurve(build_pandl_calculator())
+
+    def test_rolling_matches_pandas(self):
+        """
+        Rolling mean, std and drawdown match pandas for each window
+        """
+        returns = self.account_curve.as_ts
+        rolling_stats = self.account_curve.rolling_stats(windows=[20, 100])
+        for window in [20, 100]:
+            rolling = returns.rolling(window)
+            np.testing.assert_allclose(
+                rolling_stats[(window, "mean")], rolling.mean(), equal_nan=True
+            )
+            np.testing.assert_allclose(
+                rolling_stats[(window, "std")], rolling.std(), equal_nan=True
+            )
+            curve = self.account_curve.curve()
+            underwater = curve - curve.rolling(window, min_periods=1).max()
+            ## like the other statistics, nan until the window is full
+            np.testing.assert_allclose(
+                rolling_stats[(window, "drawdown")].iloc[window - 1 :],
+                underwater.iloc[window - 1 :],
+            )
+
+    def test_window_matches_curve_statistics(self):
+        """
+        Each rolling value is the statistic of the window ending there
+        """
+        rolling_stats = self.account_curve.rolling_stats(windows=[50])
+        expanding_stats = self.account_curve.expanding_stats()
+        for end in [60, 301, len(self.account_curve) - 1]:
+            window_statistics = calculate_curve_statistics(
+                self.account_curve.values[end - 49 : end + 1],
+                times_per_year=self.account_curve.returns_scalar,
+            )
+            expanding_statistics = calculate_curve_statistics(
+                self.account_curve.values[: end + 1],
+                times_per_year=self.account_curve.returns_scalar,
+            )
+            for stat_name in ["skew", "sharpe", "sortino", "hitrate", "t_stat"]:
+                self.assertAlmostEqual(
+                    rolling_stats[(50, stat_name)].iloc[end],
+                    getattr(window_statistics, stat_name),
+                )
+                self.assertAlmostEqual(
+                    expanding_stats[stat_name].iloc[end],
+                    getattr(expanding_statistics, stat_name),
+                )
+
+    def test_sortino_of_large_losses(self):
+        """
+        Rolling sortino stays accurate when losses are large next to their
+        spread
+        """
+        rng = np.random.default_rng(3)
+        values = np.where(
+            rng.random(500) < 0.5,
+            -1e6 + rng.normal(0.0, 1e-3, 500),
+            1e6 + 1.0,
+        )
+        rolling_sortino = RollingCurveStatistics(values, 256.0).for_window(100)[
+            "sortino"
+        ]
+        for end in [99, 250, 499]:
+            expected = calculate_curve_statistics(
+                values[end - 99 : end + 1], times_per_year=256.0
+            ).sortino
+            self.assertAlmostEqual(rolling_sortino[end] / expected, 1.0, places=6)
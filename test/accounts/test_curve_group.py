@@ -0,0 +1,99 @@
+import unittest
+import numpy as np
+from src.accounts.curve import AccountCurve
+from src.accounts.curve_group import AccountCurveGroup
+from src.accounts.panel import PanelProfitAndLoss
+from test.accounts.test_curve import build_pandl_calculator
+
+
+class TestAccountCurveGroup(unittest.TestCase):
+    """
+    Test column-wise group statistics against the member curves
+    """
+
+    def setUp(self):
+        self.account_curves = {
+            "strategy_%d" % seed: AccountCurve(build_pandl_calculator(seed=seed))
+            for seed in range(4)
+        }
+        self.group = AccountCurveGroup.from_account_curves(self.account_curves)
+
+    def test_stats_match_member_curves(self):
+        """
+        Every column of stats() matches the member's own statistics
+        """
+        stats = self.group.stats()
+        self.assertEqual(list(stats.columns), list(self.account_curves))
+        for name, account_curve in self.account_curves.items():
+            for stat_name, _ in account_curve.curve_statistics().as_list():
+                self.assertTrue(
+                    np.isclose(
+                        stats.loc[stat_name, name],
+                        getattr(account_curve.curve_statistics(), stat_name),
+                        equal_nan=True,
+                    ),
+                    stat_name,
+                )
+            self.assertAlmostEqual(self.group.sharpe()[name], account_curve.sharpe())
+            self.assertAlmostEqual(
+                self.group.worst_drawdown()[name], account_curve.worst_drawdown()
+            )
+
+    def test_members_of_different_lengths(self):
+        """
+        A short member padded onto a longer member's index keeps its own
+        annualised and drawdown statistics
+        """
+        account_curves = dict(
+            short=AccountCurve(build_pandl_calculator(n_days=300, seed=1)),
+            long=AccountCurve(build_pandl_calculator(n_days=600, seed=2)),
+        )
+        group = AccountCurveGroup.from_account_curves(account_curves)
+        self.assertGreater(group.as_frame["short"].isna().sum(), 0)
+        for name, account_curve in account_curves.items():
+            self.assertAlmostEqual(group.sharpe()[name], account_curve.sharpe())
+            self.assertAlmostEqual(group.ann_mean()[name], account_curve.ann_mean())
+            self.assertAlmostEqual(group.calmar()[name], account_curve.calmar())
+            self.assertAlmostEqual(
+                group.avg_drawdown()[name], account_curve.avg_drawdown()
+            )
+            self.assertAlmostEqual(
+                group.time_in_drawdown()[name], account_curve.time_in_drawdown()
+            )
+            self.assertAlmostEqual(
+                group.avg_return_to_drawdown()[name],
+                account_curve.avg_return_to_drawdown(),
+            )
+
+        ## without the member curves, padding is found from the returns
+        returns_only = AccountCurveGroup(group.as_frame)
+        self.assertEqual(
+            returns_only.lengths["short"], group.as_frame["short"].notna().sum()
+        )
+        self.assertAlmostEqual(
+            returns_only.sharpe()["short"], account_curves["short"].sharpe()
+        )
+
+    def test_portfolio_and_drill_down(self):
+        """
+        The portfolio sums the members, and members come back as curves
+        """
+        portfolio = self.group.portfolio()
+        expected = sum(curve.as_ts for curve in self.account_curves.values())
+        np.testing.assert_allclose(
+            portfolio.as_frame.iloc[:, 0].values, expected.values
+        )
+        self.assertEqual(len(portfolio.sharpe()), 1)
+        self.assertIs(self.group["strategy_2"], self.account_curves["strategy_2"])
+        self.assertEqual(len(self.group.select(["strategy_0", "strategy_3"])), 2)
+
+    def test_from_panel(self):
+        """
+        A panel group's members are the panel's instrument curves
+        """
+        price = self.group.as_frame.cumsum() / 1000.0 + 100.0
+        panel = PanelProfitAndLoss(price, price * 0.0 + 1.0, capital=1000.0)
+        group = AccountCurveGroup.from_panel(panel, is_percentage=True)
+        member = group.member("strategy_1")
+        np.testing.assert_allclose(group.as_frame["strategy_1"].values, member.values)
+        self.assertAlmostEqual(group.sharpe()["strategy_1"], member.sharpe())
@@ -1,9 +1,21 @@
 import unittest
+import tempfile
+from pathlib import Path
 import pytest
 import pandas as pd
 import numpy as np
 from src.strategies.vol import robust_daily_vol_given_price
-from src.strategies.trading_rule import EWMACTradingRule
+from src.strategies.trading_rule import EWMACTradingRule, MultiSpeedEWMACTradingRule
+from src.strategies.incremental_ewmac import IncrementalEWMAC
+from src.strategies.forecast_combination import (
+    combine_forecasts,
+    expanding_forecast_diversification_multiplier,
+)
+from src.strategies.forecast_scalar import (
+    ForecastScalarStore,
+    forecast_scalar_key,
+    pooled_forecast_scalar,
+)
 from src.accounts.profit_and_loss import (
     get_average_notional_position,
     get_notional_position_for_forecast,
@@ -120,3 +132,273 @@ class TestPositionSizing(unittest.TestCase):
             average_notional_position=aligned_average,
             notional_position=notional_position,
         )
+
+
+class TestMultiSpeedEWMAC(unittest.TestCase):
+    """
+    Test the multi speed EWMAC against one rule per speed
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        dates = pd.date_range(start="2015-01-01", periods=2000, freq="D")
+        self.price = pd.Series(100 + np.cumsum(rng.normal(0, 1, 2000)), index=dates)
+        self.price.iloc[::17] = np.nan
+        self.speeds = [(8, 32), (16, 64), (32, 128), (64, None)]
+
+    def test_forecast_matrix_matches_single_speeds(self):
+        """
+        Each column matches EWMACTradingRule at that speed
+        """
+        multi_speed_rule = MultiSpeedEWMACTradingRule(self.price, speeds=self.speeds)
+        multi_speed_rule.calculate_forecast()
+        multi_speed_rule.normalize_forecast(10.0)
+        self.assertEqual(
+            list(multi_speed_rule.forecast.columns),
+            ["ewmac8_32", "ewmac16_64", "ewmac32_128", "ewmac64_256"],
+        )
+        for fast, slow in multi_speed_rule.speeds:
+            ewmac_trading_rule = EWMACTradingRule(self.price, fast=fast, slow=slow)
+            ewmac_trading_rule.calculate_forecast()
+            ewmac_trading_rule.normalize_forecast(10.0)
+            speed_name = multi_speed_rule.speed_name(fast, slow)
+            pd.testing.assert_series_equal(
+                multi_speed_rule.forecast[speed_name],
+                ewmac_trading_rule.forecast,
+                check_names=False,
+            )
+            pd.testing.assert_series_equal(
+                multi_speed_rule.normalized_forecast[speed_name],
+                ewmac_trading_rule.normalized_forecast,
+                check_names=False,
+            )
+
+
+class TestIncrementalEWMAC(unittest.TestCase):
+    """
+    Test the streaming EWMAC against the batch rule
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        index = pd.date_range(start="2019-01-01 09:00", periods=4000, freq="7h")
+        self.price = pd.Series(100 + np.cumsum(rng.normal(0, 1, 4000)), index=index)
+        self.price.iloc[::23] = np.nan
+        ## a gap of several days without bars
+        self.price = self.price.drop(self.price.index[1000:1100])
+
+    def test_matches_batch_forecast(self):
+        """
+        Forecasts match EWMACTradingRule, period by period and from bars
+        """
+        ewmac_trading_rule = EWMACTradingRule(self.price, fast=16, slow=64)
+        ewmac_trading_rule.calculate_forecast()
+
+        by_period = IncrementalEWMAC(fast=16, slow=64)
+        streamed = [
+            by_period.update(period_price)
+            for period_price in ewmac_trading_rule.price.values
+        ]
+        np.testing.assert_allclose(
+            streamed, ewmac_trading_rule.forecast.values, rtol=1e-10
+        )
+
+        ## the last period is still open after the final bar
+        by_bar = IncrementalEWMAC.from_price(self.price, fast=16, slow=64)
+        self.assertAlmostEqual(
+            by_bar.forecast, ewmac_trading_rule.forecast.iloc[-2], places=10
+        )
+
+    def test_checkpoint_and_resume(self):
+        """
+        A loaded checkpoint carries on exactly as the original
+        """
+        history, live = self.price.iloc[:3000], self.price.iloc[3000:]
+        incremental_ewmac = IncrementalEWMAC.from_price(history, fast=8, slow=32)
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint_path = Path(checkpoint_dir) / "ewmac.json"
+            incremental_ewmac.save(checkpoint_path)
+            resumed = IncrementalEWMAC.load(checkpoint_path)
+
+        for timestamp, price in live.items():
+            self.assertEqual(
+                resumed.update_bar(timestamp, price),
+                incremental_ewmac.update_bar(timestamp, price),
+            )
+
+
+class TestForecastCombination(unittest.TestCase):
+    """
+    Test combining rule forecasts across a universe against pandas per instrument
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        dates = pd.date_range(start="2015-01-01", periods=1500, freq="B")
+        self.instruments = ["ES", "NQ", "CL"]
+        self.rules = ["ewmac8_32", "ewmac16_64", "ewmac32_128"]
+        common = rng.normal(0, 1, (1500, len(self.instruments), 1))
+        values = 0.6 * common + 0.8 * rng.normal(
+            0, 1, (1500, len(self.instruments), len(self.rules))
+        )
+        self.forecasts = pd.DataFrame(
+            values.reshape(1500, -1),
+            index=dates,
+            columns=pd.MultiIndex.from_product([self.instruments, self.rules]),
+        )
+        self.forecasts.iloc[:200, ::2] = np.nan
+        self.weights = pd.Series([0.5, 0.3, 0.2], index=self.rules)
+        self.forecast_scalars = pd.Series([8.0, 6.0, 4.0], index=self.rules)
+
+    def _expected_combined_forecast(self, instrument: str) -> pd.Series:
+        scaled = (self.forecasts[instrument] * self.forecast_scalars).clip(-20, 20)
+        weights = self.weights.values
+        ## re-estimated each year from the forecasts before it
+        fdm = pd.Series(np.nan, index=scaled.index)
+        for boundary in range(256, len(scaled), 256):
+            correlation = scaled.iloc[:boundary].corr().clip(lower=0).values
+            fdm.iloc[boundary:] = min(1 / np.sqrt(weights @ correlation @ weights), 2.5)
+        fdm = fdm.bfill()
+        available_weights = scaled.notna() * weights
+        weighted = (scaled.fillna(0) * available_weights).sum(
+            axis=1
+        ) / available_weights.sum(axis=1)
+
+        return (weighted * fdm).clip(-20, 20)
+
+    def test_universe_matches_per_instrument(self):
+        """
+        One call over the universe matches pandas one instrument at a time
+        """
+        combined = combine_forecasts(
+            self.forecasts, self.weights, forecast_scalars=self.forecast_scalars
+        )
+        self.assertEqual(list(combined.columns), self.instruments)
+        for instrument in self.instruments:
+            np.testing.assert_allclose(
+                combined[instrument].values,
+                self._expected_combined_forecast(instrument).values,
+                rtol=1e-10,
+            )
+            single = combine_forecasts(
+                self.forecasts[instrument],
+                self.weights,
+                forecast_scalars=self.forecast_scalars,
+            )
+            np.testing.assert_allclose(
+                single.values, combined[instrument].values, rtol=1e-12
+            )
+
+    def test_capped_and_sized_in_one_call(self):
+        """
+        Combined forecasts stay within the cap and size every instrument at once
+        """
+        combined = combine_forecasts(
+            self.forecasts * 10, self.weights, forecast_scalars=self.forecast_scalars
+        )
+        self.assertLessEqual(combined.abs().max().max(), 20.0)
+
+        average_notional_position = pd.DataFrame(
+            2.0, index=combined.index, columns=combined.columns
+        )
+        notional_position = get_notional_position_for_forecast(
+            combined / 10.0, average_notional_position
+        )
+        pd.testing.assert_frame_equal(notional_position, combined / 5.0)
+
+    def test_fdm_uses_no_later_forecasts(self):
+        """
+        Changing forecasts after a date leaves the combined forecast up to
+        the date unchanged, once past the first estimate
+        """
+        combined = combine_forecasts(
+            self.forecasts, self.weights, forecast_scalars=self.forecast_scalars
+        )
+        changed_forecasts = self.forecasts.copy()
+        changed_forecasts.iloc[1000:] = changed_forecasts.iloc[1000:, ::-1].values
+        changed = combine_forecasts(
+            changed_forecasts, self.weights, forecast_scalars=self.forecast_scalars
+        )
+        pd.testing.assert_frame_equal(changed.iloc[256:1000], combined.iloc[256:1000])
+        self.assertFalse(changed.iloc[1024:].equals(combined.iloc[1024:]))
+
+    def test_fdm_needs_min_periods(self):
+        """
+        An instrument's first estimate waits until it has min_periods dates
+        with a forecast
+        """
+        scaled_forecasts = self.forecasts.to_numpy().reshape(1500, 3, 3)
+        scaled_forecasts[:600, 1] = np.nan
+        fdm = expanding_forecast_diversification_multiplier(
+            scaled_forecasts, np.full((3, 3), 1 / 3), backfill=False
+        )
+        self.assertTrue(np.isnan(fdm[:256]).all())
+        self.assertFalse(np.isnan(fdm[256:, 0]).any())
+        ## 168 dates with a forecast by 768, 424 by 1024
+        self.assertTrue(np.isnan(fdm[:1024, 1]).all())
+        self.assertFalse(np.isnan(fdm[1024:, 1]).any())
+
+
+class TestForecastScalar(unittest.TestCase):
+    """
+    Test the pooled forecast scalar and its store
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(17)
+        dates = pd.date_range(start="2012-01-01", periods=1200, freq="B")
+        self.forecasts = pd.DataFrame(
+            rng.normal(0, 1, (1200, 4)) * [0.5, 1.0, 2.0, 4.0],
+            index=dates,
+            columns=["ES", "NQ", "CL", "GC"],
+        )
+        self.forecasts.iloc[:300, 2] = np.nan
+
+    def test_matches_expanding_mean_of_stacked_forecasts(self):
+        """
+        The scalar is the target over the expanding mean of every absolute
+        forecast so far, across all instruments
+        """
+        scalar = pooled_forecast_scalar(self.forecasts, min_periods=100)
+        abs_forecasts = self.forecasts.abs()
+        expected = 10.0 / (
+            abs_forecasts.sum(axis=1).cumsum() / abs_forecasts.count(axis=1).cumsum()
+        )
+        expected[abs_forecasts.count(axis=1).cumsum() < 100] = np.nan
+        pd.testing.assert_series_equal(scalar, expected.bfill(), check_names=False)
+
+    def test_store_updates_match_full_history(self):
+        """
+        Adding new dates to stored totals gives the full history scalar, and
+        the totals survive reopening the store
+        """
+        key = forecast_scalar_key("ewmac", fast=16, slow=64)
+        full_history_scalar = pooled_forecast_scalar(self.forecasts).iloc[-1]
+        with tempfile.TemporaryDirectory() as store_dir:
+            store_path = Path(store_dir) / "forecast_scalars.json"
+            ForecastScalarStore(store_path).update(key, self.forecasts.iloc[:800])
+
+            store = ForecastScalarStore(store_path)
+            self.assertIn(key, store)
+            self.assertEqual(store.last_timestamp(key), self.forecasts.index[799])
+            ## overlapping dates are only counted once
+            scalar = store.forecast_scalar(key, self.forecasts.iloc[500:])
+
+        self.assertAlmostEqual(scalar, full_history_scalar, places=10)
+
+    def test_normalize_forecast_with_scalar(self):
+        """
+        A scalar series is applied as at each forecast date
+        """
+        price = pd.Series(
+            100 + np.cumsum(np.random.default_rng(3).normal(0, 1, 1200)),
+            index=self.forecasts.index,
+        )
+        ewmac_trading_rule = EWMACTradingRule(price, fast=16, slow=64)
+        ewmac_trading_rule.calculate_forecast()
+        scalar = pooled_forecast_scalar(ewmac_trading_rule.forecast)
+        ewmac_trading_rule.normalize_forecast(10.0, forecast_scalar=scalar)
+        pd.testing.assert_series_equal(
+            ewmac_trading_rule.normalized_forecast,
+            ewmac_trading_rule.forecast * scalar / 10.0,
+        )
@@ -0,0 +1,99 @@
+import unittest
+import pandas as pd
+import numpy as np
+from src.accounts.curve import AccountCurve
+from src.accounts.incremental import RunningCurveStatistics
+from src.accounts.profit_and_loss import ProfitAndLossWithTradeCosts
+from src.utils.references import arg_not_supplied, curve_types
+
+STATISTICS_TO_CHECK = [
+    "mean",
+    "std",
+    "skew",
+    "ann_mean",
+    "ann_std",
+    "sharpe",
+    "avg_drawdown",
+    "worst_drawdown",
+    "time_in_drawdown",
+]
+
+
+class TestIncrementalAccountCurve(unittest.TestCase):
+    """
+    Test appending bars against rebuilding the whole account curve
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.bdate_range("2020-01-01", periods=400)
+        self.price = pd.Series(100 + np.cumsum(rng.normal(0, 1, 400)), index)
+        self.price.iloc[[50, 390]] = np.nan
+        self.positions = pd.Series(rng.normal(0, 3, 400), index)
+        self.positions.iloc[:5] = np.nan
+        self.positions.iloc[395] = np.nan
+
+    def build_pandl_calculator(self, number_of_bars: int, delayfill: bool):
+        return ProfitAndLossWithTradeCosts(
+            self.price.iloc[:number_of_bars],
+            self.positions.iloc[:number_of_bars],
+            fx=arg_not_supplied,
+            capital=100000,
+            value_per_point=5.0,
+            roundpositions=True,
+            delayfill=delayfill,
+            passed_diagnostic_df=arg_not_supplied,
+            commission_per_contract=1.0,
+            percentage_fee=0.001,
+            spread_in_points=0.1,
+        )
+
+    def test_appended_bars_match_full_curve(self):
+        """
+        Statistics after appending bars match a curve built over all of them
+        """
+        for delayfill in [False, True]:
+            for curve_type in curve_types:
+                for is_percentage in [False, True]:
+                    incremental_curve = AccountCurve(
+                        self.build_pandl_calculator(380, delayfill=delayfill),
+                        curve_type=curve_type,
+                        is_percentage=is_percentage,
+                    ).incremental()
+                    for price, position in zip(
+                        self.price.iloc[380:], self.positions.iloc[380:]
+                    ):
+                        incremental_curve.append(price, position)
+
+                    account_curve = AccountCurve(
+                        self.build_pandl_calculator(400, delayfill=delayfill),
+                        curve_type=curve_type,
+                        is_percentage=is_percentage,
+                    )
+                    statistics = incremental_curve.statistics
+                    for statistic in STATISTICS_TO_CHECK:
+                        self.assertAlmostEqual(
+                            getattr(statistics, statistic)(),
+                            getattr(account_curve, statistic)(),
+                            msg=statistic,
+                        )
+                    self.assertAlmostEqual(
+                        statistics.cumulative, account_curve.curve().iloc[-1]
+                    )
+
+    def test_updates_match_from_values(self):
+        """
+        Welford updates give the same state as the vectorised start
+        """
+        values = np.random.default_rng(0).normal(0, 1, 200)
+        values[[0, 1, 100]] = np.nan
+        running_statistics = RunningCurveStatistics(times_per_year=256.0)
+        for value in values:
+            running_statistics.update(value)
+        from_values = RunningCurveStatistics.from_values(values, times_per_year=256.0)
+        for statistic in STATISTICS_TO_CHECK:
+            self.assertAlmostEqual(
+                getattr(running_statistics, statistic)(),
+                getattr(from_values, statistic)(),
+                msg=statistic,
+            )
@@ -0,0 +1,392 @@
+import unittest
+from unittest.mock import patch
+import pandas as pd
+import numpy as np
+from src.accounts.curve import AccountCurve
+from src.accounts.panel import PanelProfitAndLossWithSharpeRatioCosts
+from src.accounts import profit_and_loss
+from src.accounts.profit_and_loss import (
+    ProfitAndLossWithSharpeRatioCosts,
+    ProfitAndLossWithTradeCosts,
+    get_average_notional_position,
+    calculate_pandl,
+    calculate_pandl_with_pandas,
+    calculate_SR_cost_per_period_of_position_data_match_price_index,
+    _calculate_SR_cost_per_period_with_pandas,
+)
+from src.strategies.vol import robust_daily_vol_given_price
+from src.utils.references import arg_not_supplied, curve_types
+
+
+class TestPandlKernel(unittest.TestCase):
+    """
+    Test the array P&L kernel against the pandas implementation
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2024-01-01", periods=5000, freq="5min")
+        self.prices = pd.Series(np.cumsum(rng.normal(0, 1, len(index))) + 100, index)
+        self.prices[rng.random(len(index)) < 0.02] = np.nan
+
+        ## positions on a coarser, partly duplicated index with gaps
+        position_index = index[::3].append(index[::7]).sort_values()
+        self.positions = pd.Series(
+            rng.normal(0, 5, len(position_index)), index=position_index
+        )
+        self.positions[rng.random(len(position_index)) < 0.05] = np.nan
+        self.positions.iloc[:20] = np.nan
+
+    def test_calculate_pandl_matches_pandas(self):
+        """
+        Points P&L should be identical to the concat/groupby/ffill version
+        """
+        pd.testing.assert_series_equal(
+            calculate_pandl(positions=self.positions, prices=self.prices),
+            calculate_pandl_with_pandas(positions=self.positions, prices=self.prices),
+            check_names=False,
+            check_freq=False,
+        )
+
+    def test_calculate_pandl_timezone(self):
+        """
+        Timezone aware indexes keep their timezone
+        """
+        prices = self.prices.tz_localize("US/Eastern")
+        positions = self.positions.tz_localize("US/Eastern")
+        pandl = calculate_pandl(positions=positions, prices=prices)
+        self.assertEqual(str(pandl.index.tz), "US/Eastern")
+        pd.testing.assert_series_equal(
+            pandl,
+            calculate_pandl_with_pandas(positions=positions, prices=prices),
+            check_names=False,
+            check_freq=False,
+        )
+
+    def test_SR_costs_match_pandas(self):
+        """
+        Sharpe ratio costs aligned with the kernel match the reindex version
+        """
+        positions = self.positions[~self.positions.index.duplicated()]
+        SR_cost = pd.Series(
+            -0.01, index=pd.date_range(start="2023-12-31", periods=30, freq="D")
+        )
+        SR_cost.iloc[:2] = np.nan
+        pd.testing.assert_series_equal(
+            calculate_SR_cost_per_period_of_position_data_match_price_index(
+                positions, price=self.prices, SR_cost_as_annualised_figure=SR_cost
+            ),
+            _calculate_SR_cost_per_period_with_pandas(
+                positions, price=self.prices, SR_cost_as_annualised_figure=SR_cost
+            ),
+            check_freq=False,
+        )
+
+
+class TestMemoizedCalculations(unittest.TestCase):
+    """
+    Test that intermediate series are calculated once per set of inputs
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2020-01-01", periods=300, freq="B")
+        self.price = pd.Series(np.cumsum(rng.normal(0, 1, 300)) + 100, index=index)
+        vol = robust_daily_vol_given_price(self.price)
+        average_position = get_average_notional_position(vol)
+        self.positions = average_position * rng.normal(0, 1, 300)
+        self.pandl_calculator = ProfitAndLossWithSharpeRatioCosts(
+            price=self.price,
+            positions=self.positions,
+            fx=arg_not_supplied,
+            capital=100000,
+            value_per_point=1.0,
+            roundpositions=False,
+            delayfill=True,
+            passed_diagnostic_df=arg_not_supplied,
+            SR_cost=0.01,
+            average_position=average_position,
+        )
+
+    def test_points_pandl_calculated_once(self):
+        """
+        Gross, costs and net in every currency share one points calculation
+        """
+        with patch.object(
+            profit_and_loss, "calculate_pandl", wraps=profit_and_loss.calculate_pandl
+        ) as mock_calculate_pandl:
+            self.pandl_calculator.net_pandl_in_base_currency()
+            self.pandl_calculator.net_percentage_pandl()
+            self.pandl_calculator.net_pandl_in_points()
+            self.assertEqual(mock_calculate_pandl.call_count, 1)
+
+    def test_changing_inputs_invalidates_cache(self):
+        """
+        New positions give a new P&L
+        """
+        pandl_in_points = self.pandl_calculator.pandl_in_points()
+        self.pandl_calculator.positions = self.positions * 2.0
+        pd.testing.assert_series_equal(
+            self.pandl_calculator.pandl_in_points(), pandl_in_points * 2.0
+        )
+
+
+class TestPanelProfitAndLoss(unittest.TestCase):
+    """
+    Test the panel calculator against one calculator per instrument
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2020-01-01", periods=400, freq="B")
+        self.instruments = ["A", "B", "C"]
+        self.price = pd.DataFrame(
+            np.cumsum(rng.normal(0, 1, (400, 3)), axis=0) + 100,
+            index=index,
+            columns=self.instruments,
+        )
+        self.price.iloc[5, 1] = np.nan
+        self.vol = robust_daily_vol_given_price(self.price)
+        self.average_position = get_average_notional_position(self.vol)
+        self.positions = self.average_position * rng.normal(0, 1, (400, 3))
+        self.fx = pd.DataFrame(
+            rng.uniform(0.9, 1.1, (400, 3)), index=index, columns=self.instruments
+        )
+        self.value_per_point = pd.Series([1.0, 2.0, 50.0], index=self.instruments)
+        self.SR_cost = pd.Series([0.01, 0.02, 0.0], index=self.instruments)
+        self.panel = PanelProfitAndLossWithSharpeRatioCosts(
+            self.price,
+            self.positions,
+            fx=self.fx,
+            capital=100000,
+            value_per_point=self.value_per_point,
+            delayfill=True,
+            SR_cost=self.SR_cost,
+            average_position=self.average_position,
+            daily_returns_volatility=self.vol,
+        )
+
+    def test_instrument_curves_match_single_calculators(self):
+        """
+        Each instrument view matches a single instrument calculator
+        """
+        for instrument in self.instruments:
+            single = ProfitAndLossWithSharpeRatioCosts(
+                price=self.price[instrument],
+                positions=self.positions[instrument],
+                fx=self.fx[instrument],
+                capital=100000,
+                value_per_point=self.value_per_point[instrument],
+                roundpositions=False,
+                delayfill=True,
+                passed_diagnostic_df=arg_not_supplied,
+                SR_cost=self.SR_cost[instrument],
+                average_position=self.average_position[instrument],
+                daily_returns_volatility=self.vol[instrument],
+            )
+            for curve_type in curve_types:
+                for is_percentage in [False, True]:
+                    expected = AccountCurve(
+                        single, curve_type=curve_type, is_percentage=is_percentage
+                    )
+                    panel_curve = self.panel.account_curve(
+                        instrument, curve_type=curve_type, is_percentage=is_percentage
+                    )
+                    np.testing.assert_allclose(panel_curve.values, expected.values)
+
+    def test_portfolio_curve_is_sum_of_instruments(self):
+        """
+        The portfolio curve adds up the instrument curves
+        """
+        portfolio_curve = self.panel.portfolio_account_curve()
+        instrument_sum = sum(
+            self.panel.account_curve(instrument).values
+            for instrument in self.instruments
+        )
+        np.testing.assert_allclose(portfolio_curve.values, instrument_sum)
+
+    def test_instrument_curve_does_not_share_the_cache(self):
+        """
+        Changing an instrument curve in place leaves the panel unchanged
+        """
+        cached_frame = self.panel.as_pd_frame_for_frequency().copy()
+        instrument_curve = self.panel.account_curve("A")
+        instrument_curve.as_ts.iloc[:] = 0.0
+        pd.testing.assert_frame_equal(
+            self.panel.as_pd_frame_for_frequency(), cached_frame
+        )
+
+    def test_weighted_members_match_weighted_single_calculators(self):
+        """
+        Panel members weight as the single instrument calculators do
+        """
+        weight = pd.Series(np.linspace(0.5, 1.5, 20), index=self.price.index[::20])
+        for instrument in self.instruments:
+            weighted_curve = self.panel.account_curve(instrument).weight(weight)
+            expected = AccountCurve(
+                self.panel.instrument_calculator(instrument).weight(weight)
+            )
+            np.testing.assert_allclose(weighted_curve.values, expected.values)
+
+        weighted_portfolio = self.panel.portfolio_account_curve().weight(weight)
+        instrument_sum = sum(
+            self.panel.account_curve(instrument).weight(weight).values
+            for instrument in self.instruments
+        )
+        np.testing.assert_allclose(weighted_portfolio.values, instrument_sum)
+
+
+class TestBulkWeighting(unittest.TestCase):
+    """
+    Test bulk weighting against one weighted calculator per candidate
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2020-01-01", periods=500, freq="B")
+        self.price = pd.Series(np.cumsum(rng.normal(0, 1, 500)) + 100, index=index)
+        self.vol = robust_daily_vol_given_price(self.price)
+        self.average_position = get_average_notional_position(self.vol)
+        self.positions = self.average_position * rng.normal(0, 1, 500)
+        self.positions.iloc[:10] = np.nan
+        self.fx = pd.Series(rng.uniform(0.9, 1.1, 500), index=index)
+        self.pandl_calculator = self.build_pandl_calculator(
+            self.positions, delayfill=False
+        )
+        weight_index = index[::20]
+        self.weights = pd.DataFrame(
+            rng.uniform(0.0, 2.0, (len(weight_index), 3)),
+            index=weight_index,
+            columns=["low", "mid", "high"],
+        )
+
+    def build_pandl_calculator(self, positions: pd.Series, delayfill: bool):
+        return ProfitAndLossWithSharpeRatioCosts(
+            price=self.price,
+            positions=positions,
+            fx=self.fx,
+            capital=100000,
+            value_per_point=2.0,
+            roundpositions=False,
+            delayfill=delayfill,
+            passed_diagnostic_df=arg_not_supplied,
+            SR_cost=0.01,
+            average_position=self.average_position,
+            daily_returns_volatility=self.vol,
+        )
+
+    def test_delayfill_weights_positions_held(self):
+        """
+        With delayfill the delayed positions are weighted, and not delayed
+        again as weight() would
+        """
+        delayed_calculator = self.build_pandl_calculator(self.positions, delayfill=True)
+        held_calculator = self.build_pandl_calculator(
+            delayed_calculator.positions, delayfill=False
+        )
+        bulk_stats = AccountCurve(delayed_calculator).bulk_weighting_stats(self.weights)
+        for candidate in self.weights.columns:
+            weighted_curve = AccountCurve(held_calculator).weight(
+                self.weights[candidate]
+            )
+            np.testing.assert_allclose(
+                bulk_stats.loc[candidate, ["ann_mean", "ann_std", "sharpe"]],
+                [
+                    weighted_curve.ann_mean(),
+                    weighted_curve.ann_std(),
+                    weighted_curve.sharpe(),
+                ],
+            )
+
+    def test_bulk_stats_match_weighted_curves(self):
+        """
+        Each candidate matches the account curve of a weighted calculator
+        """
+        for curve_type in curve_types:
+            for is_percentage in [False, True]:
+                account_curve = AccountCurve(
+                    self.pandl_calculator,
+                    curve_type=curve_type,
+                    is_percentage=is_percentage,
+                )
+                bulk_stats = account_curve.bulk_weighting_stats(self.weights)
+                for candidate in self.weights.columns:
+                    weighted_curve = account_curve.weight(self.weights[candidate])
+                    np.testing.assert_allclose(
+                        bulk_stats.loc[candidate, ["ann_mean", "ann_std", "sharpe"]],
+                        [
+                            weighted_curve.ann_mean(),
+                            weighted_curve.ann_std(),
+                            weighted_curve.sharpe(),
+                        ],
+                    )
+
+
+class TestTradeCosts(unittest.TestCase):
+    """
+    Test costs derived from position changes
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2020-01-01", periods=300, freq="B")
+        self.price = pd.Series(np.cumsum(rng.normal(0, 1, 300)) + 100, index=index)
+        self.positions = pd.Series(rng.integers(-5, 5, 300), index=index, dtype=float)
+        self.positions.iloc[:5] = np.nan
+        self.pandl_calculator = self.build_pandl_calculator(delayfill=True)
+
+    def build_pandl_calculator(self, delayfill: bool):
+        return ProfitAndLossWithTradeCosts(
+            price=self.price,
+            positions=self.positions,
+            fx=arg_not_supplied,
+            capital=100000,
+            value_per_point=10.0,
+            roundpositions=False,
+            delayfill=delayfill,
+            passed_diagnostic_df=arg_not_supplied,
+            commission_per_contract=2.0,
+            percentage_fee=0.0005,
+            spread_in_points=0.5,
+        )
+
+    def test_costs_from_trades(self):
+        """
+        Costs in points are commission, fee and half spread per contract traded
+        """
+        positions_held = self.positions.shift(1).ffill().fillna(0.0)
+        trades = positions_held.diff().fillna(positions_held)
+        expected = -trades.abs() * (2.0 / 10.0 + 0.0005 * self.price + 0.25)
+        pd.testing.assert_series_equal(
+            self.pandl_calculator.costs_pandl_in_points(), expected
+        )
+        pd.testing.assert_series_equal(self.pandl_calculator.trades, trades)
+
+    def test_net_is_gross_plus_costs(self):
+        """
+        Costs reduce the net curve
+        """
+        gross = self.pandl_calculator.pandl_in_base_currency()
+        costs = self.pandl_calculator.costs_pandl_in_base_currency()
+        net = self.pandl_calculator.net_pandl_in_base_currency()
+        np.testing.assert_allclose(net, gross + costs)
+        self.assertLess(costs.sum(), 0.0)
+
+    def test_bulk_weighting(self):
+        """
+        Bulk weighting matches a weighted calculator for each candidate
+        """
+        weights = pd.DataFrame(
+            dict(half=0.5, double=2.0), index=self.price.index[[0, 150]]
+        )
+        weights.iloc[1] = [1.0, 1.5]
+        ## weight() delays the weighted positions again, so compare without delay
+        account_curve = AccountCurve(
+            self.build_pandl_calculator(delayfill=False), is_percentage=True
+        )
+        bulk_stats = account_curve.bulk_weighting_stats(weights)
+        for candidate in weights.columns:
+            weighted_curve = account_curve.weight(weights[candidate])
+            self.assertAlmostEqual(
+                bulk_stats.loc[candidate, "sharpe"], weighted_curve.sharpe()
+            )
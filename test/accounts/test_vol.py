@@ -0,0 +1,212 @@
+import gc
+import unittest
+import weakref
+from unittest.mock import patch
+import json
+import numpy as np
+import pandas as pd
+from src.strategies.vol import (
+    robust_vol_calc,
+    mixed_vol_calc,
+    robust_daily_vol_given_price,
+    robust_daily_vol_given_price_panel,
+    mixed_vol_calc_panel,
+)
+from src.strategies.incremental_vol import IncrementalVolEstimator
+from src.strategies.vol_provider import VolatilityProvider
+from src.strategies.trading_rule import EWMACTradingRule
+from src.accounts.profit_and_loss import (
+    ProfitAndLossWithSharpeRatioCosts,
+    get_average_notional_position,
+)
+from src.utils.references import arg_not_supplied
+from src.utils.result_cache import hash_for_cache
+
+
+def build_daily_returns(n_days: int = 1200, seed: int = 42) -> pd.Series:
+    """
+    Daily returns with changing vol, gaps and a run of zeros
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start="2018-01-01", periods=n_days, freq="B")
+    scale = np.exp(np.sin(np.arange(n_days) / 80.0))
+    daily_returns = pd.Series(rng.normal(0, 1, n_days) * scale, index=dates)
+    daily_returns.iloc[0] = np.nan
+    daily_returns.iloc[[40, 41, 600]] = np.nan
+    daily_returns.iloc[300:320] = 0.0
+
+    return daily_returns
+
+
+class TestIncrementalVolEstimator(unittest.TestCase):
+    """
+    Test the streaming vol estimator against robust_vol_calc
+    """
+
+    def setUp(self):
+        self.daily_returns = build_daily_returns()
+
+    def test_matches_batch_calculation(self):
+        """
+        One return at a time gives the batch vol, floor included
+        """
+        for kwargs in [dict(), dict(floor_days=60, floor_min_periods=20)]:
+            expected = robust_vol_calc(self.daily_returns.copy(), **kwargs)
+            estimator = IncrementalVolEstimator(**kwargs)
+            streamed = [estimator.update(value) for value in self.daily_returns]
+            np.testing.assert_allclose(streamed, expected.values, rtol=1e-12)
+
+    def test_snapshot_and_restore(self):
+        """
+        A restored estimator carries on exactly as the original
+        """
+        history = self.daily_returns.iloc[:800]
+        estimator = IncrementalVolEstimator.from_returns(history)
+        restored = IncrementalVolEstimator.from_snapshot(
+            json.loads(json.dumps(estimator.snapshot()))
+        )
+        self.assertEqual(restored.vol, estimator.vol)
+        for value in self.daily_returns.iloc[800:]:
+            self.assertEqual(restored.update(value), estimator.update(value))
+
+
+class TestPanelVol(unittest.TestCase):
+    """
+    Test panel vol functions against one call per instrument
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        dates = pd.date_range(start="2015-01-01", periods=1500, freq="D")
+        self.prices = pd.DataFrame(
+            100 + np.cumsum(rng.normal(0, 1, (1500, 4)), axis=0),
+            index=dates,
+            columns=["A", "B", "C", "D"],
+        )
+        ## instruments starting late, ending early and with gaps
+        self.prices.iloc[:200, 1] = np.nan
+        self.prices.iloc[-100:, 2] = np.nan
+        self.prices.iloc[::13, 3] = np.nan
+
+    def test_matches_single_instrument_vol(self):
+        """
+        Each column matches the single series calculation
+        """
+        for kwargs in [dict(), dict(backfill=True)]:
+            panel_vol = robust_daily_vol_given_price_panel(self.prices, **kwargs)
+            for instrument in self.prices.columns:
+                single_vol = robust_daily_vol_given_price(
+                    self.prices[instrument].dropna(), **kwargs
+                )
+                pd.testing.assert_series_equal(
+                    panel_vol[instrument].reindex(single_vol.index),
+                    single_vol,
+                    check_names=False,
+                    check_freq=False,
+                )
+
+    def test_mixed_vol_matches_single_instrument(self):
+        """
+        Mixed vol columns match the single series calculation from each start
+        """
+        daily_returns = self.prices.resample("1B").last().diff()
+        panel_vol = mixed_vol_calc_panel(daily_returns)
+        for instrument in daily_returns.columns:
+            instrument_returns = daily_returns[instrument]
+            instrument_returns = instrument_returns.loc[
+                instrument_returns.first_valid_index() :
+            ]
+            pd.testing.assert_series_equal(
+                panel_vol[instrument].loc[instrument_returns.index],
+                mixed_vol_calc(instrument_returns.copy()),
+                check_names=False,
+                check_freq=False,
+            )
+
+
+class TestVolatilityProvider(unittest.TestCase):
+    """
+    Test that the forecast, position sizing and costs share one vol
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        dates = pd.date_range(start="2020-01-01", periods=700, freq="D")
+        self.price = pd.Series(100 + np.cumsum(rng.normal(0, 1, 700)), index=dates)
+
+    def test_vol_calculated_once(self):
+        """
+        Rule, sizing and SR costs all draw from a single calculation
+        """
+        vol_provider = VolatilityProvider()
+        with patch(
+            "src.strategies.vol_provider.robust_vol_calc", wraps=robust_vol_calc
+        ) as mock_robust_vol_calc:
+            ewmac_trading_rule = EWMACTradingRule(
+                self.price, fast=16, slow=64, vol_provider=vol_provider
+            )
+            ewmac_trading_rule.calculate_forecast()
+            daily_returns_volatility = vol_provider.robust_daily_vol_given_price(
+                self.price
+            )
+            average_position = get_average_notional_position(daily_returns_volatility)
+            pandl_calculator = ProfitAndLossWithSharpeRatioCosts(
+                price=self.price,
+                positions=average_position,
+                fx=arg_not_supplied,
+                capital=100000,
+                value_per_point=1.0,
+                roundpositions=False,
+                delayfill=True,
+                passed_diagnostic_df=arg_not_supplied,
+                SR_cost=0.01,
+                average_position=average_position,
+                vol_provider=vol_provider,
+            )
+            costs_vol = pandl_calculator.daily_price_volatility_points
+            self.assertEqual(mock_robust_vol_calc.call_count, 1)
+
+        expected_vol = robust_daily_vol_given_price(self.price)
+        pd.testing.assert_series_equal(daily_returns_volatility, expected_vol)
+        pd.testing.assert_series_equal(costs_vol, expected_vol)
+
+        expected_rule = EWMACTradingRule(self.price, fast=16, slow=64)
+        expected_rule.calculate_forecast()
+        pd.testing.assert_series_equal(
+            ewmac_trading_rule.forecast, expected_rule.forecast
+        )
+
+    def test_keyed_on_content_and_parameters(self):
+        """
+        Equal prices share a vol; other parameters get their own
+        """
+        vol_provider = VolatilityProvider()
+        vol_provider.robust_daily_vol_given_price(self.price)
+        with patch(
+            "src.strategies.vol_provider.robust_vol_calc", wraps=robust_vol_calc
+        ) as mock_robust_vol_calc:
+            vol_provider.robust_daily_vol_given_price(self.price.copy())
+            self.assertEqual(mock_robust_vol_calc.call_count, 0)
+            vol_provider.robust_daily_vol_given_price(self.price, days=20)
+            self.assertEqual(mock_robust_vol_calc.call_count, 1)
+
+    def test_prices_not_kept_alive(self):
+        """
+        A provider doesn't hold on to the prices passed in, so one kept for a
+        long run doesn't grow with every fresh price object
+        """
+        vol_provider = VolatilityProvider()
+        price = self.price.copy()
+        price_reference = weakref.ref(price)
+        vol_provider.robust_daily_vol_given_price(price)
+        del price
+        gc.collect()
+        self.assertIsNone(price_reference())
+
+        with patch(
+            "src.strategies.vol_provider.hash_for_cache", wraps=hash_for_cache
+        ) as mock_hash_for_cache:
+            for _ in range(3):
+                vol_provider.robust_daily_vol_given_price(self.price)
+            ## the price once, then each vol key
+            self.assertEqual(mock_hash_for_cache.call_count, 4)
@@ -0,0 +1,130 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.backtesting.sweep import (
+    CostAssumption,
+    ewmac_notional_position,
+    parameter_grid,
+    run_sweep,
+    sweep_combination_statistics,
+)
+from src.strategies.vol_provider import VolatilityProvider
+from src.utils.references import (
+    ARBITRARY_FORECAST_CAPITAL,
+    ARBITRARY_VALUE_OF_PRICE_POINT,
+)
+
+
+class TestParameterSweep(unittest.TestCase):
+    """
+    Test parameter sweeps against running each combination on its own
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(8)
+        dates = pd.bdate_range(start="2014-01-01", periods=1500)
+        self.prices = pd.DataFrame(
+            100 + np.cumsum(rng.normal(0, 1, (1500, 3)), axis=0),
+            index=dates,
+            columns=["ES", "NQ", "CL"],
+        )
+        self.prices.iloc[:250, 2] = np.nan
+        self.combinations = parameter_grid(
+            list(self.prices.columns),
+            speeds=[(8, 32), (16, None)],
+            cost_assumptions=[
+                CostAssumption(),
+                CostAssumption(commission_per_contract=1.0, spread_in_points=0.5),
+            ],
+        )
+
+    def test_matches_single_combinations(self):
+        """
+        Each row matches the combination run on its own, in grid order
+        """
+        progress = []
+        results = run_sweep(
+            self.prices,
+            self.combinations,
+            combinations_per_batch=3,
+            progress=lambda done, total: progress.append((done, total)),
+        )
+        self.assertEqual(len(results), len(self.combinations))
+        self.assertEqual(progress[-1], (12, 12))
+        self.assertEqual(list(results["slow"].iloc[2:4]), [64, 64])
+
+        for position, combination in enumerate(self.combinations):
+            price = self.prices[combination.ticker].dropna()
+            expected = sweep_combination_statistics(
+                price, combination, VolatilityProvider()
+            )
+            for statistic, value in expected.items():
+                self.assertAlmostEqual(
+                    float(results[statistic].iloc[position]), value, places=3
+                )
+
+        ## costs only ever reduce returns
+        by_cost = results.groupby(["ticker", "fast"])["ann_mean"]
+        self.assertTrue((by_cost.first() > by_cost.last()).all())
+
+    def test_worst_drawdown_from_curve_peak(self):
+        """
+        The worst drawdown is measured from the curve's running peak, not from
+        a peak anchored at zero
+        """
+        price = pd.Series(
+            [100.0, 101.0, 99.0, 100.0, 98.0, 102.0],
+            index=pd.bdate_range(start="2020-01-01", periods=6),
+        )
+        statistics = sweep_combination_statistics(
+            price,
+            self.combinations[0],
+            VolatilityProvider(),
+            notional_position=pd.Series(1.0, index=price.index),
+        )
+        ## a constant position of one with no costs
+        returns = (
+            100.0
+            * price.diff()
+            * ARBITRARY_VALUE_OF_PRICE_POINT
+            / ARBITRARY_FORECAST_CAPITAL
+        )
+        curve = returns.fillna(0.0).cumsum()
+        self.assertAlmostEqual(
+            statistics["worst_drawdown"], (curve - curve.cummax()).min()
+        )
+        ## the worst drawdown starts from a peak above zero
+        self.assertLess(statistics["worst_drawdown"], curve.min())
+
+    def test_process_pool_matches_serial(self):
+        """
+        Prices shared with a process pool give the same table, streamed to disk
+        """
+        serial_results = run_sweep(self.prices, self.combinations)
+        with tempfile.TemporaryDirectory() as results_dir:
+            results_path = Path(results_dir) / "sweep.csv"
+            pool_results = run_sweep(
+                self.prices,
+                self.combinations,
+                max_workers=2,
+                combinations_per_batch=2,
+                results_path=results_path,
+            )
+            streamed_results = pd.read_csv(results_path, index_col="combination")
+
+        pd.testing.assert_frame_equal(pool_results, serial_results)
+        self.assertEqual(sorted(streamed_results.index), list(range(12)))
+
+    def test_positions_shared_across_costs(self):
+        """
+        The position for a speed doesn't depend on the cost assumption
+        """
+        price = self.prices["ES"]
+        vol_provider = VolatilityProvider()
+        position = ewmac_notional_position(price, 8, 32, vol_provider)
+        results = run_sweep(self.prices, self.combinations)
+        es_fast = results[(results["ticker"] == "ES") & (results["fast"] == 8)]
+        self.assertEqual(es_fast["turnover"].nunique(), 1)
+        self.assertGreater(position.abs().mean(), 0)
@@ -4,8 +4,19 @@ Unit tests for indicators
 
 import unittest
 from unittest.mock import patch
+import numpy as np
 import pandas as pd
-from src.strategies.indicator import MovingAverage
+from src.strategies.indicator import (
+    MovingAverage,
+    RelativeStrengthIndex,
+    MovingAverageConvergenceDivergence,
+    StochasticOscillator,
+    CommodityChannelIndex,
+    calculate_momentum_indicators,
+    latest_momentum_indicators,
+    load_momentum_config,
+)
+from src.utils.rolling import ewma
 
 
 class TestMovingAverage(unittest.TestCase):
@@ -67,3 +78,151 @@ class TestMovingAverage(unittest.TestCase):
         self.moving_average.calculate()
         self.assertIsInstance(self.moving_average.moving_average, pd.Series)
         self.assertEqual(len(self.moving_average.moving_average), len(self.prices))
+
+
+class TestMomentumIndicators(unittest.TestCase):
+    """
+    Unit tests for the array based momentum indicators, against pandas.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        dates = pd.bdate_range(start="2018-01-01", periods=600)
+        self.close = pd.DataFrame(
+            100 + np.cumsum(rng.normal(0, 1, (600, 4)), axis=0),
+            index=dates,
+            columns=["AAPL", "MSFT", "SPY", "QQQ"],
+        )
+        self.high = self.close + rng.uniform(0, 1, self.close.shape)
+        self.low = self.close - rng.uniform(0, 1, self.close.shape)
+
+    def test_ewma_matches_pandas(self):
+        """Test the exponential mean against pandas, with missing prices."""
+        values = self.close.copy()
+        values.iloc[::7, 1] = np.nan
+        for ewm_kwargs in [
+            dict(span=16),
+            dict(alpha=1 / 14, adjust=False, min_periods=14),
+        ]:
+            np.testing.assert_allclose(
+                ewma(values.to_numpy(), **ewm_kwargs),
+                values.ewm(**ewm_kwargs).mean().to_numpy(),
+                rtol=1e-12,
+            )
+
+    def test_rsi(self):
+        """Test the RSI against Wilder's smoothing in pandas."""
+        price = self.close["AAPL"]
+        rsi = RelativeStrengthIndex(price, period=14)
+        rsi.calculate()
+        price_changes = price.diff()
+        smoothing = dict(alpha=1 / 14, adjust=False, min_periods=14)
+        average_gain = price_changes.clip(lower=0).ewm(**smoothing).mean()
+        average_loss = (-price_changes).clip(lower=0).ewm(**smoothing).mean()
+        pd.testing.assert_series_equal(
+            rsi.rsi, 100 - 100 / (1 + average_gain / average_loss), check_names=False
+        )
+
+    def test_macd(self):
+        """Test the MACD, signal line and histogram against pandas."""
+        price = self.close["MSFT"]
+        macd = MovingAverageConvergenceDivergence(price, 16, 64, 9)
+        macd.calculate()
+        expected_macd = price.ewm(span=16).mean() - price.ewm(span=64).mean()
+        expected_signal = expected_macd.ewm(span=9).mean()
+        pd.testing.assert_series_equal(macd.macd, expected_macd, check_names=False)
+        pd.testing.assert_series_equal(macd.signal, expected_signal, check_names=False)
+        pd.testing.assert_series_equal(
+            macd.histogram, expected_macd - expected_signal, check_names=False
+        )
+
+    def test_stochastic_oscillator(self):
+        """Test %K and %D against pandas rolling highs and lows."""
+        stochastic = StochasticOscillator(
+            self.close, k_period=14, d_period=3, high=self.high, low=self.low
+        )
+        stochastic.calculate()
+        lowest = self.low.rolling(14).min()
+        expected_k = (
+            100 * (self.close - lowest) / (self.high.rolling(14).max() - lowest)
+        )
+        pd.testing.assert_frame_equal(stochastic.k, expected_k)
+        pd.testing.assert_frame_equal(stochastic.d, expected_k.rolling(3).mean())
+
+    def test_late_starting_and_gappy_tickers(self):
+        """Test each ticker warms up from its own first price, as pandas does."""
+        close = self.close.copy()
+        close.iloc[:50, 1] = np.nan
+        close.iloc[200:203, 2] = np.nan
+        high = self.high.where(close.notna())
+        low = self.low.where(close.notna())
+        outputs = calculate_momentum_indicators(close, high=high, low=low)
+
+        lowest = low.rolling(14).min()
+        expected_k = 100 * (close - lowest) / (high.rolling(14).max() - lowest)
+        pd.testing.assert_frame_equal(outputs["stochastic_k"], expected_k)
+        pd.testing.assert_frame_equal(
+            outputs["stochastic_d"], expected_k.rolling(3).mean()
+        )
+        self.assertTrue(outputs["stochastic_k"].iloc[:63, 1].isna().all())
+
+        typical_price = (high + low + close) / 3
+        mean_deviation = typical_price.rolling(20).apply(
+            lambda window: np.abs(window - window.mean()).mean(), raw=True
+        )
+        pd.testing.assert_frame_equal(
+            outputs["cci"],
+            (typical_price - typical_price.rolling(20).mean())
+            / (0.015 * mean_deviation),
+        )
+
+    def test_cci(self):
+        """Test the CCI against a pandas rolling mean deviation."""
+        cci = CommodityChannelIndex(self.close, period=20, high=self.high, low=self.low)
+        cci.calculate()
+        typical_price = (self.high + self.low + self.close) / 3
+        moving_average = typical_price.rolling(20).mean()
+        mean_deviation = typical_price.rolling(20).apply(
+            lambda window: np.abs(window - window.mean()).mean(), raw=True
+        )
+        pd.testing.assert_frame_equal(
+            cci.cci, (typical_price - moving_average) / (0.015 * mean_deviation)
+        )
+
+    def test_insufficient_prices(self):
+        """Test an indicator on too few prices raises an error."""
+        with self.assertRaises(ValueError):
+            CommodityChannelIndex(self.close.iloc[:5], period=20).calculate()
+
+    def test_universe_from_config(self):
+        """Test the configured set for a universe matches ticker by ticker."""
+        config = load_momentum_config()
+        self.assertEqual(
+            config["MovingAverageConvergenceDivergence"]["long_period"], 64
+        )
+        outputs = calculate_momentum_indicators(
+            self.close, high=self.high, low=self.low
+        )
+        self.assertEqual(
+            sorted(outputs),
+            sorted(
+                [
+                    "rsi",
+                    "macd",
+                    "macd_signal",
+                    "macd_histogram",
+                    "stochastic_k",
+                    "stochastic_d",
+                    "cci",
+                ]
+            ),
+        )
+        single_ticker_rsi = RelativeStrengthIndex(self.close["SPY"], period=14)
+        single_ticker_rsi.calculate()
+        pd.testing.assert_series_equal(
+            outputs["rsi"]["SPY"], single_ticker_rsi.rsi, check_names=False
+        )
+
+        screen = latest_momentum_indicators(self.close)
+        self.assertEqual(list(screen.index), list(self.close.columns))
+        self.assertTrue(((screen["rsi"] >= 0) & (screen["rsi"] <= 100)).all())
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+import pandas as pd
+import numpy as np
+from src.accounts import profit_and_loss
+from src.accounts.curve import AccountCurve
+from src.accounts.profit_and_loss import (
+    ProfitAndLossWithSharpeRatioCosts,
+    get_average_notional_position,
+)
+from src.strategies.vol import robust_daily_vol_given_price
+from src.utils.references import arg_not_supplied
+from src.utils.result_cache import ResultCache, hash_for_cache
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Test the content addressed result cache
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.temp_dir.name) / "result_cache"
+        index = pd.date_range(start="2020-01-01", periods=300, freq="B", tz="UTC")
+        self.series = pd.Series(
+            np.random.default_rng(42).normal(0, 1, 300), index=index, name="pandl"
+        )
+        self.series.iloc[3] = np.nan
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        """
+        A stored series comes back unchanged, including timezone and frequency
+        """
+        result_cache = ResultCache(self.cache_dir)
+        key = hash_for_cache("test", self.series)
+        self.assertIsNone(result_cache.get(key))
+        result_cache.put(key, self.series)
+        pd.testing.assert_series_equal(result_cache.get(key), self.series)
+
+    def test_key_changes_with_content(self):
+        """
+        Changing one value gives a different key
+        """
+        changed = self.series.copy()
+        changed.iloc[-1] += 1.0
+        self.assertNotEqual(hash_for_cache(self.series), hash_for_cache(changed))
+
+    def test_least_recently_used_evicted(self):
+        """
+        Once over the size limit the least recently used files go first
+        """
+        result_cache = ResultCache(self.cache_dir)
+        result_cache.put("first", self.series)
+        file_size = result_cache.size_in_bytes()
+
+        result_cache = ResultCache(self.cache_dir, max_size_in_bytes=2 * file_size)
+        result_cache.put("second", self.series)
+        ## make sure "first" is the least recently used, then touch "second"
+        os.utime(self.cache_dir / "first.npz", ns=(0, 0))
+        time.sleep(0.01)
+        result_cache.get("second")
+        result_cache.put("third", self.series)
+
+        self.assertIsNone(result_cache.get("first"))
+        self.assertIsNotNone(result_cache.get("second"))
+        self.assertIsNotNone(result_cache.get("third"))
+
+    def test_corrupt_file_is_a_miss(self):
+        """
+        A partly written file is recalculated rather than raising
+        """
+        result_cache = ResultCache(self.cache_dir)
+        self.cache_dir.mkdir(parents=True)
+        (self.cache_dir / "broken.npz").write_bytes(b"not a zip file")
+        result = result_cache.get_or_calculate("broken", lambda: self.series)
+        pd.testing.assert_series_equal(result, self.series)
+        pd.testing.assert_series_equal(result_cache.get("broken"), self.series)
+
+    def test_account_curve_loads_from_cache(self):
+        """
+        A second calculator with the same inputs loads its curve from disk
+        """
+        rng = np.random.default_rng(42)
+        index = pd.date_range(start="2020-01-01", periods=300, freq="B")
+        price = pd.Series(np.cumsum(rng.normal(0, 1, 300)) + 100, index=index)
+        vol = robust_daily_vol_given_price(price)
+        average_position = get_average_notional_position(vol)
+        positions = average_position * rng.normal(0, 1, 300)
+
+        def build_pandl_calculator(SR_cost: float):
+            return ProfitAndLossWithSharpeRatioCosts(
+                price=price,
+                positions=positions,
+                fx=arg_not_supplied,
+                capital=100000,
+                value_per_point=1.0,
+                roundpositions=False,
+                delayfill=True,
+                passed_diagnostic_df=arg_not_supplied,
+                result_cache=ResultCache(self.cache_dir),
+                SR_cost=SR_cost,
+                average_position=average_position,
+            )
+
+        cold_curve = AccountCurve(build_pandl_calculator(SR_cost=0.01))
+        with patch.object(
+            profit_and_loss, "calculate_pandl", wraps=profit_and_loss.calculate_pandl
+        ) as mock_calculate_pandl:
+            warm_curve = AccountCurve(build_pandl_calculator(SR_cost=0.01))
+            mock_calculate_pandl.assert_not_called()
+            pd.testing.assert_series_equal(warm_curve.as_ts, cold_curve.as_ts)
+
+            ## different parameters are a different result
+            AccountCurve(build_pandl_calculator(SR_cost=0.02))
+            self.assertEqual(mock_calculate_pandl.call_count, 1)